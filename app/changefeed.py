@@ -0,0 +1,130 @@
+# app/changefeed.py
+"""Change sequence over ``inspeksi`` for incremental downstream sync.
+
+SQLite triggers stamp every inserted or updated item line with the next
+value of a per-feed counter (``change_counters``), so ``change_seq`` is
+strictly increasing in commit order regardless of which code path wrote the
+row. A change to a checklist header (e.g. a geofence re-audit) restamps all
+of its lines, since each line carries the header fields in the feed.
+Consumers keep the last ``change_seq`` they saw and ask for rows after it;
+the lookup is a range scan on ``ix_inspeksi_line_change_seq``. Deletes are
+not tracked.
+"""
+from typing import Iterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from . import masterdata, models
+
+FEED = "inspeksi"
+
+
+def install(conn) -> None:
+    """Create the counter row, number existing lines and (re)create the triggers."""
+    line_cols = ", ".join(c.name for c in models.InspeksiLine.__table__.columns
+                          if c.name not in ("id_inspeksi", "change_seq"))
+    # local_day/shift_slot are derived from ts_utc; a calendar restamp is not a change
+    header_cols = ", ".join(c.name for c in models.InspeksiHeader.__table__.columns
+                            if c.name not in ("id_header", "local_day", "shift_slot"))
+    # Existing lines are numbered in id order, after anything already numbered
+    conn.execute(text(
+        "INSERT OR IGNORE INTO change_counters (name, seq) "
+        "VALUES (:name, (SELECT COALESCE(MAX(change_seq), 0) FROM inspeksi_line))"
+    ), {"name": FEED})
+    # Offsetting ids past the counter keeps them unique and in id order
+    conn.execute(text(
+        "UPDATE inspeksi_line SET change_seq = "
+        "(SELECT seq FROM change_counters WHERE name = :name) + id_inspeksi "
+        "WHERE change_seq IS NULL"
+    ), {"name": FEED})
+    conn.execute(text(
+        "UPDATE change_counters SET seq = (SELECT COALESCE(MAX(change_seq), 0) FROM inspeksi_line) WHERE name = :name"
+    ), {"name": FEED})
+    counter = f"(SELECT seq FROM change_counters WHERE name = '{FEED}')"
+    stamp = (
+        f"UPDATE change_counters SET seq = seq + 1 WHERE name = '{FEED}'; "
+        f"UPDATE inspeksi_line SET change_seq = {counter} WHERE id_inspeksi = NEW.id_inspeksi; "
+    )
+    # All lines of the header get fresh, consecutive numbers in id order
+    restamp = (
+        f"UPDATE inspeksi_line SET change_seq = {counter} + ("
+        "SELECT COUNT(*) FROM inspeksi_line L2 "
+        "WHERE L2.id_header = NEW.id_header AND L2.id_inspeksi <= inspeksi_line.id_inspeksi"
+        ") WHERE id_header = NEW.id_header; "
+        "UPDATE change_counters SET seq = seq + "
+        f"(SELECT COUNT(*) FROM inspeksi_line WHERE id_header = NEW.id_header) WHERE name = '{FEED}'; "
+    )
+    for name in ("trg_inspeksi_change_ins", "trg_inspeksi_change_upd", "trg_inspeksi_header_change_upd"):
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+    conn.execute(text(f"CREATE TRIGGER trg_inspeksi_change_ins AFTER INSERT ON inspeksi_line BEGIN {stamp}END"))
+    # Listing the columns keeps the triggers' own change_seq writes from re-firing them
+    conn.execute(text(
+        f"CREATE TRIGGER trg_inspeksi_change_upd AFTER UPDATE OF {line_cols} ON inspeksi_line BEGIN {stamp}END"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER trg_inspeksi_header_change_upd AFTER UPDATE OF {header_cols} ON inspeksi_header "
+        f"BEGIN {restamp}END"
+    ))
+
+
+def fetch(db: Session, after: int, limit: int) -> list[dict]:
+    """Up to ``limit`` changed rows with change_seq > ``after``, denormalized."""
+    Tx, MU = models.InspeksiTx, models.MasterUser
+    rows = (
+        db.query(
+            Tx.change_seq, Tx.id_inspeksi, Tx.ts_utc, Tx.status, Tx.catatan,
+            Tx.latitude, Tx.longitude, Tx.shift, Tx.geo_flag, Tx.geo_distance_m,
+            Tx.item_id, Tx.user_id, MU.nama_lengkap, MU.email,
+        )
+        .outerjoin(MU, MU.id_user == Tx.user_id)
+        .filter(Tx.change_seq > after)
+        .order_by(Tx.change_seq.asc())
+        .limit(limit)
+        .all()
+    )
+    snap = masterdata.get_snapshot()
+    out = []
+    for r in rows:
+        item = snap.items.get(r.item_id)
+        area = snap.areas.get(item.id_area) if item else None
+        lok = snap.lokasi.get(area.id_lokasi) if area else None
+        out.append({
+            "change_seq": r.change_seq,
+            "id_inspeksi": r.id_inspeksi,
+            "ts_utc": r.ts_utc,
+            "status": r.status,
+            "catatan": r.catatan,
+            "latitude": r.latitude,
+            "longitude": r.longitude,
+            "shift": r.shift,
+            "geo_flag": r.geo_flag,
+            "geo_distance_m": r.geo_distance_m,
+            "petugas": {"id_user": r.user_id, "nama_lengkap": r.nama_lengkap, "email": r.email},
+            "item": {"id_item": r.item_id, "nama_item": item.nama_item if item else None},
+            "area": {"id_area": area.id_area, "nama_area": area.nama_area} if area else None,
+            "lokasi": {"id_lokasi": lok.id_lokasi, "nama_lokasi": lok.nama_lokasi} if lok else None,
+        })
+    return out
+
+
+def iter_pages(session_factory, after: int, limit: int, page_size: int = 1000) -> Iterator[tuple[list[dict], Optional[int]]]:
+    """Yield (records, cursor) pages until ``limit`` rows or the end of the feed.
+
+    Each page is read in its own short session, so a long NDJSON catch-up
+    never pins a read transaction (and the WAL/journal) open.
+    """
+    remaining = limit
+    while remaining > 0:
+        db = session_factory()
+        try:
+            page = fetch(db, after, min(page_size, remaining))
+        finally:
+            db.close()
+        if not page:
+            return
+        after = page[-1]["change_seq"]
+        remaining -= len(page)
+        yield page, after
+        if len(page) < page_size:
+            return
@@ -0,0 +1,142 @@
+# app/compression.py
+"""Response compression.
+
+``CompressionMiddleware`` gzip- or brotli-encodes (brotli only if the
+``brotli`` package is installed) compressible responses of at least
+``COMPRESS_MIN_BYTES``, as the client's Accept-Encoding allows. A response
+sent in one piece is compressed whole; a streamed one (NDJSON changefeed,
+Dash worker relays) is compressed chunk by chunk with a flush after each, so
+clients still see every chunk as it is produced.
+
+``/static`` files are not compressed per request: ``precompress`` writes
+``.gz``/``.br`` siblings of the compressible files once (at startup, or as
+a build step with ``python -m app.compression``) and ``CachedStaticFiles``
+serves those variants as they are.
+"""
+import gzip
+import os
+import zlib
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+from .settings import COMPRESS_MIN_BYTES
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5          # per-request; static variants use the maximum
+_COMPRESSIBLE_TYPES = (b"text/", b"application/json", b"application/javascript", b"application/x-ndjson",
+                       b"application/xml", b"image/svg+xml")
+STATIC_SUFFIXES = {".css", ".js", ".json", ".svg", ".html", ".txt", ".map"}
+
+
+def accepted_encodings(scope) -> set[str]:
+    for k, v in scope.get("headers", []):
+        if k == b"accept-encoding":
+            return {p.split(";")[0].strip().lower() for p in v.decode("latin-1").split(",")
+                    if not p.strip().endswith(";q=0")}
+    return set()
+
+
+def choose_encoding(scope):
+    accepted = accepted_encodings(scope)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Encoder:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._c.process(data)
+            return out + (self._c.finish() if final else self._c.flush())
+        return self._c.compress(data) + self._c.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(scope)
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        state = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                names = {k.lower(): v for k, v in message.get("headers", [])}
+                ctype = names.get(b"content-type", b"")
+                if (b"content-encoding" in names or message["status"] in (204, 304)
+                        or not ctype.startswith(_COMPRESSIBLE_TYPES)):
+                    state["passthrough"] = True
+                    return await send(message)
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state.get("passthrough"):
+                return await send(message)
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if "start" in state:
+                start = state.pop("start")
+                if not more and len(body) < self.minimum_size:
+                    state["passthrough"] = True
+                    await send(start)
+                    return await send(message)
+                encoder = state["encoder"] = _Encoder(encoding)
+                headers = [(k, v) for k, v in start.get("headers", []) if k.lower() != b"content-length"]
+                headers += [(b"content-encoding", encoding.encode()), (b"vary", b"Accept-Encoding")]
+                data = encoder.chunk(body, final=not more)
+                if not more:
+                    headers.append((b"content-length", str(len(data)).encode()))
+                await send({**start, "headers": headers})
+                return await send({"type": "http.response.body", "body": data, "more_body": more})
+            await send({"type": "http.response.body", "body": state["encoder"].chunk(body, final=not more),
+                        "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def _write_if_stale(target: Path, source: Path, data_fn) -> bool:
+    if target.exists() and target.stat().st_mtime_ns >= source.stat().st_mtime_ns:
+        return False
+    tmp = target.with_name(target.name + ".tmp")
+    tmp.write_bytes(data_fn())
+    os.replace(tmp, target)
+    return True
+
+
+def precompress(directory: Path) -> int:
+    """Write missing or stale .gz (and .br) variants of compressible files; returns how many."""
+    written = 0
+    for source in Path(directory).rglob("*"):
+        if not source.is_file() or source.suffix not in STATIC_SUFFIXES:
+            continue
+        if source.stat().st_size < COMPRESS_MIN_BYTES:
+            continue
+        written += _write_if_stale(source.with_name(source.name + ".gz"), source,
+                                   lambda: gzip.compress(source.read_bytes(), compresslevel=9, mtime=0))
+        if brotli is not None:
+            written += _write_if_stale(source.with_name(source.name + ".br"), source,
+                                       lambda: brotli.compress(source.read_bytes(), quality=11))
+    return written
+
+
+if __name__ == "__main__":
+    from .http_cache import STATIC_DIR
+
+    print(f"{precompress(STATIC_DIR)} file terkompresi ditulis ke {STATIC_DIR}")
@@ -0,0 +1,161 @@
+# app/coverage.py
+"""Shift coverage: which items nobody inspected during a shift.
+
+Shifts come from the operational calendar in ``shift_calendar`` (by
+default Pagi 07-15, Siang 15-23 and Malam 23-07 WIB). A trigger on
+``inspeksi_line`` records each item's first inspection per shift in
+``shift_coverage`` (primary key ``(shift_key, item_id)``) in the same
+transaction as the insert, so the covered set of a running shift is always
+current. ``report`` turns that set into a coverage bitmap over the master
+items and counts it per area with NumPy; the missing items are the
+bitmap's zeros, an O(items) anti-join however long the history is.
+
+The shift is the header's calendar stamp (``local_day``/``shift_slot``,
+derived from the inspection time), not the label the officer picked, so
+mislabelled or unlabelled submissions still count.
+"""
+from datetime import date, datetime
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from . import masterdata
+from .masterdata import Snapshot
+from .shift_calendar import CALENDAR, Shift
+
+_KEY = "H.local_day || '/' || H.shift_slot"
+
+_TRIGGER = f"""
+CREATE TRIGGER trg_shift_coverage AFTER INSERT ON inspeksi_line BEGIN
+  INSERT INTO shift_coverage (shift_key, item_id, first_ts)
+  SELECT {_KEY}, NEW.item_id, H.ts_utc
+  FROM inspeksi_header H WHERE H.id_header = NEW.id_header AND H.local_day IS NOT NULL
+  ON CONFLICT (shift_key, item_id) DO UPDATE SET first_ts = excluded.first_ts
+  WHERE excluded.first_ts < shift_coverage.first_ts;
+END
+"""
+
+_BACKFILL = f"""
+INSERT INTO shift_coverage (shift_key, item_id, first_ts)
+SELECT {_KEY} AS k, L.item_id, MIN(H.ts_utc)
+FROM inspeksi_line L JOIN inspeksi_header H ON H.id_header = L.id_header
+WHERE H.local_day IS NOT NULL
+GROUP BY k, L.item_id
+"""
+
+
+def install(conn: Connection) -> None:
+    """(Re)create the trigger; fill the table from history if it is empty."""
+    conn.execute(text("DROP TRIGGER IF EXISTS trg_shift_coverage"))
+    conn.execute(text(_TRIGGER))
+    if conn.execute(text("SELECT 1 FROM shift_coverage LIMIT 1")).first() is None:
+        conn.execute(text(_BACKFILL))
+
+
+def shift_at(ts: datetime) -> Shift:
+    """The shift containing an aware datetime."""
+    return CALENDAR.shift_at(ts)
+
+
+def get_shift(day: date, label: str) -> Shift:
+    """Shift ``label`` of operational ``day``; ValueError for an unknown label."""
+    return CALENDAR.get_shift(day, label)
+
+
+class _ItemIndex:
+    """Master items as arrays: sorted ids and the area position of each."""
+
+    def __init__(self, snap: Snapshot):
+        items = sorted(snap.items.values(), key=lambda it: it.id_item)
+        self.items = items
+        self.ids = np.array([it.id_item for it in items], dtype=np.int64)
+        self.area_ids = sorted({it.id_area for it in items})
+        pos = {a: i for i, a in enumerate(self.area_ids)}
+        self.area_pos = np.array([pos[it.id_area] for it in items], dtype=np.intp)
+
+
+_cached: Optional[tuple[Snapshot, _ItemIndex]] = None
+
+
+def _index(snap: Snapshot) -> _ItemIndex:
+    global _cached
+    cached = _cached
+    if cached is not None and cached[0] is snap:
+        return cached[1]
+    index = _ItemIndex(snap)
+    _cached = (snap, index)
+    return index
+
+
+def report(
+    db: Session,
+    shift: Shift,
+    lokasi_ids: Optional[list[int]] = None,
+    area_id: Optional[int] = None,
+    missing_limit: int = 500,
+) -> dict:
+    """Coverage of ``shift`` per area, with the items nobody inspected.
+
+    ``missing_limit`` caps the missing items listed per area; the counts
+    are always complete.
+    """
+    snap = masterdata.get_snapshot()
+    idx = _index(snap)
+    covered_ids = np.array(
+        db.execute(text("SELECT item_id FROM shift_coverage WHERE shift_key = :k"), {"k": shift.key}).scalars().all(),
+        dtype=np.int64,
+    )
+    # Bitmap over the master items; ids of deleted items simply drop out
+    bitmap = np.isin(idx.ids, covered_ids, assume_unique=True)
+
+    n_areas = len(idx.area_ids)
+    totals = np.bincount(idx.area_pos, minlength=n_areas)
+    covered = np.bincount(idx.area_pos, weights=bitmap, minlength=n_areas).astype(np.int64)
+    wanted_lokasi = set(lokasi_ids) if lokasi_ids else None
+
+    areas = []
+    missing_by_area: dict[int, list[int]] = {}
+    for p in np.flatnonzero(~bitmap):
+        missing_by_area.setdefault(int(idx.area_pos[p]), []).append(int(p))
+    for a, id_area in enumerate(idx.area_ids):
+        area = snap.areas.get(id_area)
+        if area is None or (area_id is not None and id_area != area_id):
+            continue
+        if wanted_lokasi is not None and area.id_lokasi not in wanted_lokasi:
+            continue
+        lok = snap.lokasi.get(area.id_lokasi)
+        missing = missing_by_area.get(a, [])
+        areas.append({
+            "id_area": id_area,
+            "nama_area": area.nama_area,
+            "lokasi": {"id_lokasi": lok.id_lokasi, "nama_lokasi": lok.nama_lokasi} if lok else None,
+            "items": int(totals[a]),
+            "covered": int(covered[a]),
+            "missing": int(totals[a] - covered[a]),
+            "missing_items": [
+                {"id_item": idx.items[p].id_item, "nama_item": idx.items[p].nama_item}
+                for p in missing[:missing_limit]
+            ],
+        })
+    areas.sort(key=lambda r: (-r["missing"], r["lokasi"]["nama_lokasi"] if r["lokasi"] else "", r["nama_area"]))
+    n_items = sum(r["items"] for r in areas)
+    n_covered = sum(r["covered"] for r in areas)
+    return {
+        "shift": {
+            "key": shift.key,
+            "day": shift.day,
+            "shift": shift.label,
+            "start_utc": shift.start_utc.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "end_utc": shift.end_utc.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        },
+        "totals": {
+            "items": n_items,
+            "covered": n_covered,
+            "missing": n_items - n_covered,
+            "coverage_pct": round(100.0 * n_covered / n_items, 1) if n_items else None,
+        },
+        "areas": areas,
+    }
@@ -0,0 +1,157 @@
+# app/dash_worker.py
+"""Running the Dash analytics apart from the API.
+
+With ``DASH_MODE=worker`` the Dash app is served by its own uvicorn
+processes (``python -m app.dash_worker``, started by ``run.py``) on
+``DASH_WORKER_URL``, and the API process only relays ``/dashboard`` and
+``/dashapp`` requests to them through ``WorkerForward`` after the usual
+``_DashProxy`` auth check. Dashboard queries then run on the worker's
+threads and database connections, not the API threadpool that serves
+inspection submissions.
+
+``ConcurrencyLimit`` caps the dashboard requests in flight in either mode;
+requests beyond the cap wait up to ``DASH_QUEUE_TIMEOUT_SEC`` and then get a
+503, so analytics load queues on its own budget.
+"""
+import asyncio
+
+import anyio
+import httpx
+
+from . import settings
+
+# Not forwarded: they describe one connection, not the request
+_HOP_BY_HOP = {
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+    b"te", b"trailers", b"transfer-encoding", b"upgrade", b"host",
+}
+
+
+async def _send_plain(send, status: int, body: bytes) -> None:
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body, "more_body": False})
+
+
+class ConcurrencyLimit:
+    """ASGI wrapper allowing at most ``limit`` HTTP requests in ``inner`` at once."""
+
+    def __init__(self, inner, limit: int, queue_timeout: float):
+        self.inner = inner
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._sem = None
+
+    async def __call__(self, scope, receive, send):
+        if scope.get("type") != "http":
+            return await self.inner(scope, receive, send)
+        if self._sem is None:
+            # Created lazily so it binds to the server's event loop
+            self._sem = asyncio.Semaphore(self.limit)
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            return await _send_plain(send, 503, "Dashboard sedang sibuk, coba lagi".encode())
+        try:
+            await self.inner(scope, receive, send)
+        finally:
+            self._sem.release()
+
+
+class WorkerForward:
+    """ASGI app relaying HTTP requests to the Dash worker at ``base_url``.
+
+    ``strip_prefix`` is removed from the request path: the worker serves
+    Dash at its root, as the ``/dashapp`` mount does in-process. Responses
+    are streamed back chunk by chunk, never held whole in this process.
+    """
+
+    def __init__(self, base_url: str, strip_prefix: str = "", timeout: float = 60.0):
+        self.base_url = base_url.rstrip("/")
+        self.strip_prefix = strip_prefix.rstrip("/")
+        self.timeout = timeout
+        self._client = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=self.timeout,
+                limits=httpx.Limits(max_connections=settings.DASH_MAX_CONCURRENCY),
+            )
+        return self._client
+
+    async def __call__(self, scope, receive, send):
+        if scope.get("type") != "http":
+            return
+        path = scope["path"]
+        if self.strip_prefix and path.startswith(self.strip_prefix):
+            path = path[len(self.strip_prefix):] or "/"
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        headers = [(k, v) for k, v in scope.get("headers", []) if k.lower() not in _HOP_BY_HOP]
+        peer = scope.get("client")
+        if peer:
+            headers.append((b"x-forwarded-for", peer[0].encode()))
+        headers.append((b"x-forwarded-proto", scope.get("scheme", "http").encode()))
+        client = self._http()
+        request = client.build_request(
+            scope["method"], path, params=scope.get("query_string", b"").decode("latin-1") or None,
+            headers=headers, content=bytes(body),
+        )
+        try:
+            resp = await client.send(request, stream=True)
+        except httpx.HTTPError:
+            return await _send_plain(send, 502, "Dashboard worker tidak tersedia".encode())
+        try:
+            # Raw bytes as the worker sent them, so its length and encoding
+            # headers stay valid; chunks go out as they arrive
+            out_headers = [(k, v) for k, v in resp.headers.raw if k.lower() not in _HOP_BY_HOP]
+            await send({"type": "http.response.start", "status": resp.status_code, "headers": out_headers})
+            async for chunk in resp.aiter_raw():
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await resp.aclose()
+
+
+def create_app():
+    """ASGI app of one worker process: the Dash server, no API routes."""
+    from fastapi.middleware.wsgi import WSGIMiddleware
+    from .main import dash_app
+
+    inner = WSGIMiddleware(dash_app.server)
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            # Size this process's threadpool to its concurrency budget
+            anyio.to_thread.current_default_thread_limiter().total_tokens = settings.DASH_MAX_CONCURRENCY
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        await inner(scope, receive, send)
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    url = httpx.URL(settings.DASH_WORKER_URL)
+    uvicorn.run(
+        "app.dash_worker:create_app", factory=True,
+        host=url.host, port=url.port or 80, workers=settings.DASH_WORKERS,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,32 @@
 # app/database.py
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent  # -> project root (…/BIB)
-DB_PATH = BASE_DIR / "inspeksi.db"
+# INSPEKSI_DB_PATH points the app at another database file (the tests and
+# tests/bench_ingest.py use a copy)
+DB_PATH = Path(os.getenv("INSPEKSI_DB_PATH", BASE_DIR / "inspeksi.db"))
 
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
+# Every threadpool worker (40 by default) may hold a request session while the
+# ingest writer and a masterdata reload each need one more; a smaller pool
+# deadlocks under load until the checkout timeout
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "45"))
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, pool_size=DB_POOL_SIZE
 )
+
+
+@event.listens_for(engine, "connect")
+def _sqlite_wal(dbapi_conn, _record):
+    # WAL: a reader's open transaction (the dashboard's read snapshots) no
+    # longer blocks the ingest writer's COMMIT, and vice versa
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
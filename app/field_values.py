@@ -0,0 +1,96 @@
+# app/field_values.py
+"""Distinct (terminal, field, value) index behind /api/terminals/{id}/options.
+
+Values are upserted whenever a legacy inspection is written, so reading the
+options for a field is a primary-key range scan (with optional prefix for
+type-ahead) rather than deserializing thousands of ``Inspection.data`` blobs.
+"""
+from datetime import datetime, timezone
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from . import models
+
+MAX_VALUE_LEN = 255  # longer values are free text, not selectable options
+
+_UPSERT = text(
+    """
+    INSERT INTO field_values (terminal_id, field_name, value, last_seen)
+    VALUES (:terminal_id, :field_name, :value, :last_seen)
+    ON CONFLICT (terminal_id, field_name, value) DO UPDATE SET last_seen = excluded.last_seen
+    """
+)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def extract_fields(data: Any) -> dict:
+    """The field map of an Inspection.data blob ({"row": ...} or {"fields": ...})."""
+    if not isinstance(data, dict):
+        return {}
+    row = data.get("row")
+    if isinstance(row, dict):
+        return row
+    fields = data.get("fields")
+    return fields if isinstance(fields, dict) else {}
+
+
+def _pairs(fields: dict) -> Iterable[tuple[str, str]]:
+    for name, val in fields.items():
+        if val is None or isinstance(val, (dict, list)):
+            continue
+        sval = str(val)
+        if sval and len(sval) <= MAX_VALUE_LEN:
+            yield str(name), sval
+
+
+def record(conn: Connection, terminal_id: int, rows: Iterable[dict], seen_at: Optional[str] = None) -> None:
+    """Upsert every scalar field value of ``rows`` in the caller's transaction."""
+    seen_at = seen_at or _now_iso()
+    params = {}
+    for fields in rows:
+        for name, sval in _pairs(fields):
+            params[(name, sval)] = {"terminal_id": terminal_id, "field_name": name, "value": sval, "last_seen": seen_at}
+    if params:
+        conn.execute(_UPSERT, list(params.values()))
+
+
+def lookup(db: Session, terminal_id: int, field: str, prefix: Optional[str], limit: int) -> list[str]:
+    """Up to ``limit`` values, most recently seen first or by value when prefix-searching."""
+    q = db.query(models.FieldValue.value).filter(
+        models.FieldValue.terminal_id == terminal_id,
+        models.FieldValue.field_name == field,
+    )
+    if prefix:
+        # Half-open range on the primary key: [prefix, prefix + max code point)
+        q = q.filter(models.FieldValue.value >= prefix, models.FieldValue.value < prefix + "\U0010ffff")
+        q = q.order_by(models.FieldValue.value.asc())
+    else:
+        q = q.order_by(models.FieldValue.last_seen.desc(), models.FieldValue.value.asc())
+    return [v for (v,) in q.limit(limit).all()]
+
+
+def backfill(db: Session, batch_size: int = 2000) -> int:
+    """One-time build from existing legacy inspections when the table is empty."""
+    if db.query(models.FieldValue).first() is not None:
+        return 0
+    seen_at = _now_iso()
+    count = 0
+    pending: dict[int, list] = {}
+    q = db.query(models.Inspection.terminal_id, models.Inspection.data).yield_per(batch_size)
+    for terminal_id, data in q:
+        pending.setdefault(terminal_id, []).append(extract_fields(data))
+        count += 1
+        if count % batch_size == 0:
+            for tid, rows in pending.items():
+                record(db, tid, rows, seen_at)
+            pending.clear()
+    for tid, rows in pending.items():
+        record(db, tid, rows, seen_at)
+    db.commit()
+    return count
@@ -0,0 +1,133 @@
+# app/form_validation.py
+"""Validate/coerce inspection payloads against ``Terminal.form_schema``.
+
+A schema is compiled once into a tuple of per-field checkers (coercer,
+required flag, allowed options as a frozenset) and cached against the
+master-data snapshot it came from. Editing a terminal or importing a new
+schema bumps the master-data version, which yields a new snapshot and so a
+fresh compile on the next submission.
+"""
+from typing import Any, Callable, NamedTuple, Optional
+
+from .masterdata import Snapshot
+
+# Rendered by the form as DB-backed dropdowns regardless of schema options
+DB_BACKED_FIELDS = frozenset({"Lokasi", "ID_Lokasi", "Area", "Item_Cek_ID"})
+
+_TRUE = frozenset({"1", "true", "yes", "on", "ya"})
+_FALSE = frozenset({"0", "false", "no", "off", "tidak", ""})
+
+
+class _Invalid(ValueError):
+    pass
+
+
+def _to_text(v: Any) -> str:
+    if isinstance(v, (dict, list)):
+        raise _Invalid("harus berupa teks")
+    return str(v)
+
+
+def _to_number(v: Any):
+    if isinstance(v, bool):
+        raise _Invalid("harus berupa angka")
+    if isinstance(v, (int, float)):
+        return v
+    s = str(v).strip().replace(",", ".")
+    try:
+        return int(s) if s.lstrip("+-").isdigit() else float(s)
+    except ValueError:
+        raise _Invalid("harus berupa angka") from None
+
+
+def _to_bool(v: Any) -> bool:
+    if isinstance(v, bool):
+        return v
+    s = str(v).strip().lower()
+    if s in _TRUE:
+        return True
+    if s in _FALSE:
+        return False
+    raise _Invalid("harus berupa ya/tidak")
+
+
+_COERCERS: dict[str, Callable[[Any], Any]] = {"number": _to_number, "checkbox": _to_bool}
+
+
+class _Field(NamedTuple):
+    name: str
+    required: bool
+    coerce: Callable[[Any], Any]
+    options: Optional[frozenset]
+
+
+def _option_value(opt: Any) -> str:
+    if isinstance(opt, dict):
+        return str(opt.get("value", opt.get("id", opt)))
+    return str(opt)
+
+
+def normalize_schema(schema: Any) -> list[dict]:
+    """Same accepted shapes as normalizeSchema() in static/app.js."""
+    if not schema:
+        return []
+    if isinstance(schema, list):
+        return [f for f in schema if isinstance(f, dict)]
+    if isinstance(schema, dict):
+        if isinstance(schema.get("fields"), list):
+            return [f for f in schema["fields"] if isinstance(f, dict)]
+        return [{"name": k, "type": v or "text"} for k, v in schema.items()]
+    return []
+
+
+class FormValidator:
+    def __init__(self, schema: Any):
+        fields = []
+        for f in normalize_schema(schema):
+            name = f.get("name")
+            if not name:
+                continue
+            ftype = str(f.get("type") or "text").lower()
+            options = None
+            if ftype == "select" and name not in DB_BACKED_FIELDS and isinstance(f.get("options"), list) and f["options"]:
+                options = frozenset(_option_value(o) for o in f["options"])
+            fields.append(_Field(str(name), bool(f.get("required")), _COERCERS.get(ftype, _to_text), options))
+        self.fields: tuple[_Field, ...] = tuple(fields)
+
+    def __call__(self, data: dict) -> tuple[dict, list[str]]:
+        """Return (coerced copy of data, error messages). Unknown keys pass through."""
+        out = dict(data)
+        errors = []
+        for f in self.fields:
+            raw = data.get(f.name)
+            if raw is None or (isinstance(raw, str) and not raw.strip()):
+                if f.required:
+                    errors.append(f"{f.name}: wajib diisi")
+                elif f.coerce is not _to_text and f.name in out:
+                    out[f.name] = None
+                continue
+            try:
+                val = f.coerce(raw)
+            except _Invalid as e:
+                errors.append(f"{f.name}: {e}")
+                continue
+            if f.options is not None and str(val) not in f.options:
+                errors.append(f"{f.name}: pilihan tidak valid")
+                continue
+            out[f.name] = val
+        return out, errors
+
+
+_cache: dict[int, tuple[Snapshot, FormValidator]] = {}
+
+
+def get_validator(snap: Snapshot, terminal_id: int) -> Optional[FormValidator]:
+    term = snap.terminals.get(terminal_id)
+    if term is None:
+        return None
+    cached = _cache.get(terminal_id)
+    if cached is not None and cached[0] is snap:
+        return cached[1]
+    validator = FormValidator(term.form_schema)
+    _cache[terminal_id] = (snap, validator)
+    return validator
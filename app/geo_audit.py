@@ -0,0 +1,146 @@
+# app/geo_audit.py
+"""Batch geofence audit over historical inspections.
+
+Checklist headers (one per submission, see ``inspeksi_store``) are streamed
+in primary-key order, distances are computed per chunk with NumPy against
+the current geofence index, and the resulting ``geo_flag`` /
+``geo_distance_m`` pairs are written back with one executemany per chunk.
+Each chunk is one job for the ingest writer, so it queues between live
+submissions instead of competing with them for the write lock. Run it from
+the admin API or as ``python -m app.geo_audit [--recheck]``.
+"""
+import time
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from . import geofence, ingest, masterdata, models
+
+GEO_INSIDE = "inside"
+GEO_OUTSIDE = "outside"
+GEO_NO_COORDS = "no_coords"
+GEO_NO_FENCE = "no_fence"
+GEO_FLAGS = (GEO_INSIDE, GEO_OUTSIDE, GEO_NO_COORDS, GEO_NO_FENCE)
+GEO_UNCHECKED = "unchecked"  # filter value for rows the audit has not reached
+
+CHUNK_SIZE = ingest.MAX_GROUP_ROWS  # rows per writer job
+
+_SELECT = (
+    "SELECT id_header, COALESCE(lokasi_id, 0), latitude, longitude "
+    "FROM inspeksi_header "
+    "WHERE id_header > :after {unchecked}"
+    "ORDER BY id_header LIMIT :limit"
+)
+
+# Positional driver-level SQL: skips per-row bind processing on the bulk write.
+# Unchanged headers are skipped so a recheck does not bump their lines' change_seq.
+_UPDATE = (
+    "UPDATE inspeksi_header SET geo_flag = ?1, geo_distance_m = ?2 "
+    "WHERE id_header = ?3 AND (geo_flag IS NOT ?1 OR geo_distance_m IS NOT ?2)"
+)
+
+
+def classify(index: geofence.GeofenceIndex, lokasi_ids: np.ndarray, lats: np.ndarray, lons: np.ndarray):
+    """(flags, distances) for parallel arrays of lokasi id and coordinates.
+
+    Distances are to the centre for circles and to the boundary for
+    polygons (0 inside), NaN where no check was possible.
+    """
+    n = lokasi_ids.size
+    flags = np.full(n, GEO_NO_FENCE, dtype=object)
+    dist = np.full(n, np.nan, dtype=np.float64)
+
+    max_id = int(lokasi_ids.max()) if n else 0
+    pos_of = np.full(max(max_id, max(index.pos, default=0)) + 1, -1, dtype=np.intp)
+    for lid, i in index.pos.items():
+        pos_of[lid] = i
+    pos = pos_of[lokasi_ids]
+
+    has_xy = ~(np.isnan(lats) | np.isnan(lons))
+    has_xy &= (np.abs(lats) <= 90.0) & (np.abs(lons) <= 180.0)
+    fenced = pos >= 0
+    flags[fenced & ~has_xy] = GEO_NO_COORDS
+
+    todo = fenced & has_xy
+    is_poly = np.zeros(n, dtype=bool)
+    for i, poly in index.polys.items():
+        sel = np.flatnonzero(todo & (pos == i))
+        if sel.size:
+            is_poly[sel] = True
+            dist[sel] = poly.distances_m(lats[sel], lons[sel])
+    circ = np.flatnonzero(todo & ~is_poly)
+    if circ.size:
+        p = pos[circ]
+        dist[circ] = geofence.haversine_m(index.lats[p], index.lons[p], lats[circ], lons[circ])
+
+    inside = np.zeros(n, dtype=bool)
+    inside[circ] = dist[circ] <= index.radii[pos[circ]]
+    inside[is_poly] = dist[is_poly] == 0.0
+    flags[todo] = np.where(inside[todo], GEO_INSIDE, GEO_OUTSIDE)
+    return flags, dist
+
+
+def filter_query(q, geo: str | None):
+    """Restrict an InspeksiTx query to one geofence flag; ValueError if unknown."""
+    if not geo:
+        return q
+    if geo == GEO_UNCHECKED:
+        return q.filter(models.InspeksiTx.geo_flag.is_(None))
+    if geo not in GEO_FLAGS:
+        raise ValueError(geo)
+    return q.filter(models.InspeksiTx.geo_flag == geo)
+
+
+def run(db: Session, recheck: bool = False, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Audit unflagged headers (or all with ``recheck``), one writer job per chunk.
+
+    Counts are per checklist header, not per item line.
+    """
+    started = time.monotonic()
+    index = geofence.get_index(masterdata.get_snapshot())
+    select = text(_SELECT.format(unchecked="" if recheck else "AND geo_flag IS NULL "))
+    counts = dict.fromkeys(GEO_FLAGS, 0)
+    after = 0
+    while True:
+        rows = db.execute(select, {"after": after, "limit": chunk_size}).fetchall()
+        if not rows:
+            break
+        ids, lok, lat, lon = zip(*rows)
+        flags, dist = classify(
+            index,
+            np.asarray(lok, dtype=np.intp),
+            np.asarray(lat, dtype=np.float64),
+            np.asarray(lon, dtype=np.float64),
+        )
+        dist_out = np.round(dist, 2).astype(object)
+        dist_out[np.isnan(dist)] = None
+        params = list(zip(flags.tolist(), dist_out.tolist(), ids))
+        ingest.get_writer().run(lambda conn: conn.exec_driver_sql(_UPDATE, params), len(params))
+        for flag, c in zip(*np.unique(flags.astype(str), return_counts=True)):
+            counts[str(flag)] += int(c)
+        after = ids[-1]
+        if len(rows) < chunk_size:
+            break
+    return {
+        "checked": sum(counts.values()),
+        "flags": counts,
+        "elapsed_s": round(time.monotonic() - started, 3),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Audit inspeksi coordinates against lokasi geofences")
+    parser.add_argument("--recheck", action="store_true", help="re-audit checklists that already have a flag")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+    session = SessionLocal()
+    try:
+        print(json.dumps(run(session, recheck=args.recheck, chunk_size=args.chunk_size)))
+    finally:
+        session.close()
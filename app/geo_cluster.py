@@ -0,0 +1,108 @@
+# app/geo_cluster.py
+"""Server-side grid clustering of inspeksi coordinates for the dashboard map.
+
+Matching rows are grouped in SQL into square lat/lon cells whose size
+follows the map zoom (roughly ``GRID_CELLS`` cells across the visible
+width); only the per-cell sums come back, and NumPy ranks them. The map
+reflects every inspection in range while neither the fetch nor the
+callback payload (at most ``MAX_CELLS`` cells) grows with the row count.
+"""
+import math
+from typing import NamedTuple, Optional
+
+import numpy as np
+from sqlalchemy import Integer, case, cast, func
+from sqlalchemy.orm import Query
+
+from . import models
+
+GRID_CELLS = 48       # cells across the visible map width
+MAX_CELLS = 2000      # hard cap on returned cells (largest first)
+MIN_CELL_DEG = 1e-5   # ~1 m
+MAX_SCALE = 2.0 ** 16
+
+
+class Cell(NamedTuple):
+    lat: float   # mean position of the points in the cell
+    lon: float
+    count: int
+    rusak: int
+
+
+class Clusters(NamedTuple):
+    cell_deg: float
+    cells: list[Cell]
+    center: Optional[tuple[float, float]]  # (lat, lon) of the data extent
+    scale: float                            # projection scale fitting the extent
+
+
+def cell_size_deg(scale: float) -> float:
+    """Cell edge for a geo projection scale, snapped to a power of two so
+    refreshes at the same zoom reuse the same grid."""
+    raw = 360.0 / (GRID_CELLS * max(scale, 1.0))
+    return max(2.0 ** math.floor(math.log2(raw)), MIN_CELL_DEG)
+
+
+def fit_scale(extent_deg: float) -> float:
+    return min(max(360.0 / (max(extent_deg, 1e-4) * 1.5), 1.0), MAX_SCALE)
+
+
+def _extent_deg(lat0: float, lat1: float, lon0: float, lon1: float) -> float:
+    return max(lat1 - lat0, (lon1 - lon0) * math.cos(math.radians((lat0 + lat1) / 2.0)))
+
+
+def _cell_index(col, origin: float, cell: float):
+    # col + origin >= 0 for valid coordinates, so the cast truncates like floor
+    return cast((col + origin) / cell, Integer)
+
+
+def _top(agg: np.ndarray) -> list[Cell]:
+    """Cells from (count, sum lat, sum lon, sum rusak) rows, largest first, at most MAX_CELLS."""
+    counts = agg[:, 0]
+    top = np.arange(counts.size)
+    if counts.size > MAX_CELLS:
+        top = np.argpartition(-counts, MAX_CELLS - 1)[:MAX_CELLS]
+    top = top[np.argsort(-counts[top], kind="stable")]
+    return [
+        Cell(float(agg[k, 1] / agg[k, 0]), float(agg[k, 2] / agg[k, 0]), int(agg[k, 0]), int(agg[k, 3]))
+        for k in top
+    ]
+
+
+def clusters(q_tx: Query, scale: Optional[float] = None) -> Clusters:
+    """Cluster the rows of a filtered InspeksiTx query.
+
+    ``scale`` is the current ``geo.projection.scale`` of the map; when None
+    the grid is fitted to the extent of the matching points, read first with
+    one MIN/MAX query.
+    """
+    Tx = models.InspeksiTx
+    lat, lon = Tx.latitude, Tx.longitude
+    q = q_tx.filter(lat.between(-90.0, 90.0), lon.between(-180.0, 180.0)).order_by(None)
+    conn = q_tx.session.connection()
+    if scale is None:
+        extent = conn.execute(
+            q.with_entities(func.min(lat), func.max(lat), func.min(lon), func.max(lon)).statement
+        ).one()
+        if extent[0] is None:
+            return Clusters(cell_size_deg(1.0), [], None, 1.0)
+        cell = cell_size_deg(fit_scale(_extent_deg(*extent)))
+    else:
+        cell = cell_size_deg(scale)
+    stmt = (
+        q.with_entities(
+            func.count(),
+            func.sum(lat),
+            func.sum(lon),
+            func.sum(case((Tx.status == "Rusak", 1), else_=0)),
+            func.min(lat), func.max(lat), func.min(lon), func.max(lon),
+        )
+        .group_by(_cell_index(lat, 90.0, cell), _cell_index(lon, 180.0, cell))
+        .statement
+    )
+    agg = np.array(conn.execute(stmt).fetchall(), dtype=np.float64).reshape(-1, 8)
+    if not agg.size:
+        return Clusters(cell, [], None, 1.0)
+    lat0, lat1, lon0, lon1 = agg[:, 4].min(), agg[:, 5].max(), agg[:, 6].min(), agg[:, 7].max()
+    center = (float(lat0 + lat1) / 2.0, float(lon0 + lon1) / 2.0)
+    return Clusters(cell, _top(agg), center, fit_scale(_extent_deg(lat0, lat1, lon0, lon1)))
@@ -0,0 +1,207 @@
+# app/geofence.py
+"""In-memory geofence index over lokasi circles and polygons.
+
+Circular fences (latitude, longitude, radius_m) are held in NumPy arrays;
+polygon fences are prepared once into a bounding box plus edge arrays in a
+local metric projection. Every fence is bucketed into a coarse lat/lon
+grid, so "which geofence contains this point" only evaluates the few fences
+registered in the point's cell. The index is rebuilt lazily whenever the
+master-data snapshot changes.
+"""
+import math
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from .masterdata import LokasiRec, Snapshot
+
+EARTH_RADIUS_M = 6371008.8
+CELL_DEG = 0.01           # ~1.1 km grid cells
+MAX_CELLS_PER_FENCE = 256  # larger circles skip the grid and are always checked
+_M_PER_DEG_LAT = 111320.0
+
+
+def haversine_m(lat, lon, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distance in metres between points in degrees (broadcasting)."""
+    p1 = np.radians(lat)
+    p2 = np.radians(lats)
+    dphi = p2 - p1
+    dlmb = np.radians(lons) - np.radians(lon)
+    a = np.sin(dphi / 2.0) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dlmb / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def has_geofence(lok: LokasiRec) -> bool:
+    if lok.polygon:
+        return True
+    # Must check against None explicitly; 0.0 is a valid coordinate
+    return lok.latitude is not None and lok.longitude is not None and (lok.radius_m or 0) > 0
+
+
+class Match(NamedTuple):
+    lokasi: LokasiRec
+    distance_m: float  # to the centre for circles, to the boundary (0 inside) for polygons
+    inside: bool
+
+
+def _cell(lat: float, lon: float) -> tuple[int, int]:
+    return (math.floor(lat / CELL_DEG), math.floor(lon / CELL_DEG))
+
+
+class PreparedPolygon:
+    """Bounding box and edge list of one polygon, projected to local metres."""
+
+    __slots__ = ("min_lat", "max_lat", "min_lon", "max_lon", "lat0", "lon0", "kx", "ax", "ay", "bx", "by")
+
+    def __init__(self, points: tuple[tuple[float, float], ...]):
+        pts = np.asarray(points, dtype=np.float64)
+        lat, lon = pts[:, 0], pts[:, 1]
+        self.min_lat, self.max_lat = float(lat.min()), float(lat.max())
+        self.min_lon, self.max_lon = float(lon.min()), float(lon.max())
+        self.lat0, self.lon0 = float(lat.mean()), float(lon.mean())
+        self.kx = _M_PER_DEG_LAT * math.cos(math.radians(self.lat0))
+        x = (lon - self.lon0) * self.kx
+        y = (lat - self.lat0) * _M_PER_DEG_LAT
+        # Edge i runs from vertex i to vertex i+1 (ring closed implicitly)
+        self.ax, self.ay = x, y
+        self.bx, self.by = np.roll(x, -1), np.roll(y, -1)
+
+    def _xy(self, lat: float, lon: float) -> tuple[float, float]:
+        return (lon - self.lon0) * self.kx, (lat - self.lat0) * _M_PER_DEG_LAT
+
+    def contains(self, lat: float, lon: float) -> bool:
+        if not (self.min_lat <= lat <= self.max_lat and self.min_lon <= lon <= self.max_lon):
+            return False
+        px, py = self._xy(lat, lon)
+        # Ray casting: count edges crossed by a ray going +x from the point
+        crosses = (self.ay > py) != (self.by > py)
+        dy = np.where(crosses, self.by - self.ay, 1.0)
+        x_at = self.ax + (py - self.ay) * (self.bx - self.ax) / dy
+        return bool(np.count_nonzero(crosses & (px < x_at)) & 1)
+
+    def distance_m(self, lat: float, lon: float) -> float:
+        """0 inside, otherwise the distance to the nearest edge."""
+        if self.contains(lat, lon):
+            return 0.0
+        px, py = self._xy(lat, lon)
+        ex, ey = self.bx - self.ax, self.by - self.ay
+        len2 = np.maximum(ex * ex + ey * ey, 1e-12)
+        t = np.clip(((px - self.ax) * ex + (py - self.ay) * ey) / len2, 0.0, 1.0)
+        dx, dy = self.ax + t * ex - px, self.ay + t * ey - py
+        return float(np.sqrt((dx * dx + dy * dy).min()))
+
+    def distances_m(self, lats: np.ndarray, lons: np.ndarray, block: int = 4096) -> np.ndarray:
+        """Vectorized distance_m for arrays of points, in blocks of points x edges."""
+        out = np.empty(lats.shape, dtype=np.float64)
+        ax, ay, bx, by = self.ax[None, :], self.ay[None, :], self.bx[None, :], self.by[None, :]
+        ex, ey = bx - ax, by - ay
+        len2 = np.maximum(ex * ex + ey * ey, 1e-12)
+        for s in range(0, lats.size, block):
+            px = ((lons[s:s + block] - self.lon0) * self.kx)[:, None]
+            py = ((lats[s:s + block] - self.lat0) * _M_PER_DEG_LAT)[:, None]
+            crosses = (ay > py) != (by > py)
+            x_at = ax + (py - ay) * ex / np.where(crosses, ey, 1.0)
+            inside = (np.count_nonzero(crosses & (px < x_at), axis=1) & 1).astype(bool)
+            t = np.clip(((px - ax) * ex + (py - ay) * ey) / len2, 0.0, 1.0)
+            dx, dy = ax + t * ex - px, ay + t * ey - py
+            d = np.sqrt((dx * dx + dy * dy).min(axis=1))
+            out[s:s + block] = np.where(inside, 0.0, d)
+        return out
+
+
+class GeofenceIndex:
+    def __init__(self, lokasi: tuple[LokasiRec, ...]):
+        fenced = [r for r in lokasi if has_geofence(r)]
+        self.recs: tuple[LokasiRec, ...] = tuple(fenced)
+        self.pos: dict[int, int] = {r.id_lokasi: i for i, r in enumerate(fenced)}
+        self.polys: dict[int, PreparedPolygon] = {i: PreparedPolygon(r.polygon) for i, r in enumerate(fenced) if r.polygon}
+        # Circle arrays are indexed like recs; polygon slots hold NaN and are never read
+        nan = float("nan")
+        self.lats = np.array([nan if r.polygon else r.latitude for r in fenced], dtype=np.float64)
+        self.lons = np.array([nan if r.polygon else r.longitude for r in fenced], dtype=np.float64)
+        self.radii = np.array([nan if r.polygon else r.radius_m for r in fenced], dtype=np.float64)
+
+        grid: dict[tuple[int, int], list[int]] = {}
+        wide: list[int] = []
+        for i, r in enumerate(fenced):
+            poly = self.polys.get(i)
+            if poly is not None:
+                i0, j0 = _cell(poly.min_lat, poly.min_lon)
+                i1, j1 = _cell(poly.max_lat, poly.max_lon)
+            else:
+                dlat = r.radius_m / _M_PER_DEG_LAT
+                dlon = r.radius_m / (_M_PER_DEG_LAT * max(math.cos(math.radians(r.latitude)), 1e-6))
+                i0, j0 = _cell(r.latitude - dlat, r.longitude - dlon)
+                i1, j1 = _cell(r.latitude + dlat, r.longitude + dlon)
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > MAX_CELLS_PER_FENCE:
+                wide.append(i)
+                continue
+            for ci in range(i0, i1 + 1):
+                for cj in range(j0, j1 + 1):
+                    grid.setdefault((ci, cj), []).append(i)
+        self._grid = {k: np.array(v, dtype=np.intp) for k, v in grid.items()}
+        self._wide = np.array(wide, dtype=np.intp)
+
+    def check(self, id_lokasi: int, lat: float, lon: float) -> Optional[tuple[bool, float]]:
+        """(inside, distance_m) for one lokasi, or None if it has no geofence configured."""
+        i = self.pos.get(id_lokasi)
+        if i is None:
+            return None
+        poly = self.polys.get(i)
+        if poly is not None:
+            d = poly.distance_m(lat, lon)
+            return d == 0.0, d
+        d = float(haversine_m(lat, lon, self.lats[i:i + 1], self.lons[i:i + 1])[0])
+        return d <= self.radii[i], d
+
+    def _distances(self, lat: float, lon: float, idx: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        d = np.empty(idx.size, dtype=np.float64)
+        is_poly = np.array([i in self.polys for i in idx], dtype=bool)
+        circ = idx[~is_poly]
+        if circ.size:
+            d[~is_poly] = haversine_m(lat, lon, self.lats[circ], self.lons[circ])
+        for k in np.flatnonzero(is_poly):
+            d[k] = self.polys[idx[k]].distance_m(lat, lon)
+        inside = np.where(is_poly, d == 0.0, d <= self.radii[idx])
+        return d, inside
+
+    def containing(self, lat: float, lon: float) -> list[Match]:
+        cand = self._grid.get(_cell(lat, lon))
+        if self._wide.size:
+            cand = self._wide if cand is None else np.concatenate([cand, self._wide])
+        if cand is None or not cand.size:
+            return []
+        d, hit = self._distances(lat, lon, cand)
+        order = np.argsort(d[hit])
+        idx, dist = cand[hit][order], d[hit][order]
+        return [Match(self.recs[i], float(x), True) for i, x in zip(idx, dist)]
+
+    def nearest(self, lat: float, lon: float, limit: int = 5) -> list[Match]:
+        """Containing geofences first (grid lookup), then the closest others."""
+        found = self.containing(lat, lon)
+        n = len(self.recs)
+        if len(found) >= limit or len(found) == n:
+            return found[:limit]
+        taken = {m.lokasi.id_lokasi for m in found}
+        d, inside = self._distances(lat, lon, np.arange(n))
+        k = min(limit + len(found), n)
+        idx = np.argpartition(d, k - 1)[:k] if k < n else np.arange(n)
+        for i in idx[np.argsort(d[idx])]:
+            if len(found) >= limit:
+                break
+            if self.recs[i].id_lokasi not in taken:
+                found.append(Match(self.recs[i], float(d[i]), bool(inside[i])))
+        return found
+
+
+_cached: Optional[tuple[Snapshot, GeofenceIndex]] = None
+
+
+def get_index(snap: Snapshot) -> GeofenceIndex:
+    global _cached
+    cached = _cached
+    if cached is not None and cached[0] is snap:
+        return cached[1]
+    index = GeofenceIndex(snap.lokasi_sorted)
+    _cached = (snap, index)
+    return index
@@ -0,0 +1,166 @@
+# app/http_cache.py
+"""HTTP caching policy.
+
+- ``/static`` files linked through ``asset_url`` carry their content hash
+  (``?v=``) and are served ``immutable`` for a year; the same file without
+  (or with a stale) ``v`` is revalidated via StaticFiles' ETag and
+  Last-Modified. Fingerprinted Dash/Plotly bundles are upgraded to the same
+  ``immutable`` policy.
+- Rendered HTML pages get an ETag of their body and ``private, no-cache``,
+  so an unchanged page is answered with a 304.
+- Authenticated data (``/api/``, Dash layout and callbacks) stays
+  ``no-store``; anything else without its own header is ``no-cache``.
+
+Responses that set ``Cache-Control`` themselves keep it.
+"""
+import hashlib
+import mimetypes
+import os
+import stat
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import parse_qs
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+
+from .compression import accepted_encodings
+from .settings import BASE_DIR
+
+STATIC_DIR = BASE_DIR / "static"
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+PRIVATE_REVALIDATE = "private, no-cache"
+NO_STORE = "no-store"
+
+
+@lru_cache(maxsize=256)
+def _digest(path: str, mtime_ns: int, size: int) -> str:
+    h = hashlib.blake2b(digest_size=6)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fingerprint(path: str) -> Optional[str]:
+    """Content hash of ``static/<path>``; None if there is no such file."""
+    full = os.path.normpath(STATIC_DIR / path.lstrip("/"))
+    if not full.startswith(str(STATIC_DIR)):
+        return None
+    try:
+        st = os.stat(full)
+    except OSError:
+        return None
+    # Keyed by mtime and size, so an edited file gets a new hash without a restart
+    return _digest(full, st.st_mtime_ns, st.st_size)
+
+
+def asset_url(path: str) -> str:
+    """Fingerprinted URL of a static file (Jinja global ``asset_url``)."""
+    fp = fingerprint(path)
+    path = path.lstrip("/")
+    return f"/static/{path}?v={fp}" if fp else f"/static/{path}"
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with ``immutable`` caching for URLs from ``asset_url``.
+
+    Serves the precompressed ``.br``/``.gz`` sibling of a file (see
+    ``compression.precompress``) when the client accepts it and it is not stale.
+    """
+
+    _VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+
+    async def _encoded(self, path: str, scope):
+        accepted = accepted_encodings(scope)
+        if not accepted or scope["method"] not in ("GET", "HEAD"):
+            return None
+        full, st = await anyio.to_thread.run_sync(self.lookup_path, path)
+        if st is None or not stat.S_ISREG(st.st_mode):
+            return None
+        for encoding, suffix in self._VARIANTS:
+            if encoding not in accepted:
+                continue
+            vfull, vst = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if vst is None or vst.st_mtime_ns < st.st_mtime_ns:
+                continue
+            response = self.file_response(vfull, vst, scope)
+            media_type = mimetypes.guess_type(full)[0] or "application/octet-stream"
+            if media_type.startswith("text/"):
+                media_type += "; charset=utf-8"
+            response.headers["content-type"] = media_type
+            response.headers["content-encoding"] = encoding
+            response.headers["vary"] = "Accept-Encoding"
+            return response
+        return None
+
+    async def get_response(self, path: str, scope):
+        response = await self._encoded(path, scope) or await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            v = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("v", [None])[0]
+            response.headers["Cache-Control"] = IMMUTABLE if v and v == fingerprint(path) else REVALIDATE
+        return response
+
+
+def default_cache_control(path: str) -> str:
+    if path.startswith("/api/") or ("/_dash-" in path and "/_dash-component-suites/" not in path):
+        return NO_STORE
+    return REVALIDATE
+
+
+class CachePolicyMiddleware:
+    """ASGI middleware applying the policy above; only 200 HTML pages are buffered."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+        conditional = scope["method"] == "GET"
+        page = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = [(k, v) for k, v in message.get("headers", [])]
+                names = {k.lower(): v for k, v in headers}
+                cc = names.get(b"cache-control")
+                if cc is not None:
+                    # Dash serves fingerprinted bundles with a bare one-year max-age
+                    if cc == b"max-age=31536000" and "/_dash-component-suites/" in path:
+                        headers = [(k, v) for k, v in headers if k.lower() != b"cache-control"]
+                        headers.append((b"cache-control", IMMUTABLE.encode()))
+                elif (conditional and message["status"] == 200 and b"etag" not in names
+                      and b"text/html" in names.get(b"content-type", b"")
+                      and default_cache_control(path) != NO_STORE):
+                    page["headers"] = headers
+                    page["body"] = []
+                    return
+                else:
+                    headers.append((b"cache-control", default_cache_control(path).encode()))
+                await send({**message, "headers": headers})
+            elif message["type"] == "http.response.body" and "headers" in page:
+                page["body"].append(message.get("body", b""))
+                if message.get("more_body"):
+                    return
+                await self._send_page(scope, send, page["headers"], b"".join(page["body"]))
+            else:
+                await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    async def _send_page(scope, send, headers, body: bytes):
+        etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'.encode()
+        headers = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+        headers += [(b"etag", etag), (b"cache-control", PRIVATE_REVALIDATE.encode())]
+        inm = dict(scope.get("headers", [])).get(b"if-none-match", b"")
+        if etag in [t.strip() for t in inm.split(b",")]:
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body, "more_body": False})
@@ -0,0 +1,197 @@
+# app/ingest.py
+"""Single-writer, group-commit queue for inspection inserts.
+
+Request threads validate their payload, then hand the writer a job: a
+function that performs Core inserts on the writer's connection. One daemon
+thread drains the bounded queue, runs every job that is already waiting (up
+to ``MAX_GROUP_ROWS`` rows, lingering ``GROUP_WAIT_MS`` for more) inside a
+single transaction, and resolves each caller's future with its job's result
+once the group has committed. SQLite then pays one fsync per group instead
+of one per request, and request threads no longer contend for the write
+lock.
+
+If a group fails, it is rolled back and its jobs are replayed one
+transaction each, so only the offending job sees the error.
+
+A caller that waits longer than ``RESULT_TIMEOUT_SEC`` gets ``WriteTimeout``.
+If its job had not started yet, it is cancelled and will never be written
+(``cancelled=True``, answered with 503: safe to retry). If it was already
+running, it still commits or fails on its own (``cancelled=False``,
+answered with 202: the client must not resend it).
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, NamedTuple, Optional
+
+from sqlalchemy import Table
+from sqlalchemy.engine import Connection
+
+from .database import engine
+
+QUEUE_SIZE = 1024       # pending jobs before submit() refuses (back-pressure)
+MAX_GROUP_ROWS = 2000   # rows per group commit
+GROUP_WAIT_MS = 2.0     # how long an open group waits for more jobs
+SUBMIT_TIMEOUT_SEC = 5.0
+RESULT_TIMEOUT_SEC = 30.0
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+class WriteTimeout(RuntimeError):
+    def __init__(self, cancelled: bool):
+        super().__init__("ingest job cancelled" if cancelled else "ingest job still running")
+        self.cancelled = cancelled
+
+
+class _Job(NamedTuple):
+    fn: Callable[[Connection], Any]
+    rows: int
+    future: Future
+
+
+def insert_returning(conn: Connection, table: Table, rows: list[dict]) -> list[int]:
+    """Insert ``rows`` and return their primary keys in parameter order."""
+    if not rows:
+        return []
+    pk = table.primary_key.columns.values()[0]
+    result = conn.execute(table.insert().returning(pk, sort_by_parameter_order=True), rows)
+    return [r[0] for r in result]
+
+
+class IngestWriter:
+    def __init__(self, bind=engine, queue_size: int = QUEUE_SIZE,
+                 max_group_rows: int = MAX_GROUP_ROWS, group_wait_ms: float = GROUP_WAIT_MS):
+        self._bind = bind
+        self._queue: "queue.Queue[Optional[_Job]]" = queue.Queue(maxsize=queue_size)
+        self.max_group_rows = max_group_rows
+        self.group_wait = group_wait_ms / 1000.0
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.groups = 0
+        self.jobs = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Finish every queued job, then stop the thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def submit(self, fn: Callable[[Connection], Any], rows: int = 1) -> Future:
+        """Queue ``fn(conn)`` for the next group; the future holds its return value."""
+        self.start()
+        job = _Job(fn, max(rows, 1), Future())
+        try:
+            self._queue.put(job, timeout=SUBMIT_TIMEOUT_SEC)
+        except queue.Full:
+            raise QueueFull("ingest queue full") from None
+        return job.future
+
+    def run(self, fn: Callable[[Connection], Any], rows: int = 1, timeout: float = RESULT_TIMEOUT_SEC) -> Any:
+        """submit() and wait for the commit; WriteTimeout after ``timeout`` seconds."""
+        future = self.submit(fn, rows)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            # cancel() only succeeds while the job is still queued
+            raise WriteTimeout(cancelled=future.cancel()) from None
+
+    def _collect(self, first: _Job) -> tuple[list[_Job], bool]:
+        group, rows = [first], first.rows
+        deadline = time.monotonic() + self.group_wait
+        while rows < self.max_group_rows:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if job is None:
+                return group, True
+            group.append(job)
+            rows += job.rows
+        return group, False
+
+    def _run(self) -> None:
+        conn = self._bind.connect()
+        try:
+            stopping = False
+            while not stopping:
+                first = self._queue.get()
+                if first is None:
+                    break
+                group, stopping = self._collect(first)
+                self._commit(conn, group)
+            # Drain anything queued behind the stop marker
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None:
+                    self._commit(conn, [job])
+        finally:
+            conn.close()
+
+    def _commit(self, conn: Connection, group: list[_Job]) -> None:
+        group = [j for j in group if j.future.set_running_or_notify_cancel()]
+        if not group:
+            return
+        try:
+            with conn.begin():
+                results = [j.fn(conn) for j in group]
+        except Exception as e:
+            if len(group) == 1:
+                group[0].future.set_exception(e)
+            else:
+                self._commit_each(conn, group)
+            return
+        self.groups += 1
+        self.jobs += len(group)
+        for job, result in zip(group, results):
+            job.future.set_result(result)
+
+    def _commit_each(self, conn: Connection, group: list[_Job]) -> None:
+        for job in group:
+            try:
+                with conn.begin():
+                    result = job.fn(conn)
+            except Exception as e:
+                job.future.set_exception(e)
+            else:
+                self.groups += 1
+                self.jobs += 1
+                job.future.set_result(result)
+
+
+_writer: Optional[IngestWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> IngestWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = IngestWriter()
+    return _writer
+
+
+def shutdown() -> None:
+    if _writer is not None:
+        _writer.stop()
@@ -0,0 +1,166 @@
+# app/inspeksi_store.py
+"""Header/line storage for area checklists.
+
+A checklist submission is stored once in ``inspeksi_header`` (time, officer,
+lokasi/area, shift, coordinates, geofence result) with one narrow
+``inspeksi_line`` per item (item, status code, optional note). Status and
+shift are dictionary-encoded through ``status_dict``/``shift_dict``.
+``inspeksi`` is a view that joins them back into the old row shape, so
+exports and dashboard queries read it unchanged; all writes go through
+``write_checklist``.
+
+``install`` migrates a pre-existing ``inspeksi`` table into the new layout
+(rows sharing time, officer, area, shift and coordinates become one
+header), keeping ``id_inspeksi`` and ``change_seq`` values.
+"""
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from . import models, shift_calendar
+from .ingest import insert_returning
+
+STATUS_SEED = ((1, "Bagus"), (2, "Rusak"))
+SHIFT_SEED = ((1, "Pagi"), (2, "Siang"), (3, "Malam"))
+
+# (table, label) -> code, loaded at install. Codes never change once assigned.
+_codes: dict[tuple[str, str], int] = {}
+
+VIEW_SQL = """
+CREATE VIEW inspeksi AS
+SELECT
+  L.id_inspeksi    AS id_inspeksi,
+  H.ts_utc         AS ts_utc,
+  H.user_id        AS user_id,
+  L.item_id        AS item_id,
+  S.label          AS status,
+  COALESCE(L.catatan, '-') AS catatan,
+  H.latitude       AS latitude,
+  H.longitude      AS longitude,
+  SH.label         AS shift,
+  H.geo_flag       AS geo_flag,
+  H.geo_distance_m AS geo_distance_m,
+  L.change_seq     AS change_seq,
+  L.id_header      AS id_header,
+  H.local_day      AS local_day,
+  H.shift_slot     AS shift_slot
+FROM inspeksi_line L
+JOIN inspeksi_header H ON H.id_header = L.id_header
+JOIN status_dict S ON S.code = L.status_code
+LEFT JOIN shift_dict SH ON SH.code = H.shift_code
+"""
+
+# Legacy latitude/longitude were JSON columns: keep numeric JSON values only
+_NUM = "CASE WHEN json_valid({c}) AND json_type({c}) IN ('real', 'integer') THEN json_extract({c}, '$') END"
+
+
+def _object_type(conn: Connection, name: str) -> Optional[str]:
+    return conn.execute(text("SELECT type FROM sqlite_master WHERE name = :n"), {"n": name}).scalar()
+
+
+def _migrate_legacy(conn: Connection) -> None:
+    conn.execute(text("DROP VIEW IF EXISTS v_inspeksi_export"))
+    conn.execute(text(
+        "INSERT OR IGNORE INTO status_dict (label) SELECT DISTINCT status FROM inspeksi WHERE status IS NOT NULL"
+    ))
+    conn.execute(text(
+        "INSERT OR IGNORE INTO shift_dict (label) SELECT DISTINCT shift FROM inspeksi WHERE shift IS NOT NULL"
+    ))
+    conn.execute(text("DROP TABLE IF EXISTS temp._inspeksi_mig"))
+    # hid numbers the distinct (time, officer, area, shift, coordinates) groups
+    conn.execute(text(
+        f"""
+        CREATE TEMP TABLE _inspeksi_mig AS
+        SELECT M.*, DENSE_RANK() OVER (
+                 ORDER BY ts_utc, user_id, lokasi_id, area_id, shift, lat, lon) AS hid
+        FROM (
+          SELECT X.id_inspeksi, X.ts_utc, X.user_id, X.item_id, X.status,
+                 CASE WHEN TRIM(X.catatan) IN ('-', '') THEN NULL ELSE X.catatan END AS catatan, X.shift,
+                 {_NUM.format(c="X.latitude")} AS lat, {_NUM.format(c="X.longitude")} AS lon,
+                 X.geo_flag, X.geo_distance_m, X.change_seq,
+                 I.id_area AS area_id, A.id_lokasi AS lokasi_id
+          FROM inspeksi X
+          LEFT JOIN item I ON I.id_item = X.item_id
+          LEFT JOIN area A ON A.id_area = I.id_area
+        ) M
+        """
+    ))
+    offset = conn.execute(text("SELECT COALESCE(MAX(id_header), 0) FROM inspeksi_header")).scalar()
+    conn.execute(text(
+        """
+        INSERT INTO inspeksi_header
+          (id_header, ts_utc, user_id, lokasi_id, area_id, shift_code, latitude, longitude, geo_flag, geo_distance_m)
+        SELECT M.hid + :off, M.ts_utc, M.user_id, M.lokasi_id, M.area_id, SH.code, M.lat, M.lon,
+               MAX(M.geo_flag), MAX(M.geo_distance_m)
+        FROM _inspeksi_mig M
+        LEFT JOIN shift_dict SH ON SH.label = M.shift
+        GROUP BY M.hid
+        """
+    ), {"off": offset})
+    conn.execute(text(
+        """
+        INSERT INTO inspeksi_line (id_inspeksi, id_header, item_id, status_code, catatan, change_seq)
+        SELECT M.id_inspeksi, M.hid + :off, M.item_id, S.code, M.catatan, M.change_seq
+        FROM _inspeksi_mig M
+        JOIN status_dict S ON S.label = M.status
+        ORDER BY M.id_inspeksi
+        """
+    ), {"off": offset})
+    conn.execute(text("DROP TABLE temp._inspeksi_mig"))
+    conn.execute(text("DROP TABLE inspeksi"))
+
+
+def install(conn: Connection) -> None:
+    """Seed the dictionaries, migrate a legacy table and (re)create the view."""
+    for code, label in STATUS_SEED:
+        conn.execute(text("INSERT OR IGNORE INTO status_dict (code, label) VALUES (:c, :l)"), {"c": code, "l": label})
+    for code, label in SHIFT_SEED:
+        conn.execute(text("INSERT OR IGNORE INTO shift_dict (code, label) VALUES (:c, :l)"), {"c": code, "l": label})
+    kind = _object_type(conn, "inspeksi")
+    if kind == "table":
+        _migrate_legacy(conn)
+    elif kind == "view":
+        conn.execute(text("DROP VIEW inspeksi"))
+    conn.execute(text(VIEW_SQL))
+    _codes.clear()
+    for table in ("status_dict", "shift_dict"):
+        for code, label in conn.execute(text(f"SELECT code, label FROM {table}")):
+            _codes[(table, label)] = code
+
+
+def _code(conn: Connection, table: str, label: str) -> int:
+    key = (table, label)
+    code = _codes.get(key)
+    if code is not None:
+        return code
+    # Not cached: the row may belong to a group that is later rolled back
+    conn.execute(text(f"INSERT OR IGNORE INTO {table} (label) VALUES (:l)"), {"l": label})
+    return conn.execute(text(f"SELECT code FROM {table} WHERE label = :l"), {"l": label}).scalar()
+
+
+def write_checklist(conn: Connection, header: dict, lines: list[dict]) -> list[int]:
+    """Insert one checklist; returns the id_inspeksi of each line.
+
+    ``header``: ts_utc, user_id, lokasi_id, area_id, shift, latitude,
+    longitude and optionally geo_flag/geo_distance_m; local_day/shift_slot
+    are stamped from ts_utc. ``lines``: item_id,
+    status and optional catatan. A checklist without lines writes nothing.
+    """
+    if not lines:
+        return []
+    row = {k: v for k, v in header.items() if k != "shift"}
+    row["local_day"], row["shift_slot"] = shift_calendar.stamp(header["ts_utc"])
+    shift = header.get("shift")
+    row["shift_code"] = _code(conn, "shift_dict", shift) if shift else None
+    (id_header,) = insert_returning(conn, models.InspeksiHeader.__table__, [row])
+    line_rows = []
+    for ln in lines:
+        note = (ln.get("catatan") or "").strip()
+        line_rows.append({
+            "id_header": id_header,
+            "item_id": ln["item_id"],
+            "status_code": _code(conn, "status_dict", ln["status"]),
+            "catatan": note if note and note != "-" else None,
+        })
+    return insert_returning(conn, models.InspeksiLine.__table__, line_rows)
@@ -0,0 +1,156 @@
+# app/item_status.py
+"""Latest condition per item, kept in ``item_latest_status``.
+
+A trigger on ``inspeksi_line`` upserts the item's row in the same
+transaction as every insert, so the board of current conditions is a read
+of O(items) rows however long the inspection history grows. A line only
+replaces the stored one when it is newer (``ts_utc``, then id), so late
+offline submissions do not overwrite fresher results. ``rusak_since`` is the
+time of the first Rusak in the current unbroken run of Rusak results; a late
+result for an item that is Rusak now recomputes it from that item's history.
+
+Status edits to existing lines are not tracked incrementally; ``rebuild``
+recomputes the table from the full history.
+"""
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from . import masterdata
+
+_IS_RUSAK = "(SELECT lower(label) FROM status_dict WHERE code = {c}) = 'rusak'"
+
+_TRIGGER = f"""
+CREATE TRIGGER trg_item_latest_status AFTER INSERT ON inspeksi_line BEGIN
+  INSERT INTO item_latest_status (item_id, id_inspeksi, status_code, ts_utc, user_id, rusak_since)
+  SELECT NEW.item_id, NEW.id_inspeksi, NEW.status_code, H.ts_utc, H.user_id,
+         CASE WHEN {_IS_RUSAK.format(c="NEW.status_code")} THEN H.ts_utc END
+  FROM inspeksi_header H WHERE H.id_header = NEW.id_header
+  ON CONFLICT (item_id) DO UPDATE SET
+    id_inspeksi = excluded.id_inspeksi,
+    status_code = excluded.status_code,
+    ts_utc = excluded.ts_utc,
+    user_id = excluded.user_id,
+    rusak_since = CASE WHEN excluded.rusak_since IS NULL THEN NULL
+                       ELSE COALESCE(item_latest_status.rusak_since, excluded.rusak_since) END
+  WHERE (excluded.ts_utc, excluded.id_inspeksi) > (item_latest_status.ts_utc, item_latest_status.id_inspeksi);
+  -- A late, older result can move the start of an open Rusak run: recompute
+  -- it from this item's history (rare, and served by ix_inspeksi_line_item)
+  UPDATE item_latest_status SET rusak_since = (
+    SELECT MIN(H.ts_utc) FROM inspeksi_line L JOIN inspeksi_header H ON H.id_header = L.id_header
+    WHERE L.item_id = NEW.item_id AND {_IS_RUSAK.format(c="L.status_code")}
+      AND H.ts_utc > COALESCE((
+        SELECT MAX(H2.ts_utc) FROM inspeksi_line L2 JOIN inspeksi_header H2 ON H2.id_header = L2.id_header
+        WHERE L2.item_id = NEW.item_id AND NOT {_IS_RUSAK.format(c="L2.status_code")}
+      ), '')
+  )
+  WHERE item_id = NEW.item_id AND rusak_since IS NOT NULL AND id_inspeksi <> NEW.id_inspeksi;
+END
+"""
+
+_REBUILD = """
+INSERT INTO item_latest_status (item_id, id_inspeksi, status_code, ts_utc, user_id, rusak_since)
+WITH X AS (
+  SELECT L.item_id, L.id_inspeksi, L.status_code, H.ts_utc, H.user_id,
+         lower(S.label) = 'rusak' AS is_rusak
+  FROM inspeksi_line L
+  JOIN inspeksi_header H ON H.id_header = L.id_header
+  JOIN status_dict S ON S.code = L.status_code
+),
+R AS (
+  SELECT X.*,
+         ROW_NUMBER() OVER (PARTITION BY item_id ORDER BY ts_utc DESC, id_inspeksi DESC) AS rn,
+         MAX(CASE WHEN NOT is_rusak THEN ts_utc END) OVER (PARTITION BY item_id) AS last_ok
+  FROM X
+),
+O AS (
+  SELECT item_id, MIN(ts_utc) AS since FROM R
+  WHERE is_rusak AND ts_utc > COALESCE(last_ok, '')
+  GROUP BY item_id
+)
+SELECT R.item_id, R.id_inspeksi, R.status_code, R.ts_utc, R.user_id,
+       CASE WHEN R.is_rusak THEN O.since END
+FROM R LEFT JOIN O ON O.item_id = R.item_id
+WHERE R.rn = 1
+"""
+
+
+def rebuild(conn: Connection) -> None:
+    conn.execute(text("DELETE FROM item_latest_status"))
+    conn.execute(text(_REBUILD))
+
+
+def install(conn: Connection) -> None:
+    """(Re)create the trigger; fill the table if it is empty."""
+    conn.execute(text("DROP TRIGGER IF EXISTS trg_item_latest_status"))
+    conn.execute(text(_TRIGGER))
+    if conn.execute(text("SELECT 1 FROM item_latest_status LIMIT 1")).first() is None:
+        rebuild(conn)
+
+
+def board(
+    db: Session,
+    lokasi_id: Optional[int] = None,
+    area_id: Optional[int] = None,
+    status: Optional[str] = None,
+) -> list[dict]:
+    """Current condition of every master item, optionally filtered.
+
+    Items never inspected are included with ``status`` None. ``status`` filters
+    case-insensitively; ``"-"`` selects items never inspected. Open Rusak items
+    come first (longest open first), then the rest by lokasi/area/item name.
+    """
+    snap = masterdata.get_snapshot()
+    if area_id is not None:
+        items = snap.items_by_area.get(area_id, ())
+    elif lokasi_id is not None:
+        items = snap.items_by_lokasi.get(lokasi_id, ())
+    else:
+        items = snap.items.values()
+    latest = {
+        r.item_id: r
+        for r in db.execute(text(
+            "SELECT S.item_id, D.label AS status, S.ts_utc, S.rusak_since, S.user_id, MU.nama_lengkap "
+            "FROM item_latest_status S "
+            "JOIN status_dict D ON D.code = S.status_code "
+            "LEFT JOIN master_users MU ON MU.id_user = S.user_id"
+        ))
+    }
+    want = status.strip().lower() if status else None
+    out = []
+    for it in items:
+        r = latest.get(it.id_item)
+        st = r.status if r else None
+        if want is not None and (st or "-").lower() != want:
+            continue
+        area = snap.areas.get(it.id_area)
+        lok = snap.lokasi.get(area.id_lokasi) if area else None
+        out.append({
+            "id_item": it.id_item,
+            "nama_item": it.nama_item,
+            "area": {"id_area": area.id_area, "nama_area": area.nama_area} if area else None,
+            "lokasi": {"id_lokasi": lok.id_lokasi, "nama_lokasi": lok.nama_lokasi} if lok else None,
+            "status": st,
+            "last_ts_utc": r.ts_utc if r else None,
+            "petugas": {"id_user": r.user_id, "nama_lengkap": r.nama_lengkap} if r else None,
+            "rusak_since": r.rusak_since if r else None,
+        })
+    out.sort(key=lambda x: (
+        x["rusak_since"] is None,
+        x["rusak_since"] or "",
+        x["lokasi"]["nama_lokasi"] if x["lokasi"] else "",
+        x["area"]["nama_area"] if x["area"] else "",
+        x["nama_item"],
+    ))
+    return out
+
+
+def counts(rows: list[dict]) -> dict:
+    """Items per current status label; never-inspected items under ``"-"``."""
+    out: dict[str, int] = {}
+    for r in rows:
+        key = r["status"] or "-"
+        out[key] = out.get(key, 0) + 1
+    return out
@@ -5,7 +5,6 @@ from typing import Optional
 
 from fastapi import FastAPI, Request, Depends, Form, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.wsgi import WSGIMiddleware
 from fastapi.responses import HTMLResponse, RedirectResponse
 from jose import jwt
@@ -15,12 +14,19 @@ from starlette.middleware.trustedhost import TrustedHostMiddleware
 from starlette.middleware.httpsredirect import HTTPSRedirectMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
+import hashlib
 import time
-from sqlalchemy import text
+from html import escape as html_escape
+import anyio
+from sqlalchemy import text, Float
 
 from .database import Base, engine, SessionLocal
-from . import models
-from .routers import auth, dashboard, inspections, terminals, admin, lokasi
+from .dash_worker import ConcurrencyLimit, WorkerForward
+from .compression import CompressionMiddleware, precompress
+from .http_cache import CachePolicyMiddleware, CachedStaticFiles, STATIC_DIR, asset_url
+from . import models, masterdata, field_values, geo_audit, geo_cluster, ingest, changefeed, inspeksi_store, item_status, coverage, officer_rollup, series_rollup, shift_calendar, trends
+from .routers import auth, dashboard, inspections, terminals, admin, lokasi, changes, items
+from .routers import coverage as coverage_router
 from .settings import (
     BASE_DIR,
     SECRET_KEY,
@@ -31,6 +37,11 @@ from .settings import (
     ALLOWED_HOSTS,
     COOKIE_SECURE,
     ENABLE_HTTPS_REDIRECT,
+    DASH_MODE,
+    DASH_WORKER_URL,
+    DASH_MAX_CONCURRENCY,
+    DASH_QUEUE_TIMEOUT_SEC,
+    API_THREADS,
 )
 from .deps import get_db, get_current_user, require_dashboard_access, decode_token, _normalize_role  # <- pakai dari deps
 from starlette.requests import Request as StarletteRequest
@@ -46,7 +57,6 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         response.headers.setdefault("X-Frame-Options", "DENY")
         response.headers.setdefault("Referrer-Policy", "no-referrer")
         response.headers.setdefault("Permissions-Policy", "geolocation=(self)")
-        response.headers.setdefault("Cache-Control", "no-store")
         return response
 
 app.add_middleware(
@@ -57,6 +67,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 app.add_middleware(SecurityHeadersMiddleware)
+app.add_middleware(CachePolicyMiddleware)
+app.add_middleware(CompressionMiddleware)
 if ENABLE_HTTPS_REDIRECT:
     app.add_middleware(HTTPSRedirectMiddleware)
 if ALLOWED_HOSTS and ALLOWED_HOSTS != ["*"]:
@@ -104,13 +116,37 @@ app.add_middleware(
     ],
 )
 
-app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
+app.mount("/static", CachedStaticFiles(directory=str(STATIC_DIR)), name="static")
+templates.env.globals["asset_url"] = asset_url
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+@app.on_event("shutdown")
+def on_shutdown():
+    # Commit whatever is still queued for the ingest writer
+    ingest.shutdown()
+
+
+@app.on_event("startup")
+async def size_threadpool():
+    # Sync endpoints (and in-process Dash) run on this pool; Dash is capped
+    # below it by ConcurrencyLimit so the rest stays free for the API
+    anyio.to_thread.current_default_thread_limiter().total_tokens = API_THREADS
+
+
 @app.on_event("startup")
 def on_startup():
-    Base.metadata.create_all(bind=engine)
+    # .gz/.br variants served by CachedStaticFiles; a read-only deploy runs
+    # `python -m app.compression` at build time instead
+    try:
+        precompress(STATIC_DIR)
+    except OSError:
+        pass
+    # inspeksi is a view over inspeksi_header/inspeksi_line (inspeksi_store.install)
+    Base.metadata.create_all(
+        bind=engine,
+        tables=[t for t in Base.metadata.sorted_tables if not t.info.get("is_view")],
+    )
     # Create export view (SQLite); ignore errors if already exists
     with engine.begin() as conn:
         # Try to add require_password_change column if missing
@@ -131,6 +167,58 @@ def on_startup():
             conn.execute(text("ALTER TABLE lokasi ADD COLUMN radius_m INTEGER DEFAULT 200"))
         except Exception:
             pass
+        try:
+            conn.execute(text("ALTER TABLE lokasi ADD COLUMN polygon JSON"))
+        except Exception:
+            pass
+        # Columns a legacy inspeksi table needs before migration (no-op on the view)
+        try:
+            conn.execute(text("ALTER TABLE inspeksi ADD COLUMN geo_flag VARCHAR(16)"))
+        except Exception:
+            pass
+        try:
+            conn.execute(text("ALTER TABLE inspeksi ADD COLUMN geo_distance_m FLOAT"))
+        except Exception:
+            pass
+        try:
+            conn.execute(text("ALTER TABLE inspeksi ADD COLUMN change_seq INTEGER"))
+        except Exception:
+            pass
+        # Calendar stamps on checklist headers (filled by shift_calendar.install)
+        try:
+            conn.execute(text("ALTER TABLE inspeksi_header ADD COLUMN local_day VARCHAR(10)"))
+        except Exception:
+            pass
+        try:
+            conn.execute(text("ALTER TABLE inspeksi_header ADD COLUMN shift_slot VARCHAR(16)"))
+        except Exception:
+            pass
+        for idx in models.InspeksiHeader.__table__.indexes:
+            idx.create(conn, checkfirst=True)
+        # JSON1 generated columns + indexes on legacy inspections.data
+        insp_table = models.Inspection.__table__
+        for col in insp_table.columns:
+            if col.computed is None:
+                continue
+            col_type = "REAL" if isinstance(col.type, Float) else "TEXT"
+            try:
+                conn.execute(text(
+                    f"ALTER TABLE inspections ADD COLUMN {col.name} {col_type} "
+                    f"GENERATED ALWAYS AS ({col.computed.sqltext}) VIRTUAL"
+                ))
+            except Exception:
+                pass
+        for idx in insp_table.indexes:
+            idx.create(conn, checkfirst=True)
+        masterdata.ensure_version_row(conn)
+        inspeksi_store.install(conn)
+        shift_calendar.install(conn)
+        changefeed.install(conn)
+        item_status.install(conn)
+        coverage.install(conn)
+        officer_rollup.install(conn)
+        series_rollup.install(conn)
+        trends.install(conn)
         try:
             conn.execute(text("DROP VIEW IF EXISTS v_inspeksi_export"))
             conn.execute(text(
@@ -157,7 +245,9 @@ def on_startup():
                   COALESCE(X.catatan, '-') AS "CATATAN",
                   REPLACE(CAST(X.latitude  AS TEXT), '.', ',')  AS "LATITUDE",
                   REPLACE(CAST(X.longitude AS TEXT), '.', ',')  AS "LONGITUDE",
-                  X.shift AS "SHIFT"
+                  X.shift AS "SHIFT",
+                  X.geo_flag AS "GEOFENCE",
+                  REPLACE(CAST(X.geo_distance_m AS TEXT), '.', ',') AS "JARAK_M"
                 FROM inspeksi X
                 JOIN master_users MU ON MU.id_user = X.user_id
                 JOIN item I ON I.id_item = X.item_id
@@ -167,6 +257,9 @@ def on_startup():
             ))
         except Exception:
             pass
+    # Start the writer now so it holds its pooled connection before request
+    # threads (each waiting on it with a session open) can take them all
+    ingest.get_writer().start()
     # superuser default
     db = SessionLocal()
     try:
@@ -224,6 +317,9 @@ def on_startup():
             }
             db.add(models.Terminal(name="Terminal 1", form_schema=default_schema))
             db.commit()
+
+        # Build the distinct field-value index once from existing inspections
+        field_values.backfill(db)
     finally:
         db.close()
 
@@ -279,7 +375,11 @@ def logout():
 @app.get("/inspection-form", response_class=HTMLResponse, include_in_schema=False)
 def inspection_form_page(request: Request, current_user: models.User = Depends(get_current_user)):
     # kalau mau public, hapus parameter current_user + Depends
-    return templates.TemplateResponse("inspection_form.html", {"request": request})
+    # The offline queue in app.js is kept per user
+    return templates.TemplateResponse(
+        "inspection_form.html",
+        {"request": request, "user_id": current_user.id, "username": current_user.username},
+    )
 
 @app.get("/password/change", response_class=HTMLResponse, include_in_schema=False)
 def password_change_page(request: Request, current_user: models.User = Depends(get_current_user)):
@@ -330,6 +430,25 @@ app.include_router(terminals.router,   prefix="/api", tags=["terminals"])
 app.include_router(admin.router,       prefix="/api", tags=["admin"])        # API admin
 app.include_router(admin.router_pages,               tags=["admin pages"])   # halaman /admin/import
 app.include_router(lokasi.router,      prefix="/api", tags=["lokasi"])       # lokasi master data
+app.include_router(changes.router,     prefix="/api", tags=["changes"])      # inspeksi changefeed
+app.include_router(items.router,       prefix="/api", tags=["items"])        # current item conditions
+app.include_router(coverage_router.router, prefix="/api", tags=["coverage"])  # shift coverage
+
+@app.exception_handler(ingest.QueueFull)
+def ingest_queue_full_handler(request: Request, exc: ingest.QueueFull):
+    return JSONResponse({"detail": "Server sedang sibuk, coba lagi"}, status_code=503, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(ingest.WriteTimeout)
+def ingest_write_timeout_handler(request: Request, exc: ingest.WriteTimeout):
+    if exc.cancelled:
+        # Never written: resending is safe
+        return JSONResponse({"detail": "Server sedang sibuk, data belum disimpan, coba lagi"},
+                            status_code=503, headers={"Retry-After": "5"})
+    # Still committing: a resend could store it twice
+    return JSONResponse({"status": "processing", "detail": "Data masih diproses, jangan kirim ulang"},
+                        status_code=202)
+
 
 @app.exception_handler(HTTPException)
 def http_exception_handler(request: Request, exc: HTTPException):
@@ -344,9 +463,12 @@ def http_exception_handler(request: Request, exc: HTTPException):
 
 # ---- Dash analytics app mounted under /dashboard ----
 try:
-    from dash import Dash, html, dcc, Input, Output
+    from dash import Dash, html, dcc, dash_table, Input, Output, State, Patch, callback_context
+    from contextlib import contextmanager
+    from dash.exceptions import PreventUpdate
+    from functools import lru_cache
     import plotly.graph_objs as go
-    from sqlalchemy import func
+    from sqlalchemy import func, case
     from datetime import datetime, timedelta, timezone
 
     def _fetch_summary_series(days: int = 30):
@@ -403,219 +525,651 @@ try:
 
     # Fetch lokasi options for filters
     def _lokasi_options():
+        rows = masterdata.get_snapshot().lokasi_sorted
+        return [{"label": f"{r.nama_lokasi} (#{r.id_lokasi})", "value": r.id_lokasi} for r in rows]
+
+    # Mount Dash at an internal subpath; we'll proxy it at /dashboard to inject the site header
+    dash_app = Dash(__name__, requests_pathname_prefix="/dashapp/")
+    from datetime import date
+
+    _GEO_OPTIONS = [
+        {'label': 'Di dalam geofence', 'value': geo_audit.GEO_INSIDE},
+        {'label': 'Di luar geofence', 'value': geo_audit.GEO_OUTSIDE},
+        {'label': 'Tanpa koordinat', 'value': geo_audit.GEO_NO_COORDS},
+        {'label': 'Lokasi tanpa geofence', 'value': geo_audit.GEO_NO_FENCE},
+        {'label': 'Belum diaudit', 'value': geo_audit.GEO_UNCHECKED},
+    ]
+
+    MAP_REFRESH_SEC = 300
+
+    _SERIES_TITLES = {'h': 'Inspeksi per Jam', 'd': 'Inspeksi per Hari', 'w': 'Inspeksi per Minggu', 'm': 'Inspeksi per Bulan'}
+
+    _ITEM_BOARD_COLUMNS = [
+        ('Lokasi', 'lokasi'), ('Area', 'area'), ('Item', 'item'), ('Status', 'status'),
+        ('Rusak sejak', 'rusak_since'), ('Cek terakhir', 'last_ts_utc'), ('Petugas', 'petugas'),
+    ]
+
+    _OFFICER_COLUMNS = [
+        ('Petugas', 'petugas'), ('Shift kerja', 'shifts'), ('Checklist', 'checklists'), ('Item', 'items'),
+        ('Rusak', 'rusak'), ('Item/shift', 'items_per_shift'), ('Rata-rata jeda item (dtk)', 'avg_item_gap_s'),
+        ('Terakhir', 'last_ts'),
+    ]
+
+    _TREND_COLUMNS = [
+        ('Lokasi', 'lokasi'), ('Area', 'area'), ('Item', 'item'), ('Cek 7 hari', 'checks'), ('Rusak 7 hari', 'rusak'),
+        ('Rasio Rusak', 'rate'), ('Perubahan mingguan', 'wow_delta'), ('EWMA', 'ewma'), ('Skor z', 'z'),
+        ('Lonjakan', 'spike'),
+    ]
+
+    def _layout():
+        # Built per page load so the default date range stays current. Lokasi
+        # options come from a callback: nothing here may touch the database,
+        # since Dash evaluates the layout once at import, before migrations run.
+        _today = shift_calendar.CALENDAR.today()
+        _start_default = (_today - timedelta(days=30))
+        controls = html.Div([
+            html.Div([
+                html.Label('Lokasi'),
+                dcc.Dropdown(id='f_lokasi', options=[], multi=True, placeholder='Semua lokasi'),
+            ], style={'minWidth':'240px'}),
+            html.Div([
+                html.Label('Shift'),
+                dcc.Dropdown(id='f_shift', options=[{'label':s, 'value':s} for s in shift_calendar.CALENDAR.labels], multi=False, placeholder='Semua shift'),
+            ], style={'minWidth':'180px'}),
+            html.Div([
+                html.Label('Tanggal'),
+                dcc.DatePickerRange(id='f_range', start_date=_start_default, end_date=_today),
+            ], style={'minWidth':'280px'}),
+            html.Div([
+                html.Label('Geofence'),
+                dcc.Dropdown(id='f_geo', options=_GEO_OPTIONS, multi=False, placeholder='Semua'),
+            ], style={'minWidth':'180px'}),
+        ], style={'display':'flex','gap':'12px','flexWrap':'wrap','marginBottom':'10px'})
+
+        return html.Div([
+            html.H2("Dashboard Inspeksi"),
+            controls,
+            html.Div(id='kpis', style={'display':'grid','gridTemplateColumns':'repeat(auto-fit, minmax(180px,1fr))','gap':'10px'}),
+            dcc.Graph(id='tsChart'),
+            html.Div(style={'display':'grid','gridTemplateColumns':'repeat(auto-fit, minmax(320px,1fr))','gap':'10px'}, children=[
+                dcc.Graph(id='statusPie'),
+                dcc.Graph(id='lokBar'),
+            ]),
+            dcc.Graph(id='geoMap'),
+            html.H3('Kondisi Item Terkini'),
+            html.Div(id='itemKpis', style={'display':'grid','gridTemplateColumns':'repeat(auto-fit, minmax(180px,1fr))','gap':'10px','marginBottom':'10px'}),
+            dash_table.DataTable(
+                id='itemBoard',
+                columns=[{'name': n, 'id': k} for n, k in _ITEM_BOARD_COLUMNS],
+                page_size=20, sort_action='native', filter_action='native',
+                style_table={'overflowX':'auto'},
+                style_data_conditional=[{'if': {'filter_query': '{status} = "Rusak"'}, 'backgroundColor': '#fdecea'}],
+            ),
+            html.H3('Produktivitas Petugas'),
+            dash_table.DataTable(
+                id='officerTable',
+                columns=[{'name': n, 'id': k} for n, k in _OFFICER_COLUMNS],
+                page_size=15, sort_action='native', filter_action='native',
+                style_table={'overflowX':'auto'},
+            ),
+            html.H3('Tren Rusak'),
+            dcc.Graph(id='trendChart'),
+            dash_table.DataTable(
+                id='trendTable',
+                columns=[{'name': n, 'id': k} for n, k in _TREND_COLUMNS],
+                page_size=15, sort_action='native', filter_action='native',
+                style_table={'overflowX':'auto'},
+                style_data_conditional=[{'if': {'filter_query': '{spike} = "Ya"'}, 'backgroundColor': '#fdecea'}],
+            ),
+            html.H3(id='covTitle', children='Cakupan Shift'),
+            dcc.Graph(id='covBar'),
+            dash_table.DataTable(
+                id='covMissing',
+                columns=[{'name': n, 'id': k} for n, k in (('Lokasi', 'lokasi'), ('Area', 'area'), ('Item belum dicek', 'item'))],
+                page_size=20, sort_action='native', filter_action='native',
+                style_table={'overflowX':'auto'},
+            ),
+            dcc.Interval(id='iv', interval=60*1000, n_intervals=0),
+            # Data version seen by this page; data callbacks listen to it instead of the interval
+            dcc.Store(id='dataVersion'),
+            # Mark each figure was last drawn or extended at (see _delta_since)
+            dcc.Store(id='wm_kpis'), dcc.Store(id='wm_pie'), dcc.Store(id='wm_series'),
+            dcc.Store(id='wm_lokbar'), dcc.Store(id='wm_map'),
+            # Coverage reads are O(items), so the running shift refreshes often
+            dcc.Interval(id='iv_cov', interval=15*1000, n_intervals=0),
+        ], style={'padding':'10px'})
+
+    dash_app.layout = _layout
+
+    @dash_app.callback(Output('f_lokasi','options'), Input('iv','n_intervals'))
+    def _refresh_lokasi_options(_):
+        return _lokasi_options()
+
+    @dash_app.callback(
+        [Output('itemKpis','children'), Output('itemBoard','data')],
+        [Input('dataVersion','data'), Input('f_lokasi','value')],
+    )
+    def _update_item_board(_, lokasi_ids):
+        # Current state, not the date range: reads item_latest_status, O(items)
         db = SessionLocal()
         try:
-            rows = db.query(models.Lokasi).order_by(models.Lokasi.nama_lokasi.asc()).all()
-            return [{"label": f"{r.nama_lokasi} (#{r.id_lokasi})", "value": r.id_lokasi} for r in rows]
+            rows = item_status.board(db)
         finally:
             db.close()
+        if lokasi_ids:
+            wanted = set(lokasi_ids)
+            rows = [r for r in rows if r['lokasi'] and r['lokasi']['id_lokasi'] in wanted]
+        c = item_status.counts(rows)
+        kpis = [
+            html.Div([
+                html.Div(label, style={'opacity':0.85}),
+                html.Div(str(val), style={'fontSize':'28px','fontWeight':'bold'})
+            ], style={'background':'#f5f5f5','padding':'10px','borderRadius':'8px'})
+            for label, val in (('Item', len(rows)), ('Rusak saat ini', c.get('Rusak', 0)),
+                               ('Bagus', c.get('Bagus', 0)), ('Belum pernah dicek', c.get('-', 0)))
+        ]
+        data = [
+            {
+                'lokasi': r['lokasi']['nama_lokasi'] if r['lokasi'] else '',
+                'area': r['area']['nama_area'] if r['area'] else '',
+                'item': r['nama_item'],
+                'status': r['status'] or '-',
+                'rusak_since': r['rusak_since'] or '',
+                'last_ts_utc': r['last_ts_utc'] or '',
+                'petugas': (r['petugas'] or {}).get('nama_lengkap') or '',
+            }
+            for r in rows
+        ]
+        return kpis, data
 
-    # Mount Dash at an internal subpath; we'll proxy it at /dashboard to inject the site header
-    dash_app = Dash(__name__, requests_pathname_prefix="/dashapp/")
-    from datetime import date
-    _today = date.today()
-    _start_default = (_today - timedelta(days=30))
-    controls = html.Div([
-        html.Div([
-            html.Label('Lokasi'),
-            dcc.Dropdown(id='f_lokasi', options=_lokasi_options(), multi=True, placeholder='Semua lokasi'),
-        ], style={'minWidth':'240px'}),
-        html.Div([
-            html.Label('Shift'),
-            dcc.Dropdown(id='f_shift', options=[{'label':s, 'value':s} for s in ['Pagi','Siang','Malam']], multi=False, placeholder='Semua shift'),
-        ], style={'minWidth':'180px'}),
-        html.Div([
-            html.Label('Tanggal'),
-            dcc.DatePickerRange(id='f_range', start_date=_start_default, end_date=_today),
-        ], style={'minWidth':'280px'}),
-    ], style={'display':'flex','gap':'12px','flexWrap':'wrap','marginBottom':'10px'})
-
-    dash_app.layout = html.Div([
-        html.H2("Dashboard Inspeksi"),
-        controls,
-        html.Div(id='kpis', style={'display':'grid','gridTemplateColumns':'repeat(auto-fit, minmax(180px,1fr))','gap':'10px'}),
-        dcc.Graph(id='tsChart'),
-        html.Div(style={'display':'grid','gridTemplateColumns':'repeat(auto-fit, minmax(320px,1fr))','gap':'10px'}, children=[
-            dcc.Graph(id='statusPie'),
-            dcc.Graph(id='lokBar'),
-        ]),
-        dcc.Graph(id='geoMap'),
-        dcc.Interval(id='iv', interval=60*1000, n_intervals=0),
-    ], style={'padding':'10px'})
-
-    def _fetch_filtered(days: int, lokasi_ids, shift, start_date, end_date):
-        # Build time constraints
-        start_iso = None
-        end_iso = None
-        if start_date:
-            try:
-                sd = datetime.fromisoformat(str(start_date))
-            except Exception:
-                sd = datetime.now(timezone.utc) - timedelta(days=days)
-            start_iso = sd.strftime('%Y-%m-%dT00:00:00Z')
-        if end_date:
-            try:
-                ed = datetime.fromisoformat(str(end_date))
-            except Exception:
-                ed = datetime.now(timezone.utc)
-            end_iso = ed.strftime('%Y-%m-%dT23:59:59Z')
+    def _op_day(value, default):
+        try:
+            return date.fromisoformat(str(value)[:10]) if value else default
+        except ValueError:
+            return default
 
+    @dash_app.callback(
+        Output('officerTable','data'),
+        [Input('dataVersion','data'), Input('f_lokasi','value'), Input('f_shift','value'),
+         Input('f_range','start_date'), Input('f_range','end_date')],
+    )
+    def _update_officers(_, lokasi_ids, shift, start_date, end_date):
+        # Served from officer_shift_rollup: cost follows officers x days, not inspections
+        end = _op_day(end_date, shift_calendar.CALENDAR.today())
+        start = _op_day(start_date, end - timedelta(days=29))
+        start = max(start, end - timedelta(days=365))
         db = SessionLocal()
         try:
-            # Base filter on time
-            q_tx = db.query(models.InspeksiTx)
-            if start_iso:
-                q_tx = q_tx.filter(models.InspeksiTx.ts_utc >= start_iso)
-            else:
-                cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%SZ')
-                q_tx = q_tx.filter(models.InspeksiTx.ts_utc >= cutoff)
-            if end_iso:
-                q_tx = q_tx.filter(models.InspeksiTx.ts_utc <= end_iso)
-            shift_val = (shift or '').strip() or None
-            if shift_val:
-                q_tx = q_tx.filter(models.InspeksiTx.shift == shift_val)
-            if lokasi_ids:
-                q_tx = (
-                    q_tx.join(models.Item, models.Item.id_item == models.InspeksiTx.item_id)
-                        .join(models.Area, models.Area.id_area == models.Item.id_area)
-                        .join(models.Lokasi, models.Lokasi.id_lokasi == models.Area.id_lokasi)
-                        .filter(models.Lokasi.id_lokasi.in_(lokasi_ids))
-                )
+            rows = officer_rollup.report(db, start, end, lokasi_ids=lokasi_ids or None, shift=shift or None)
+        finally:
+            db.close()
+        return [dict(r, petugas=r['nama_lengkap'] or f"#{r['id_user']}") for r in rows]
+
+    @dash_app.callback(
+        [Output('trendChart','figure'), Output('trendTable','data')],
+        [Input('dataVersion','data'), Input('f_lokasi','value')],
+    )
+    def _update_trends(_, lokasi_ids):
+        # Trend ends at today's operational day; the date picker does not apply
+        db = SessionLocal()
+        try:
+            rep = trends.report(db, days=90, lokasi_ids=lokasi_ids or None)
+        finally:
+            db.close()
+        days = [p['day'] for p in rep['series']]
+        fig = {
+            'data': [
+                go.Bar(x=days, y=[p['rusak'] for p in rep['series']], name='Rusak', marker_color='#EF9A9A', yaxis='y2'),
+                go.Scatter(x=days, y=[p['rolling_rate'] for p in rep['series']], mode='lines', name=f"Rasio Rusak {rep['window_days']} hari"),
+                go.Scatter(x=days, y=[p['ewma'] for p in rep['series']], mode='lines', name='EWMA', line=dict(dash='dot')),
+            ],
+            'layout': go.Layout(
+                title='Rasio Rusak Harian', yaxis=dict(title='Rasio', tickformat='.0%'),
+                yaxis2=dict(title='Rusak', overlaying='y', side='right', showgrid=False),
+            ),
+        }
+        pct = lambda v: f"{v:.0%}" if v is not None else '-'
+        data = [
+            {
+                'lokasi': (r['lokasi'] or {}).get('nama_lokasi', ''),
+                'area': (r['area'] or {}).get('nama_area', ''),
+                'item': r['nama_item'],
+                'checks': r['checks'],
+                'rusak': r['rusak'],
+                'rate': pct(r['rate']),
+                'wow_delta': f"{r['wow_delta']:+.0%}" if r['wow_delta'] is not None else '-',
+                'ewma': pct(r['ewma']),
+                'z': r['z'],
+                'spike': 'Ya' if r['spike'] else '',
+            }
+            for r in rep['items']
+        ]
+        return fig, data
+
+    @dash_app.callback(
+        [Output('covTitle','children'), Output('covBar','figure'), Output('covMissing','data')],
+        [Input('iv_cov','n_intervals'), Input('f_lokasi','value')],
+    )
+    def _update_coverage(_, lokasi_ids):
+        shift = coverage.shift_at(datetime.now(timezone.utc))
+        db = SessionLocal()
+        try:
+            rep = coverage.report(db, shift, lokasi_ids=lokasi_ids or None)
+        finally:
+            db.close()
+        t = rep['totals']
+        pct = f"{t['coverage_pct']}%" if t['coverage_pct'] is not None else '-'
+        title = f"Cakupan Shift {shift.label} {shift.day}: {t['covered']}/{t['items']} item ({pct})"
+        areas = rep['areas'][:20]  # most missing first
+        names = [f"{(a['lokasi'] or {}).get('nama_lokasi', '')} / {a['nama_area']}" for a in areas]
+        fig = {
+            'data': [
+                go.Bar(x=[a['covered'] for a in areas], y=names, orientation='h', name='Sudah dicek', marker_color='#2E7D32'),
+                go.Bar(x=[a['missing'] for a in areas], y=names, orientation='h', name='Belum dicek', marker_color='#C62828'),
+            ],
+            'layout': go.Layout(barmode='stack', title='Area dengan item belum dicek', margin=dict(l=220), yaxis=dict(autorange='reversed')),
+        }
+        missing = [
+            {'lokasi': (a['lokasi'] or {}).get('nama_lokasi', ''), 'area': a['nama_area'], 'item': m['nama_item']}
+            for a in rep['areas'] for m in a['missing_items']
+        ]
+        return title, fig, missing
 
-            # Totals and status counts
-            total = q_tx.count()
-            bagus = q_tx.filter(models.InspeksiTx.status == 'Bagus').count()
-            rusak = q_tx.filter(models.InspeksiTx.status == 'Rusak').count()
-            cutoff24 = (datetime.now(timezone.utc) - timedelta(hours=24)).strftime('%Y-%m-%dT%H:%M:%SZ')
-            last24 = q_tx.filter(models.InspeksiTx.ts_utc >= cutoff24).count()
+    # ---- Filtered query pieces, memoized per (data version, filters) ----
+    # Every figure callback reads only the pieces it needs. A full draw records
+    # the (change counter, max line id) mark it was computed at in the figure's
+    # watermark store; while only new lines arrive after that mark, the next
+    # refresh sends a Patch built from those lines alone.
 
-            # Filters joining lokasi if needed
-            # Series grouped by day and status
-            day_col = func.substr(models.InspeksiTx.ts_utc, 1, 10)
-            day_labeled = day_col.label('day')
-            q_series = (
-                db.query(day_labeled, models.InspeksiTx.status, func.count(models.InspeksiTx.id_inspeksi))
-                .filter(models.InspeksiTx.ts_utc >= (start_iso or (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%SZ')))
+    @contextmanager
+    def _read_snapshot():
+        """Session whose queries all see one database state.
+
+        The database runs in WAL mode (app/database.py), so holding this read
+        transaction does not block the ingest writer.
+        """
+        db = SessionLocal()
+        try:
+            db.connection().exec_driver_sql("BEGIN")
+            yield db
+        finally:
+            db.rollback()
+            db.close()
+
+    _MARK_SQL = text(
+        "SELECT (SELECT seq FROM change_counters WHERE name = :n), (SELECT MAX(id_inspeksi) FROM inspeksi_line)"
+    )
+
+    def _mark(db) -> tuple:
+        # (change counter, max line id, master data version)
+        seq, top = db.execute(_MARK_SQL, {"n": changefeed.FEED}).one()
+        return int(seq or 0), int(top or 0), masterdata.get_snapshot().version
+
+    def _filters(lokasi_ids, shift, start_date, end_date, geo, days: int = 30) -> tuple:
+        """Hashable, normalized filter tuple: (lokasi ids, shift, first day, last day, geo)."""
+        end_day = _op_day(end_date, shift_calendar.CALENDAR.today())
+        start_day = _op_day(start_date, end_day - timedelta(days=days - 1))
+        return (
+            tuple(sorted(lokasi_ids or ())),
+            (shift or '').strip() or None,
+            start_day.isoformat(),
+            end_day.isoformat(),
+            geo or None,
+        )
+
+    def _filtered_tx(db, f, q=None):
+        # Picked dates are operational days: ranges on the indexed local_day stamp
+        lokasi_ids, shift, day_lo, day_hi, geo = f
+        q = (q if q is not None else db.query(models.InspeksiTx)).filter(
+            models.InspeksiTx.local_day.between(day_lo, day_hi))
+        if shift:
+            q = q.filter(models.InspeksiTx.shift == shift)
+        q = geo_audit.filter_query(q, geo)
+        if lokasi_ids:
+            q = (
+                q.join(models.Item, models.Item.id_item == models.InspeksiTx.item_id)
+                 .join(models.Area, models.Area.id_area == models.Item.id_area)
+                 .filter(models.Area.id_lokasi.in_(lokasi_ids))
             )
-            if end_iso:
-                q_series = q_series.filter(models.InspeksiTx.ts_utc <= end_iso)
-            if shift_val:
-                q_series = q_series.filter(models.InspeksiTx.shift == shift_val)
-            if lokasi_ids:
-                q_series = (
-                    q_series.join(models.Item, models.Item.id_item == models.InspeksiTx.item_id)
-                           .join(models.Area, models.Area.id_area == models.Item.id_area)
-                           .join(models.Lokasi, models.Lokasi.id_lokasi == models.Area.id_lokasi)
-                           .filter(models.Lokasi.id_lokasi.in_(lokasi_ids))
+        return q
+
+    def _status_key(status) -> str:
+        s = (status or '').lower()
+        return s if s in ('bagus', 'rusak') else 'lain'
+
+    @lru_cache(maxsize=64)
+    def _q_status_counts(version: tuple, f: tuple) -> tuple:
+        with _read_snapshot() as db:
+            mark = _mark(db)
+            rows = _filtered_tx(db, f, db.query(models.InspeksiTx.status, func.count(models.InspeksiTx.id_inspeksi))) \
+                .group_by(models.InspeksiTx.status).all()
+        counts = {"total": 0, "bagus": 0, "rusak": 0}
+        for status, n in rows:
+            counts["total"] += int(n)
+            counts[_status_key(status)] = counts.get(_status_key(status), 0) + int(n)
+        return mark, counts
+
+    @lru_cache(maxsize=64)
+    def _q_last24(version: tuple, f: tuple, minute: int) -> int:
+        # Rolling UTC window, so keyed on the minute as well as the data
+        cutoff = datetime.fromtimestamp(minute * 60 - 24 * 3600, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        db = SessionLocal()
+        try:
+            return _filtered_tx(db, f).filter(models.InspeksiTx.ts_utc >= cutoff).count()
+        finally:
+            db.close()
+
+    @lru_cache(maxsize=64)
+    def _q_series(version: tuple, f: tuple) -> tuple:
+        """(mark, resolution, labels, totals, rusak) with a point for every bucket in range."""
+        lokasi_ids, shift, day_lo, day_hi, geo = f
+        start, end = date.fromisoformat(day_lo), date.fromisoformat(day_hi)
+        with _read_snapshot() as db:
+            mark = _mark(db)
+            if not geo:
+                # Pre-aggregated tiers; the resolution follows the range
+                resolution, points = series_rollup.series(db, start, end, lokasi_ids=list(lokasi_ids) or None, shift=shift)
+                rows = [(p["bucket"], p["total"], p["rusak"]) for p in points]
+            else:
+                # The geofence filter is not in the rollup key, so it counts raw rows
+                resolution = 'd'
+                day_labeled = models.InspeksiTx.local_day.label('day')
+                q = db.query(
+                    day_labeled, func.count(models.InspeksiTx.id_inspeksi),
+                    func.sum(case((func.lower(models.InspeksiTx.status) == 'rusak', 1), else_=0)),
                 )
-            rows = q_series.group_by(day_labeled, models.InspeksiTx.status).order_by(day_labeled).all()
-            series = {}
-            for day, status, cnt in rows:
-                d = series.setdefault(day, {"total": 0, "bagus": 0, "rusak": 0})
-                d["total"] += int(cnt)
-                s = (status or '').lower()
-                if s == 'bagus': d['bagus'] += int(cnt)
-                elif s == 'rusak': d['rusak'] += int(cnt)
-            series_list = [
-                {"day": k, **v} for k, v in sorted(series.items())
-            ]
+                rows = _filtered_tx(db, f, q).group_by(day_labeled).all()
+        labels = series_rollup.bucket_labels(resolution, start, end)
+        pos = {b: i for i, b in enumerate(labels)}
+        totals, rusak = [0] * len(labels), [0] * len(labels)
+        for b, t, r in rows:
+            if b in pos:
+                totals[pos[b]] += int(t or 0)
+                rusak[pos[b]] += int(r or 0)
+        return mark, resolution, tuple(labels), tuple(totals), tuple(rusak)
 
-            # Top lokasi bar
-            q_loc = (
-                db.query(models.Lokasi.nama_lokasi, func.count(models.InspeksiTx.id_inspeksi))
+    @lru_cache(maxsize=64)
+    def _q_by_lokasi(version: tuple, f: tuple) -> tuple:
+        """(mark, ((id_lokasi, name, count), ...)) for the top 10 lokasi."""
+        lokasi_ids, shift, day_lo, day_hi, geo = f
+        with _read_snapshot() as db:
+            mark = _mark(db)
+            q = (
+                db.query(models.Lokasi.id_lokasi, models.Lokasi.nama_lokasi, func.count(models.InspeksiTx.id_inspeksi))
                 .join(models.Area, models.Area.id_lokasi == models.Lokasi.id_lokasi)
                 .join(models.Item, models.Item.id_area == models.Area.id_area)
                 .join(models.InspeksiTx, models.InspeksiTx.item_id == models.Item.id_item)
+                .filter(models.InspeksiTx.local_day.between(day_lo, day_hi))
             )
-            if start_iso:
-                q_loc = q_loc.filter(models.InspeksiTx.ts_utc >= start_iso)
-            if end_iso:
-                q_loc = q_loc.filter(models.InspeksiTx.ts_utc <= end_iso)
             if shift:
-                q_loc = q_loc.filter(models.InspeksiTx.shift == shift)
+                q = q.filter(models.InspeksiTx.shift == shift)
+            q = geo_audit.filter_query(q, geo)
             if lokasi_ids:
-                q_loc = q_loc.filter(models.Lokasi.id_lokasi.in_(lokasi_ids))
-            q_loc = q_loc.group_by(models.Lokasi.id_lokasi).order_by(func.count(models.InspeksiTx.id_inspeksi).desc()).limit(10).all()
-            by_lokasi = [(n or '(tanpa nama)', int(c)) for n, c in q_loc]
+                q = q.filter(models.Lokasi.id_lokasi.in_(lokasi_ids))
+            rows = q.group_by(models.Lokasi.id_lokasi).order_by(func.count(models.InspeksiTx.id_inspeksi).desc()).limit(10).all()
+        return mark, tuple((i, n or '(tanpa nama)', int(c)) for i, n, c in rows)
 
-            # Geo data: lokasi markers and recent inspections points
-            q_lokasi = db.query(models.Lokasi).order_by(models.Lokasi.nama_lokasi.asc())
-            if lokasi_ids:
-                q_lokasi = q_lokasi.filter(models.Lokasi.id_lokasi.in_(lokasi_ids))
-            lokasi_rows = q_lokasi.all()
-            lokasi_points = [
-                (float(r.latitude), float(r.longitude), r.nama_lokasi)
-                for r in lokasi_rows if (r.latitude is not None and r.longitude is not None)
-            ]
+    @lru_cache(maxsize=64)
+    def _q_delta(after_id: int, upto_id: int, f: tuple) -> dict:
+        """Counts of the lines with after_id < id_inspeksi <= upto_id matching ``f``."""
+        db = SessionLocal()
+        try:
+            Tx = models.InspeksiTx
+            rows = _filtered_tx(db, f, db.query(Tx.item_id, Tx.local_day, Tx.ts_utc, Tx.status)) \
+                .filter(Tx.id_inspeksi > after_id, Tx.id_inspeksi <= upto_id).all()
+        finally:
+            db.close()
+        snap = masterdata.get_snapshot()
+        status = {"total": 0, "bagus": 0, "rusak": 0}
+        lines, by_lokasi = [], {}
+        for item_id, local_day, ts_utc, st in rows:
+            key = _status_key(st)
+            status["total"] += 1
+            status[key] = status.get(key, 0) + 1
+            lines.append((local_day, ts_utc, key == 'rusak'))
+            item = snap.items.get(item_id)
+            area = snap.areas.get(item.id_area) if item else None
+            if area is not None:
+                by_lokasi[area.id_lokasi] = by_lokasi.get(area.id_lokasi, 0) + 1
+        return {"status": status, "lines": lines, "by_lokasi": by_lokasi}
+
+    @lru_cache(maxsize=64)
+    def _q_geo(version: tuple, f: tuple, map_scale) -> dict:
+        lokasi_ids = f[0]
+        # Lokasi markers and geofence outlines, from the master data snapshot
+        snap = masterdata.get_snapshot()
+        lokasi_rows = [r for r in snap.lokasi_sorted if not lokasi_ids or r.id_lokasi in lokasi_ids]
+        lokasi_points = [
+            (float(r.latitude), float(r.longitude), r.nama_lokasi)
+            for r in lokasi_rows if (r.latitude is not None and r.longitude is not None)
+        ]
+        lokasi_polygons = [(r.polygon, r.nama_lokasi) for r in lokasi_rows if r.polygon]
+        db = SessionLocal()
+        try:
+            # Every point in range, grouped into map cells in SQL
+            insp_clusters = geo_cluster.clusters(_filtered_tx(db, f), map_scale)
+        finally:
+            db.close()
+        return {"lokasi": lokasi_points, "polygons": lokasi_polygons, "clusters": insp_clusters}
 
-            insp_points = []
-            # Reuse q_tx (already time/shift/lokasi filtered) to fetch points
-            for lat, lon in q_tx.with_entities(models.InspeksiTx.latitude, models.InspeksiTx.longitude).order_by(models.InspeksiTx.id_inspeksi.desc()).limit(500).all():
-                try:
-                    if lat is None or lon is None:
-                        continue
-                    insp_points.append((float(lat), float(lon)))
-                except Exception:
-                    continue
+    def _watermark(mark: tuple, f: tuple, **extra) -> dict:
+        seq, top, snap = mark
+        return {"seq": seq, "id": top, "snap": snap, "f": repr(f), **extra}
 
-            return {
-                "totals": {"total": total, "bagus": bagus, "rusak": rusak, "last24h": last24},
-                "series": series_list,
-                "by_lokasi": by_lokasi,
-                "geo": {
-                    "lokasi": lokasi_points,
-                    "inspeksi": insp_points,
-                }
-            }
+    def _delta_since(wm, version, f) -> Optional[dict]:
+        """Lines added since the figure's watermark, or None when it must be redrawn.
+
+        Raises PreventUpdate when the figure is already at least as new as
+        ``version``. Extending is safe only if every change-feed step since
+        the mark was a new line: header re-audits and master data edits
+        change existing points, so they force a full draw.
+        """
+        if not wm or callback_context.triggered_id != 'dataVersion' or wm.get('f') != repr(f):
+            return None
+        seq, top, snap = version
+        if snap != wm['snap']:
+            return None
+        if seq <= wm['seq'] and top <= wm['id']:
+            raise PreventUpdate
+        if top < wm['id'] or seq - wm['seq'] != top - wm['id']:
+            return None
+        return _q_delta(wm['id'], top, f)
+
+    _FILTER_INPUTS = [
+        Input('f_lokasi','value'), Input('f_shift','value'),
+        Input('f_range','start_date'), Input('f_range','end_date'), Input('f_geo','value'),
+    ]
+
+    @dash_app.callback(Output('dataVersion','data'), Input('iv','n_intervals'), State('dataVersion','data'))
+    def _refresh_data_version(_, current):
+        # The only data callback on the interval: figures refire only when it changes
+        db = SessionLocal()
+        try:
+            version = list(_mark(db))
         finally:
             db.close()
+        if version == current:
+            raise PreventUpdate
+        return version
+
+    _KPI_LABELS = (('Total', 'total'), ('24 Jam', 'last24h'), ('Bagus', 'bagus'), ('Rusak', 'rusak'))
+
+    def _kbox(label, val):
+        return html.Div([
+            html.Div(label, style={'opacity':0.85}),
+            html.Div(val, style={'fontSize':'28px','fontWeight':'bold'})
+        ], style={'background':'#f5f5f5','padding':'10px','borderRadius':'8px'})
 
     @dash_app.callback(
-        [
-            Output('kpis','children'),
-            Output('tsChart','figure'),
-            Output('statusPie','figure'),
-            Output('lokBar','figure'),
-            Output('geoMap','figure'),
-        ],
-        [Input('iv','n_intervals'), Input('f_lokasi','value'), Input('f_shift','value'), Input('f_range','start_date'), Input('f_range','end_date')]
+        [Output('kpis','children'), Output('wm_kpis','data')],
+        [Input('dataVersion','data'), Input('iv','n_intervals')] + _FILTER_INPUTS,
+        State('wm_kpis','data'),
     )
-    def _update(_, lokasi_ids, shift, start_date, end_date):
-        data = _fetch_filtered(30, lokasi_ids, shift, start_date, end_date)
-        t = data['totals']
-        def kbox(label, val):
-            return html.Div([
-                html.Div(label, style={'opacity':0.85}),
-                html.Div(str(val), style={'fontSize':'28px','fontWeight':'bold'})
-            ], style={'background':'#f5f5f5','padding':'10px','borderRadius':'8px'})
-        kpis = [
-            kbox('Total', t.get('total',0)),
-            kbox('24 Jam', t.get('last24h',0)),
-            kbox('Bagus', t.get('bagus',0)),
-            kbox('Rusak', t.get('rusak',0)),
-        ]
-        xs = [r['day'] for r in data['series']]
-        fig_ts = {
-            'data': [
-                go.Scatter(x=xs, y=[r['total'] for r in data['series']], mode='lines+markers', name='Total'),
-                go.Scatter(x=xs, y=[r['rusak'] for r in data['series']], mode='lines+markers', name='Rusak'),
-            ],
-            'layout': go.Layout(title='Inspeksi per Hari', margin=dict(t=40,l=40,r=20,b=40))
-        }
-        fig_pie = {
-            'data': [go.Pie(labels=['Bagus','Rusak'], values=[t.get('bagus',0), t.get('rusak',0)], hole=0.4)],
-            'layout': go.Layout(title='Status')
-        }
-        locs = data['by_lokasi']
-        fig_bar = {
-            'data': [go.Bar(x=[c for _,c in locs], y=[n for n,_ in locs], orientation='h')],
+    def _update_kpis(version, _, lokasi_ids, shift, start_date, end_date, geo_filter, wm):
+        if not version:
+            raise PreventUpdate
+        version = tuple(version)
+        f = _filters(lokasi_ids, shift, start_date, end_date, geo_filter)
+        # The 24h count moves with the clock, so it also follows the interval.
+        # New data fires dataVersion in the same call as iv, so only a call
+        # without it may be a clock-only update.
+        last24 = _q_last24(version, f, int(time.time() // 60))
+        triggered = callback_context.triggered_prop_ids
+        if ('iv.n_intervals' in triggered and 'dataVersion.data' not in triggered
+                and wm and wm.get('f') == repr(f)):
+            if last24 == wm.get('last24h'):
+                raise PreventUpdate
+            patch = Patch()
+            patch[1]['props']['children'][1]['props']['children'] = last24
+            return patch, dict(wm, last24h=last24)
+        delta = _delta_since(wm, version, f)
+        if delta is None:
+            mark, t = _q_status_counts(version, f)
+            values = dict(t, last24h=last24)
+            return [_kbox(label, values[key]) for label, key in _KPI_LABELS], _watermark(mark, f, last24h=last24)
+        # Only the counters that changed
+        patch = Patch()
+        changes = dict(delta['status'])
+        for i, (_, key) in enumerate(_KPI_LABELS):
+            if key == 'last24h':
+                if last24 != wm.get('last24h'):
+                    patch[i]['props']['children'][1]['props']['children'] = last24
+            elif changes.get(key):
+                patch[i]['props']['children'][1]['props']['children'] += changes[key]
+        return patch, _watermark(version, f, last24h=last24)
+
+    @dash_app.callback(
+        [Output('statusPie','figure'), Output('wm_pie','data')],
+        [Input('dataVersion','data')] + _FILTER_INPUTS,
+        State('wm_pie','data'),
+    )
+    def _update_pie(version, lokasi_ids, shift, start_date, end_date, geo_filter, wm):
+        if not version:
+            raise PreventUpdate
+        version = tuple(version)
+        f = _filters(lokasi_ids, shift, start_date, end_date, geo_filter)
+        delta = _delta_since(wm, version, f)
+        if delta is None:
+            mark, t = _q_status_counts(version, f)
+            fig = {
+                'data': [go.Pie(labels=['Bagus','Rusak'], values=[t['bagus'], t['rusak']], hole=0.4)],
+                'layout': go.Layout(title='Status')
+            }
+            return fig, _watermark(mark, f)
+        patch = Patch()
+        for i, key in enumerate(('bagus', 'rusak')):
+            if delta['status'].get(key):
+                patch['data'][0]['values'][i] += delta['status'][key]
+        return patch, _watermark(version, f)
+
+    @dash_app.callback(
+        [Output('tsChart','figure'), Output('wm_series','data')],
+        [Input('dataVersion','data')] + _FILTER_INPUTS,
+        State('wm_series','data'),
+    )
+    def _update_series(version, lokasi_ids, shift, start_date, end_date, geo_filter, wm):
+        if not version:
+            raise PreventUpdate
+        version = tuple(version)
+        f = _filters(lokasi_ids, shift, start_date, end_date, geo_filter)
+        delta = _delta_since(wm, version, f)
+        if delta is None:
+            mark, resolution, xs, totals, rusak = _q_series(version, f)
+            fig = {
+                'data': [
+                    go.Scatter(x=xs, y=totals, mode='lines+markers', name='Total'),
+                    go.Scatter(x=xs, y=rusak, mode='lines+markers', name='Rusak'),
+                ],
+                'layout': go.Layout(title=_SERIES_TITLES.get(resolution, 'Inspeksi per Hari'), margin=dict(t=40,l=40,r=20,b=40))
+            }
+            return fig, _watermark(mark, f, res=resolution)
+        # Every bucket of the range is already on the chart: add to its point
+        labels = series_rollup.bucket_labels(wm['res'], date.fromisoformat(f[2]), date.fromisoformat(f[3]))
+        pos = {b: i for i, b in enumerate(labels)}
+        add_total, add_rusak = {}, {}
+        for local_day, ts_utc, is_rusak in delta['lines']:
+            i = pos.get(series_rollup.bucket_of(wm['res'], local_day, ts_utc))
+            if i is not None:
+                add_total[i] = add_total.get(i, 0) + 1
+                add_rusak[i] = add_rusak.get(i, 0) + is_rusak
+        patch = Patch()
+        for i, n in add_total.items():
+            patch['data'][0]['y'][i] += n
+            if add_rusak[i]:
+                patch['data'][1]['y'][i] += add_rusak[i]
+        return patch, _watermark(version, f, res=wm['res'])
+
+    @dash_app.callback(
+        [Output('lokBar','figure'), Output('wm_lokbar','data')],
+        [Input('dataVersion','data')] + _FILTER_INPUTS,
+        State('wm_lokbar','data'),
+    )
+    def _update_lokasi_bar(version, lokasi_ids, shift, start_date, end_date, geo_filter, wm):
+        if not version:
+            raise PreventUpdate
+        version = tuple(version)
+        f = _filters(lokasi_ids, shift, start_date, end_date, geo_filter)
+        delta = _delta_since(wm, version, f)
+        if delta is not None:
+            shown = {lok: i for i, lok in enumerate(wm['lokasi'])}
+            counts = list(wm['counts'])
+            for lok, n in delta['by_lokasi'].items():
+                if lok not in shown:
+                    break
+                counts[shown[lok]] += n
+            else:
+                # Same top 10, same order: patch the bars that grew
+                if counts == sorted(counts, reverse=True):
+                    patch = Patch()
+                    for lok, n in delta['by_lokasi'].items():
+                        patch['data'][0]['x'][shown[lok]] += n
+                    return patch, _watermark(version, f, lokasi=wm['lokasi'], counts=counts)
+        mark, locs = _q_by_lokasi(version, f)
+        fig = {
+            'data': [go.Bar(x=[c for _, _, c in locs], y=[n for _, n, _ in locs], orientation='h')],
             'layout': go.Layout(title='Top Lokasi (jumlah inspeksi)', margin=dict(l=140))
         }
-        # Geo map figure (scattergeo without external tokens)
-        geo = data.get('geo', {})
+        return fig, _watermark(mark, f, lokasi=[i for i, _, _ in locs], counts=[c for _, _, c in locs])
+
+    @dash_app.callback(
+        [Output('geoMap','figure'), Output('wm_map','data')],
+        [Input('dataVersion','data')] + _FILTER_INPUTS + [Input('geoMap','relayoutData')],
+        State('wm_map','data'),
+    )
+    def _update_map(version, lokasi_ids, shift, start_date, end_date, geo_filter, relayout, wm):
+        if not version:
+            raise PreventUpdate
+        # Clusters re-bin the whole range, so new data redraws the map at most every MAP_REFRESH_SEC
+        if callback_context.triggered_id == 'dataVersion' and wm and time.time() - wm.get('t', 0) < MAP_REFRESH_SEC:
+            raise PreventUpdate
+        version = tuple(version)
+        # Zooming the map re-bins the clusters at the new projection scale
+        map_scale = None
+        if isinstance(relayout, dict) and relayout.get('geo.projection.scale'):
+            try:
+                map_scale = float(relayout['geo.projection.scale'])
+            except (TypeError, ValueError):
+                map_scale = None
+        f = _filters(lokasi_ids, shift, start_date, end_date, geo_filter)
+        geo = _q_geo(version, f, map_scale)
         locs = geo.get('lokasi', [])
-        ips = geo.get('inspeksi', [])
+        clus = geo.get('clusters')
+        polys = geo.get('polygons', [])
         traces = []
+        if polys:
+            # One trace for all outlines; None breaks the line between rings
+            plat, plon, ptxt = [], [], []
+            for pts, name in polys:
+                ring = list(pts) + [pts[0]]
+                plat += [a for a, _ in ring] + [None]
+                plon += [b for _, b in ring] + [None]
+                ptxt += [name] * len(ring) + [None]
+            traces.append(
+                go.Scattergeo(
+                    lon=plon, lat=plat, text=ptxt, mode='lines', name='Geofence',
+                    fill='toself', line=dict(color='#0072BC', width=2)
+                )
+            )
         if locs:
             traces.append(
                 go.Scattergeo(
@@ -624,20 +1178,66 @@ try:
                     marker=dict(color='#0072BC', size=8, symbol='circle')
                 )
             )
-        if ips:
+        geo_layout = dict(showland=True, landcolor='#eaeaea')
+        if clus and clus.cells:
+            cells = clus.cells
+            top = max(c.count for c in cells)
             traces.append(
                 go.Scattergeo(
-                    lon=[b for _, b in ips], lat=[a for a, _ in ips],
-                    mode='markers', name='Inspeksi',
-                    marker=dict(color='#F26522', size=6, symbol='x')
+                    lon=[c.lon for c in cells], lat=[c.lat for c in cells],
+                    text=[f"{c.count} inspeksi, {100.0 * c.rusak / c.count:.0f}% rusak" for c in cells],
+                    hoverinfo='text', mode='markers', name='Inspeksi',
+                    marker=dict(
+                        size=[6 + 22 * (c.count / top) ** 0.5 for c in cells],
+                        color=[c.rusak / c.count for c in cells],
+                        colorscale=[[0, '#2E7D32'], [1, '#C62828']], cmin=0, cmax=1,
+                        colorbar=dict(title='Rusak', tickformat='.0%'),
+                        opacity=0.8, line=dict(width=0),
+                    ),
                 )
             )
+            if clus.center and map_scale is None:
+                geo_layout.update(center=dict(lat=clus.center[0], lon=clus.center[1]), projection=dict(scale=clus.scale))
         fig_map = {
             'data': traces,
-            'layout': go.Layout(title='Sebaran Lokasi & Titik Inspeksi', geo=dict(showland=True, landcolor='#eaeaea'), margin=dict(t=40,l=20,r=20,b=20))
+            'layout': go.Layout(
+                title='Sebaran Lokasi & Titik Inspeksi', geo=geo_layout, margin=dict(t=40,l=20,r=20,b=20),
+                # Keep the user's zoom across refreshes until a filter changes
+                uirevision=repr((lokasi_ids, shift, start_date, end_date, geo_filter)),
+            )
         }
 
-        return kpis, fig_ts, fig_pie, fig_bar, fig_map
+        return fig_map, {"t": time.time()}
+
+    # Re-check upstream for a new Dash index (new build) at most this often
+    DASH_INDEX_TTL_SEC = 60
+    _DASH_CSS = (
+        '<link rel="stylesheet" href="{css}">'
+        '<style>body{{color:#222;background:#fff;}} a{{color:#0072BC;}}</style>'
+    )
+    _DASH_TOPBAR = """
+<header class="topbar"><div class="topbar-inner">
+  <a class="brand" href="/dashboard">BIB</a>
+  <nav id="nav-links" class="links">{links}</nav>
+</div></header>
+<div style="height:56px"></div>
+"""
+
+    def _dash_nav_links(username: str, role: str) -> str:
+        # The only per-user part of the dashboard page; the proxy already
+        # knows the user, so no /api/me round trip from the browser
+        links = (
+            '<a href="/dashboard">Dashboard</a>'
+            '<a href="/inspection-form">Form Inspeksi</a>'
+            '<a href="/inspections">Daftar Inspeksi</a>'
+        )
+        if _normalize_role(role) == "administrator":
+            links += '<a href="/admin/manage">Admin</a><a href="/admin/import">Import</a>'
+        return links + (
+            '<span class="sep"></span><a href="/account">Akun</a>'
+            f'<span class="who">{html_escape(username)} ({html_escape(role)})</span>'
+            '<a href="/logout">Keluar</a>'
+        )
 
     # Auth + header-injecting proxy for /dashboard -> /dashapp
     class _DashProxy:
@@ -645,6 +1245,8 @@ try:
             self.inner = inner_asgi
             self.src_prefix = src_prefix.rstrip('/')
             self.dst_prefix = dst_prefix.rstrip('/')
+            self._pages = {}    # upstream digest -> (digest, head, tail)
+            self._index = None  # last Dash index page, see _split
 
         async def __call__(self, scope, receive, send):
             if scope.get('type') != 'http':
@@ -673,7 +1275,8 @@ try:
                 user = db.query(models.User).filter(models.User.username == username).first()
                 if not user:
                     return await redirect_home()(scope, receive, send)
-                role = _normalize_role(getattr(user, 'role', ''))
+                role_name = getattr(user, 'role', '') or ''
+                role = _normalize_role(role_name)
                 allowed = {"team leader", "manager", "group head", "administrator"}
                 if role not in allowed:
                     return await redirect_home()(scope, receive, send)
@@ -696,106 +1299,90 @@ try:
             new_scope['path'] = forward_path
             new_scope['raw_path'] = forward_path.encode('utf-8')
 
-            # Capture response to inject header for HTML documents
+            # Dash index: served from the injected-page cache; other HTML is
+            # buffered (it is small) and spliced; everything else streams through
+            links = _dash_nav_links(username, role_name)
+            is_index = scope.get('method') == 'GET' and forward_path == self.dst_prefix + '/'
+            cached = self._index if is_index else None
+            if cached is not None and time.monotonic() - cached[3] < DASH_INDEX_TTL_SEC:
+                return await self._send_page(scope, send, cached, links, [(b'content-type', b'text/html; charset=utf-8')])
+
             started = {}
             body_chunks = []
             async def send_wrapper(message):
                 if message['type'] == 'http.response.start':
-                    started['status'] = message['status']
-                    # Copy headers
-                    started['headers'] = [(k, v) for k, v in message.get('headers', [])]
-                elif message['type'] == 'http.response.body':
+                    headers = list(message.get('headers', []))
+                    ctype = b"".join(v for k, v in headers if k.lower() == b'content-type')
+                    if message['status'] == 200 and b'text/html' in ctype:
+                        started['headers'] = headers
+                    else:
+                        await send(message)
+                elif message['type'] == 'http.response.body' and 'headers' in started:
                     body_chunks.append(message.get('body', b''))
-                    if not message.get('more_body'):
-                        status = started.get('status', 200)
-                        headers = started.get('headers', [])
-                        ctype = b"".join([v for k, v in headers if k.lower() == b'content-type'])
-                        data = b"".join(body_chunks)
-                        if status == 200 and b'text/html' in ctype and b'<body' in data.lower():
-                            try:
-                                txt = data.decode('utf-8', errors='ignore')
-                                # Inject CSS link
-                                if '</head>' in txt:
-                                    css_tag = (
-                                        '<link rel="stylesheet" href="/static/app.css">'
-                                        '<style>body{color:#222;background:#fff;} a{color:#0072BC;}</style>'
-                                    )
-                                    txt = txt.replace('</head>', css_tag + '</head>', 1)
-                                # Inject header nav after <body>
-                                header = """
-<header class="topbar"><div class="topbar-inner">
-  <a class="brand" href="/dashboard">BIB</a>
-  <nav id="nav-links" class="links"></nav>
-</div></header>
-<div style="height:56px"></div>
-<script>
-(async function(){
-  const el = document.getElementById('nav-links');
-  if (!el) return;
-  function set(h){ el.innerHTML = h; }
-  try {
-    const r = await fetch('/api/me');
-    if (!r.ok) throw 0;
-    const me = await r.json();
-    if (me && me.username) {
-      const rr = (me.role || ' ').toLowerCase().replace('_',' ');
-      const canDash = ['team leader','manager','group head','administrator','superadmin'].includes(rr);
-      const isAdmin = rr === 'superadmin' || rr === 'administrator';
-      set(
-        (canDash ? '<a href="/dashboard">Dashboard</a>' : '') +
-        '<a href="/inspection-form">Form Inspeksi</a>' +
-        '<a href="/inspections">Daftar Inspeksi</a>' +
-        (isAdmin ? '<a href="/admin/manage">Admin</a><a href="/admin/import">Import</a>' : '') +
-        '<span class="sep"></span>' +
-        '<a href="/account">Akun</a>' +
-        '<span class="who">' + me.username + ' (' + me.role + ')</span>' +
-        '<a href="/logout">Keluar</a>'
-      );
-    } else {
-      set('<a href="/">Login</a>');
-    }
-  } catch(e) {
-    set('<a href="/">Login</a>');
-  }
-})();
-</script>
-"""
-                                lower = txt.lower()
-                                idx = lower.find('<body')
-                                if idx != -1:
-                                    # Find end of opening body tag
-                                    end = lower.find('>', idx)
-                                    if end != -1:
-                                        end += 1
-                                        txt = txt[:end] + header + txt[end:]
-                                data = txt.encode('utf-8')
-                                # Ensure content-length matches
-                                new_headers = []
-                                for k, v in headers:
-                                    if k.lower() == b'content-length':
-                                        continue
-                                    new_headers.append((k, v))
-                                new_headers.append((b'content-length', str(len(data)).encode()))
-                                await send({ 'type':'http.response.start', 'status': status, 'headers': new_headers })
-                                await send({ 'type':'http.response.body', 'body': data, 'more_body': False })
-                                return
-                            except Exception:
-                                # Fall through to original
-                                pass
-                        # Default passthrough
-                        await send({ 'type':'http.response.start', 'status': status, 'headers': headers })
-                        await send({ 'type':'http.response.body', 'body': data, 'more_body': False })
+                    if message.get('more_body'):
                         return
-                    else:
-                        # wait for more
-                        pass
+                    data = b"".join(body_chunks)
+                    page = self._split(data)
+                    if page is None:
+                        headers = [(k, v) for k, v in started['headers'] if k.lower() != b'content-length']
+                        headers.append((b'content-length', str(len(data)).encode()))
+                        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+                        await send({'type': 'http.response.body', 'body': data, 'more_body': False})
+                        return
+                    if is_index:
+                        self._index = page
+                    await self._send_page(scope, send, page, links, started['headers'])
                 else:
                     await send(message)
 
             return await self.inner(new_scope, receive, send_wrapper)
 
-    # Mount proxy at /dashboard that forwards to internal /dashapp
-    _dash_asgi = WSGIMiddleware(dash_app.server)
+        def _split(self, data: bytes):
+            """(digest, head, tail, fetched_at) of a Dash HTML page, or None if it has no <body>.
+
+            The topbar goes between head and tail; the splice is done once per
+            distinct page, i.e. once per Dash build.
+            """
+            css = _DASH_CSS.format(css=asset_url('app.css'))
+            digest = hashlib.blake2b(data + css.encode(), digest_size=12).hexdigest()
+            hit = self._pages.get(digest)
+            if hit is None:
+                txt = data.decode('utf-8', errors='ignore')
+                if '</head>' in txt:
+                    txt = txt.replace('</head>', css + '</head>', 1)
+                lower = txt.lower()
+                end = lower.find('>', lower.find('<body')) if '<body' in lower else -1
+                if end == -1:
+                    return None
+                if len(self._pages) >= 8:
+                    self._pages.clear()
+                hit = self._pages[digest] = (digest, txt[:end + 1].encode('utf-8'), txt[end + 1:].encode('utf-8'))
+            return (*hit, time.monotonic())
+
+        async def _send_page(self, scope, send, page, links: str, headers):
+            digest, head, tail, _ = page
+            etag = f'"{digest}-{hashlib.blake2b(links.encode(), digest_size=6).hexdigest()}"'.encode()
+            headers = [(k, v) for k, v in headers
+                       if k.lower() not in (b'content-length', b'etag', b'cache-control')]
+            headers += [(b'etag', etag), (b'cache-control', b'private, no-cache')]
+            inm = StarletteRequest(scope).headers.get('if-none-match', '')
+            if etag.decode() in [t.strip() for t in inm.split(',')]:
+                await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                return
+            body = head + _DASH_TOPBAR.format(links=links).encode('utf-8') + tail
+            headers.append((b'content-length', str(len(body)).encode()))
+            await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+    # Mount proxy at /dashboard that forwards to internal /dashapp; in worker
+    # mode both relay to the Dash processes. Either way dashboard requests
+    # share one concurrency budget, apart from the API threadpool.
+    if DASH_MODE == "worker":
+        _dash_inner = WorkerForward(DASH_WORKER_URL, strip_prefix="/dashapp")
+    else:
+        _dash_inner = WSGIMiddleware(dash_app.server)
+    _dash_asgi = ConcurrencyLimit(_dash_inner, DASH_MAX_CONCURRENCY, DASH_QUEUE_TIMEOUT_SEC)
     app.mount("/dashboard", _DashProxy(_dash_asgi, src_prefix="/dashboard", dst_prefix="/dashapp"))
     # Also mount /dashapp for asset URLs referenced by Dash HTML
     app.mount("/dashapp", _dash_asgi)
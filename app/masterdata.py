@@ -0,0 +1,228 @@
+# app/masterdata.py
+"""In-process cache of the small, rarely changing master tables.
+
+Lokasi, area, item and terminal rows are loaded once into immutable
+indexes (id -> record, parent -> children) and served from memory. Any
+session flush that touches those tables bumps the ``master_version`` row
+in the same transaction; this process drops its snapshot on commit, and
+other worker processes notice the new version on their next check.
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from . import models
+
+# How long a snapshot is trusted before re-reading the version row. Writes made
+# by this process invalidate immediately; writes from other workers show up
+# within this window.
+CHECK_INTERVAL_SEC = 1.0
+
+_WATCHED = (models.Lokasi, models.Area, models.Item, models.Terminal)
+
+
+class LokasiRec(NamedTuple):
+    id_lokasi: int
+    nama_lokasi: str
+    latitude: Optional[float]
+    longitude: Optional[float]
+    radius_m: Optional[int]
+    polygon: Optional[tuple[tuple[float, float], ...]]
+
+
+class AreaRec(NamedTuple):
+    id_area: int
+    id_lokasi: int
+    nama_area: str
+
+
+class ItemRec(NamedTuple):
+    id_item: int
+    id_area: int
+    nama_item: str
+
+
+class TerminalRec(NamedTuple):
+    id: int
+    name: str
+    form_schema: Optional[dict]
+
+
+class Snapshot:
+    def __init__(self, version: Optional[int], lokasi, areas, items, terminals):
+        self.version = version
+        # Lists arrive ordered by name (terminals by id), matching the API ordering
+        self.lokasi_sorted: tuple[LokasiRec, ...] = tuple(lokasi)
+        self.lokasi: dict[int, LokasiRec] = {r.id_lokasi: r for r in lokasi}
+        self.lokasi_by_name: dict[str, LokasiRec] = {r.nama_lokasi: r for r in lokasi}
+        self.areas: dict[int, AreaRec] = {r.id_area: r for r in areas}
+        self.items: dict[int, ItemRec] = {r.id_item: r for r in items}
+        self.terminals_sorted: tuple[TerminalRec, ...] = tuple(terminals)
+        self.terminals: dict[int, TerminalRec] = {t.id: t for t in terminals}
+
+        areas_by_lokasi: dict[int, list] = {}
+        for a in areas:
+            areas_by_lokasi.setdefault(a.id_lokasi, []).append(a)
+        items_by_area: dict[int, list] = {}
+        for it in items:
+            items_by_area.setdefault(it.id_area, []).append(it)
+        self.areas_by_lokasi: dict[int, tuple[AreaRec, ...]] = {k: tuple(v) for k, v in areas_by_lokasi.items()}
+        self.items_by_area: dict[int, tuple[ItemRec, ...]] = {k: tuple(v) for k, v in items_by_area.items()}
+        self.items_by_lokasi: dict[int, tuple[ItemRec, ...]] = {}
+        for lid, lok_areas in self.areas_by_lokasi.items():
+            merged = [it for a in lok_areas for it in self.items_by_area.get(a.id_area, ())]
+            merged.sort(key=lambda it: it.nama_item)
+            self.items_by_lokasi[lid] = tuple(merged)
+
+        self._bundle: Optional[tuple[bytes, str]] = None
+
+    def lokasi_of_item(self, item_id: int) -> Optional[LokasiRec]:
+        it = self.items.get(item_id)
+        area = self.areas.get(it.id_area) if it else None
+        return self.lokasi.get(area.id_lokasi) if area else None
+
+    def form_bundle(self) -> tuple[bytes, str]:
+        """Compact JSON body and ETag for /api/form-bundle, built once per snapshot."""
+        if self._bundle is None:
+            payload = {
+                "terminals": [{"id": t.id, "name": t.name, "form_schema": t.form_schema} for t in self.terminals_sorted],
+                "lokasi": [
+                    {
+                        "id_lokasi": r.id_lokasi,
+                        "nama_lokasi": r.nama_lokasi,
+                        "latitude": r.latitude,
+                        "longitude": r.longitude,
+                        "radius_m": r.radius_m,
+                        "polygon": r.polygon,
+                        "areas": [
+                            {
+                                "id_area": a.id_area,
+                                "nama_area": a.nama_area,
+                                "items": [
+                                    {"id_item": it.id_item, "nama_item": it.nama_item}
+                                    for it in self.items_by_area.get(a.id_area, ())
+                                ],
+                            }
+                            for a in self.areas_by_lokasi.get(r.id_lokasi, ())
+                        ],
+                    }
+                    for r in self.lokasi_sorted
+                ],
+            }
+            body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            self._bundle = (body, '"' + hashlib.sha1(body).hexdigest()[:20] + '"')
+        return self._bundle
+
+
+_lock = threading.Lock()
+_snapshot: Optional[Snapshot] = None
+_checked_at = 0.0
+_invalidations = 0  # bumped by invalidate()
+_loaded_at = -1     # _invalidations as of the current snapshot
+
+
+def _read_version(db: Session) -> Optional[int]:
+    try:
+        return db.execute(text("SELECT version FROM master_version WHERE id = 1")).scalar()
+    except Exception:
+        # Table not created yet (startup has not run); never trust the cache
+        return None
+
+
+def _polygon(raw) -> Optional[tuple[tuple[float, float], ...]]:
+    try:
+        pts = tuple((float(p[0]), float(p[1])) for p in raw or ())
+    except (TypeError, ValueError, IndexError):
+        return None
+    return pts if len(pts) >= 3 else None
+
+
+def _load(db: Session, version: Optional[int]) -> Snapshot:
+    lokasi = [
+        LokasiRec(r.id_lokasi, r.nama_lokasi, r.latitude, r.longitude, r.radius_m, _polygon(r.polygon))
+        for r in db.query(models.Lokasi).order_by(models.Lokasi.nama_lokasi.asc()).all()
+    ]
+    areas = [
+        AreaRec(r.id_area, r.id_lokasi, r.nama_area)
+        for r in db.query(models.Area).order_by(models.Area.nama_area.asc()).all()
+    ]
+    items = [
+        ItemRec(r.id_item, r.id_area, r.nama_item)
+        for r in db.query(models.Item).order_by(models.Item.nama_item.asc()).all()
+    ]
+    terminals = [
+        TerminalRec(t.id, t.name, t.form_schema)
+        for t in db.query(models.Terminal).order_by(models.Terminal.id.asc()).all()
+    ]
+    return Snapshot(version, lokasi, areas, items, terminals)
+
+
+def get_snapshot() -> Snapshot:
+    """Current master data, reloaded only when the version row has moved."""
+    global _snapshot, _checked_at, _loaded_at
+    snap = _snapshot
+    now = time.monotonic()
+    if (snap is not None and _loaded_at == _invalidations and snap.version is not None
+            and now - _checked_at < CHECK_INTERVAL_SEC):
+        return snap
+    with _lock:
+        db = SessionLocal()
+        try:
+            # Counted before loading: a write racing the load, or a failed
+            # load, leaves the snapshot stale; meanwhile other threads wait
+            # here instead of serving the old one
+            seen = _invalidations
+            version = _read_version(db)
+            snap = _snapshot
+            if snap is None or _loaded_at != seen or version is None or version != snap.version:
+                snap = _load(db, version)
+                _snapshot = snap
+            _loaded_at = seen
+            _checked_at = time.monotonic()
+            return snap
+        finally:
+            db.close()
+
+
+def invalidate() -> None:
+    global _invalidations
+    _invalidations += 1
+
+
+def bump_version(db: Session) -> None:
+    """Advance the shared version inside the caller's transaction.
+
+    A failed bump fails the flush: committing the master data change
+    without it would leave other workers serving their old snapshot.
+    """
+    db.connection().execute(text("UPDATE master_version SET version = version + 1 WHERE id = 1"))
+    db.info["masterdata_changed"] = True
+
+
+def ensure_version_row(conn) -> None:
+    conn.execute(text("INSERT OR IGNORE INTO master_version (id, version) VALUES (1, 0)"))
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, _WATCHED):
+            bump_version(session)
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    if session.info.pop("masterdata_changed", False):
+        invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("masterdata_changed", None)
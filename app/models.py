@@ -1,5 +1,6 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, CheckConstraint, Float
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, CheckConstraint, Float, Index, Computed
+from sqlalchemy.orm import deferred
 from datetime import datetime, timedelta
 from .database import Base
 
@@ -19,12 +20,33 @@ class Terminal(Base):
     # bisa tambahkan kolom latitude/longitude kalau perlu nanti
     form_schema = Column(JSON)  # simpan struktur form inspeksi per terminal
 
+def _data_field(key: str) -> str:
+    # Imported rows keep their columns under data.row, form submissions under data.fields
+    return (
+        f"CASE WHEN json_type(data, '$.row') = 'object' "
+        f"THEN json_extract(data, '$.row.{key}') ELSE json_extract(data, '$.fields.{key}') END"
+    )
+
+
 class Inspection(Base):
     __tablename__ = "inspections"
     id           = Column(Integer, primary_key=True, index=True)
     terminal_id  = Column(Integer, ForeignKey("terminals.id"), nullable=False)
     inspector_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     data         = Column(JSON)  # hasil inspeksi dalam bentuk JSON
+    # Virtual generated columns over commonly filtered JSON paths (SQLite JSON1).
+    # Deferred so plain loads never select them; they exist to be indexed.
+    data_lokasi  = deferred(Column(String, Computed(_data_field("Lokasi"), persisted=False)))
+    data_area    = deferred(Column(String, Computed(_data_field("Area"), persisted=False)))
+    data_item    = deferred(Column(String, Computed(_data_field("Item_Cek_ID"), persisted=False)))
+    data_lat     = deferred(Column(Float, Computed("json_extract(data, '$.lat')", persisted=False)))
+    data_lon     = deferred(Column(Float, Computed("json_extract(data, '$.lon')", persisted=False)))
+    __table_args__ = (
+        Index("ix_inspections_terminal_id", "terminal_id"),
+        Index("ix_inspections_data_lokasi_area", "data_lokasi", "data_area"),
+        Index("ix_inspections_data_item", "data_item"),
+        Index("ix_inspections_data_latlon", "data_lat", "data_lon"),
+    )
 
 class PasswordReset(Base):
     __tablename__ = "password_resets"
@@ -42,6 +64,8 @@ class Lokasi(Base):
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
     radius_m = Column(Integer, nullable=True, default=200)
+    # Optional polygon geofence [[lat, lon], ...]; takes precedence over the circle
+    polygon = Column(JSON, nullable=True)
 
 
 class MasterUser(Base):
@@ -73,14 +97,188 @@ class Item(Base):
     nama_item = Column(String(255), nullable=False)
 
 
+class InspeksiHeader(Base):
+    # One row per submitted checklist: everything its item lines share
+    __tablename__ = "inspeksi_header"
+    id_header = Column(Integer, primary_key=True, autoincrement=True)
+    ts_utc = Column(String(32), nullable=False)  # ISO UTC string
+    user_id = Column(Integer, ForeignKey("master_users.id_user"), nullable=False)
+    lokasi_id = Column(Integer, ForeignKey("lokasi.id_lokasi"))
+    area_id = Column(Integer, ForeignKey("area.id_area"))
+    shift_code = Column(Integer, ForeignKey("shift_dict.code"))
+    latitude = Column(Float)
+    longitude = Column(Float)
+    # Written by the geofence audit (app/geo_audit.py); NULL = not audited yet
+    geo_flag = Column(String(16))
+    geo_distance_m = Column(Float)
+    # Operational day and calendar shift, stamped at write time (app/shift_calendar.py)
+    local_day = Column(String(10))
+    shift_slot = Column(String(16))
+    __table_args__ = (
+        Index("ix_inspeksi_header_ts", "ts_utc"),
+        Index("ix_inspeksi_header_geo_flag", "geo_flag"),
+        Index("ix_inspeksi_header_local_day", "local_day", "shift_slot"),
+    )
+
+
+class InspeksiLine(Base):
+    # One row per checked item; ids continue the old inspeksi.id_inspeksi
+    __tablename__ = "inspeksi_line"
+    id_inspeksi = Column(Integer, primary_key=True, autoincrement=True)
+    id_header = Column(Integer, ForeignKey("inspeksi_header.id_header"), nullable=False)
+    item_id = Column(Integer, ForeignKey("item.id_item"), nullable=False)
+    status_code = Column(Integer, ForeignKey("status_dict.code"), nullable=False)
+    catatan = Column(String(1024))  # NULL when there is no note (shown as '-')
+    # Assigned by triggers on every insert/update (app/changefeed.py); the
+    # cursor of /api/inspeksi/changes
+    change_seq = Column(Integer)
+    __table_args__ = (
+        Index("ix_inspeksi_line_header", "id_header"),
+        Index("ix_inspeksi_line_item", "item_id"),
+        Index("ix_inspeksi_line_change_seq", "change_seq", unique=True),
+    )
+
+
+class StatusDict(Base):
+    __tablename__ = "status_dict"
+    code = Column(Integer, primary_key=True)
+    label = Column(String(50), nullable=False, unique=True)
+
+
+class ShiftDict(Base):
+    __tablename__ = "shift_dict"
+    code = Column(Integer, primary_key=True)
+    label = Column(String(16), nullable=False, unique=True)
+
+
+class ItemLatestStatus(Base):
+    # Latest result per item, upserted by a trigger on inspeksi_line (app/item_status.py)
+    __tablename__ = "item_latest_status"
+    item_id = Column(Integer, ForeignKey("item.id_item"), primary_key=True)
+    id_inspeksi = Column(Integer, nullable=False)
+    status_code = Column(Integer, ForeignKey("status_dict.code"), nullable=False)
+    ts_utc = Column(String(32), nullable=False)
+    user_id = Column(Integer, ForeignKey("master_users.id_user"), nullable=False)
+    rusak_since = Column(String(32))  # start of the current run of Rusak results; NULL when not Rusak
+
+
+class ShiftCoverage(Base):
+    # First inspection of each item per shift, kept by a trigger (app/coverage.py)
+    __tablename__ = "shift_coverage"
+    shift_key = Column(String(24), primary_key=True)  # "YYYY-MM-DD/Pagi"
+    item_id = Column(Integer, primary_key=True)
+    first_ts = Column(String(32), nullable=False)
+    __table_args__ = {"sqlite_with_rowid": False}
+
+
+class OfficerShiftRollup(Base):
+    # Per officer/day/shift/lokasi counters, kept by triggers (app/officer_rollup.py)
+    __tablename__ = "officer_shift_rollup"
+    user_id = Column(Integer, primary_key=True)
+    local_day = Column(String(10), primary_key=True)  # WIB operational day
+    shift = Column(String(16), primary_key=True)
+    lokasi_id = Column(Integer, primary_key=True)     # 0 when unknown
+    checklists = Column(Integer, nullable=False, default=0)
+    items = Column(Integer, nullable=False, default=0)
+    rusak = Column(Integer, nullable=False, default=0)
+    first_ts = Column(String(32), nullable=False)
+    last_ts = Column(String(32), nullable=False)
+    __table_args__ = (
+        Index("ix_officer_shift_rollup_day", "local_day"),
+        {"sqlite_with_rowid": False},
+    )
+
+
+class SeriesRollup(Base):
+    # Line counts per time bucket at h/d/w/m resolution, kept by a trigger (app/series_rollup.py)
+    __tablename__ = "series_rollup"
+    res = Column(String(1), primary_key=True)
+    bucket = Column(String(13), primary_key=True)  # period start: YYYY-MM-DD or YYYY-MM-DDTHH
+    lokasi_id = Column(Integer, primary_key=True)  # 0 when unknown
+    shift = Column(String(16), primary_key=True)   # '' when not given
+    total = Column(Integer, nullable=False, default=0)
+    bagus = Column(Integer, nullable=False, default=0)
+    rusak = Column(Integer, nullable=False, default=0)
+    __table_args__ = {"sqlite_with_rowid": False}
+
+
+class ItemDayRollup(Base):
+    # Checks and Rusak results per item per operational day (app/trends.py)
+    __tablename__ = "item_day_rollup"
+    local_day = Column(String(10), primary_key=True)
+    item_id = Column(Integer, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    rusak = Column(Integer, nullable=False, default=0)
+    seq = Column(Integer, nullable=False, default=0)  # change counter at the last update
+    __table_args__ = (
+        Index("ix_item_day_rollup_seq", "seq"),
+        {"sqlite_with_rowid": False},
+    )
+
+
 class InspeksiTx(Base):
+    # Read-only compatibility view over inspeksi_line + inspeksi_header with
+    # status/shift decoded (app/inspeksi_store.py). Write through the store.
     __tablename__ = "inspeksi"
-    id_inspeksi = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    __table_args__ = {"info": {"is_view": True}}
+    id_inspeksi = Column(Integer, primary_key=True)
     ts_utc = Column(String(32), nullable=False)  # ISO UTC string
     user_id = Column(Integer, ForeignKey("master_users.id_user"), nullable=False)
     item_id = Column(Integer, ForeignKey("item.id_item"), nullable=False)
     status = Column(String(50), nullable=False)
     catatan = Column(String(1024))
-    latitude = Column(JSON)  # allow null or numeric; use JSON to keep simple
-    longitude = Column(JSON)
+    latitude = Column(Float)
+    longitude = Column(Float)
     shift = Column(String(16))
+    geo_flag = Column(String(16))
+    geo_distance_m = Column(Float)
+    change_seq = Column(Integer)
+    id_header = Column(Integer)
+    local_day = Column(String(10))
+    shift_slot = Column(String(16))
+
+
+class AppMeta(Base):
+    # Small key/value store for schema-level settings (e.g. shift calendar fingerprint)
+    __tablename__ = "app_meta"
+    name = Column(String(64), primary_key=True)
+    value = Column(String(255))
+
+
+class ChangeCounter(Base):
+    # Last change_seq handed out per change-tracked table
+    __tablename__ = "change_counters"
+    name = Column(String(64), primary_key=True)
+    seq  = Column(Integer, nullable=False, default=0)
+
+
+class MasterVersion(Base):
+    # Single-row counter bumped by every write to lokasi/area/item/terminals,
+    # so each worker process can tell when its master-data cache is stale.
+    __tablename__ = "master_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class FieldValue(Base):
+    # Distinct values seen per terminal form field, maintained on write so the
+    # options endpoint is an index range read instead of a JSON scan.
+    __tablename__ = "field_values"
+    terminal_id = Column(Integer, ForeignKey("terminals.id"), primary_key=True)
+    field_name  = Column(String(100), primary_key=True)
+    value       = Column(String(255), primary_key=True)
+    last_seen   = Column(String(32), nullable=False)  # ISO UTC string
+    __table_args__ = (
+        Index("ix_field_values_recent", "terminal_id", "field_name", "last_seen"),
+    )
+
+
+class SyncReceipt(Base):
+    # One row per offline submission accepted by /api/inspections/sync; the
+    # primary key lookup is what makes replays of a queued batch idempotent.
+    # Keys are scoped per user, so another user's key never matches.
+    __tablename__ = "sync_receipts"
+    user_id     = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    client_key  = Column(String(64), primary_key=True)
+    received_at = Column(String(32), nullable=False)  # ISO UTC string
+    created     = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,133 @@
+# app/officer_rollup.py
+"""Per-officer productivity rollups by operational day, shift and lokasi.
+
+``officer_shift_rollup`` holds one row per (officer, local day, shift,
+lokasi) with checklist, item and Rusak counts and the first/last inspection
+time. Triggers on ``inspeksi_header`` (checklists, time span) and
+``inspeksi_line`` (items, Rusak) keep it current in the same transaction as
+each insert, so a year of history is a few thousand rows per officer and a
+report never touches the inspection tables. Day and shift are the headers'
+calendar stamps (``shift_calendar``).
+"""
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from . import masterdata
+
+GROUPS = ("day", "shift", "lokasi")  # optional breakdowns besides the officer
+
+_KEY = "H.user_id, H.local_day, H.shift_slot, COALESCE(H.lokasi_id, 0)"
+_COLS = "user_id, local_day, shift, lokasi_id"
+
+_HEADER_TRIGGER = f"""
+CREATE TRIGGER trg_officer_rollup_header AFTER INSERT ON inspeksi_header BEGIN
+  INSERT INTO officer_shift_rollup ({_COLS}, checklists, items, rusak, first_ts, last_ts)
+  SELECT {_KEY}, 1, 0, 0, H.ts_utc, H.ts_utc
+  FROM inspeksi_header H WHERE H.id_header = NEW.id_header AND H.local_day IS NOT NULL
+  ON CONFLICT ({_COLS}) DO UPDATE SET
+    checklists = checklists + 1,
+    first_ts = MIN(first_ts, excluded.first_ts),
+    last_ts = MAX(last_ts, excluded.last_ts);
+END
+"""
+
+_LINE_TRIGGER = f"""
+CREATE TRIGGER trg_officer_rollup_line AFTER INSERT ON inspeksi_line BEGIN
+  UPDATE officer_shift_rollup SET
+    items = items + 1,
+    rusak = rusak + ((SELECT lower(label) FROM status_dict WHERE code = NEW.status_code) = 'rusak')
+  WHERE ({_COLS}) = (SELECT {_KEY} FROM inspeksi_header H WHERE H.id_header = NEW.id_header);
+END
+"""
+
+_BACKFILL = f"""
+INSERT INTO officer_shift_rollup ({_COLS}, checklists, items, rusak, first_ts, last_ts)
+SELECT {_KEY} AS k, COUNT(*), SUM(C.items), SUM(C.rusak), MIN(H.ts_utc), MAX(H.ts_utc)
+FROM inspeksi_header H
+JOIN (
+  SELECT L.id_header, COUNT(*) AS items, SUM(lower(S.label) = 'rusak') AS rusak
+  FROM inspeksi_line L JOIN status_dict S ON S.code = L.status_code
+  GROUP BY L.id_header
+) C ON C.id_header = H.id_header
+WHERE H.local_day IS NOT NULL
+GROUP BY 1, 2, 3, 4
+"""
+
+
+def install(conn: Connection) -> None:
+    """(Re)create the triggers; fill the table from history if it is empty."""
+    for name, sql in (("trg_officer_rollup_header", _HEADER_TRIGGER), ("trg_officer_rollup_line", _LINE_TRIGGER)):
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        conn.execute(text(sql))
+    if conn.execute(text("SELECT 1 FROM officer_shift_rollup LIMIT 1")).first() is None:
+        conn.execute(text(_BACKFILL))
+
+
+def report(
+    db: Session,
+    start: date,
+    end: date,
+    group_by: tuple[str, ...] = (),
+    lokasi_ids: Optional[list[int]] = None,
+    shift: Optional[str] = None,
+) -> list[dict]:
+    """Officer totals over operational days ``start``..``end`` (inclusive).
+
+    ``group_by`` adds any of ``GROUPS`` to the officer key. ``avg_item_gap_s``
+    is the first-to-last span of each shift spread over its items; items of
+    one checklist share a timestamp, so it is an estimate of pace, not a
+    measured interval.
+    """
+    cols = {"day": "R.local_day", "shift": "R.shift", "lokasi": "R.lokasi_id"}
+    extra = [cols[g] for g in GROUPS if g in group_by]
+    where = ["R.local_day BETWEEN :start AND :end"]
+    params: dict = {"start": start.isoformat(), "end": end.isoformat()}
+    if shift:
+        where.append("R.shift = :shift")
+        params["shift"] = shift
+    if lokasi_ids:
+        names = [f"lok{i}" for i in range(len(lokasi_ids))]
+        where.append(f"R.lokasi_id IN ({', '.join(':' + n for n in names)})")
+        params.update(zip(names, lokasi_ids))
+    keys = ", ".join(["R.user_id"] + extra)
+    rows = db.execute(text(
+        f"""
+        SELECT {keys}, MU.nama_lengkap,
+               SUM(R.checklists), SUM(R.items), SUM(R.rusak),
+               COUNT(DISTINCT R.local_day || '/' || R.shift),
+               MIN(R.first_ts), MAX(R.last_ts),
+               SUM(CASE WHEN R.items > 1 THEN (julianday(R.last_ts) - julianday(R.first_ts)) * 86400 END),
+               SUM(CASE WHEN R.items > 1 THEN R.items - 1 END)
+        FROM officer_shift_rollup R
+        LEFT JOIN master_users MU ON MU.id_user = R.user_id
+        WHERE {' AND '.join(where)}
+        GROUP BY {keys}
+        ORDER BY SUM(R.items) DESC, {keys}
+        """
+    ), params).all()
+    snap = masterdata.get_snapshot()
+    out = []
+    for r in rows:
+        group = dict(zip([g for g in GROUPS if g in group_by], r[1:1 + len(extra)]))
+        name, checklists, items, rusak, shifts, first_ts, last_ts, span, gaps = r[1 + len(extra):]
+        rec = {"id_user": r[0], "nama_lengkap": name}
+        if "lokasi" in group:
+            lok = snap.lokasi.get(group.pop("lokasi"))
+            group["lokasi"] = {"id_lokasi": lok.id_lokasi, "nama_lokasi": lok.nama_lokasi} if lok else None
+        rec.update(group)
+        rec.update({
+            "checklists": int(checklists),
+            "items": int(items),
+            "rusak": int(rusak),
+            "shifts": int(shifts),
+            "items_per_shift": round(items / shifts, 1) if shifts else None,
+            "first_ts": first_ts,
+            "last_ts": last_ts,
+            "avg_item_gap_s": round(span / gaps, 1) if gaps else None,
+        })
+        out.append(rec)
+    return out
@@ -7,7 +7,7 @@ from passlib.context import CryptContext
 import pandas as pd
 import io, secrets, time, os
 
-from .. import models
+from .. import models, field_values, geo_audit, ingest, inspeksi_store
 from ..deps import get_db, require_superadmin    # <- dari deps
 from ..settings import templates                 # <- dari settings
 from ..schemas import UserCreate, UserUpdate, TerminalCreate, TerminalUpdate, MasterUserCreate, MasterUserUpdate
@@ -157,8 +157,10 @@ def commit_import(
             pass
 
     inserted = 0
+    terminal_id = term.id  # read here: the writer thread must not touch the request Session
     if (insert_rows or "").lower() in ("1", "true", "yes", "on"):
         limit = min(len(rows), 1000)
+        new_rows = []
         for r in rows[:limit]:
             inspector_id = default_inspector.id
             if inspector_username_col:
@@ -169,15 +171,20 @@ def commit_import(
                         found = db.query(models.User).filter(models.User.username == uname).first()
                         if found:
                             inspector_id = found.id
-            rec = models.Inspection(terminal_id=term.id, inspector_id=inspector_id, data={"row": r})
-            db.add(rec)
-            inserted += 1
-        db.commit()
+            new_rows.append({"terminal_id": terminal_id, "inspector_id": inspector_id, "data": {"row": r}})
+        dict_rows = [r for r in rows[:limit] if isinstance(r, dict)]
+
+        def write(conn):
+            ids = ingest.insert_returning(conn, models.Inspection.__table__, new_rows)
+            field_values.record(conn, terminal_id, dict_rows)
+            return ids
+
+        inserted = len(ingest.get_writer().run(write, len(new_rows)))
 
     # one-time use token
     IMPORT_CACHE.pop(token, None)
 
-    return {"message": "ok", "terminal_id": term.id, "inserted_rows": inserted}
+    return {"message": "ok", "terminal_id": terminal_id, "inserted_rows": inserted}
 
 # Users CRUD (prefix becomes /api/admin/...)
 @router.get("/admin/users")
@@ -475,6 +482,22 @@ def db_summary(db: Session = Depends(get_db), _: models.User = Depends(require_s
     }
 
 
+@router.post("/admin/geofence-audit")
+def geofence_audit(
+    recheck: bool = False,
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_superadmin),
+):
+    """Flag inspeksi rows recorded inside/outside their lokasi geofence."""
+    return geo_audit.run(db, recheck=recheck)
+
+
+@router.get("/admin/geofence-audit")
+def geofence_audit_summary(db: Session = Depends(get_db), _: models.User = Depends(require_superadmin)):
+    rows = db.execute(text("SELECT geo_flag, COUNT(*) FROM inspeksi GROUP BY geo_flag")).fetchall()
+    return {"flags": {(flag or "unchecked"): int(c) for flag, c in rows}}
+
+
 # ===== Normalize legacy inspections into master tables =====
 @router.post("/admin/normalize-inspections")
 def normalize_inspections(
@@ -487,10 +510,18 @@ def normalize_inspections(
     _: models.User = Depends(require_superadmin),
 ):
     """Merge legacy inspections (JSON rows) into master Lokasi/Area/Item and optional transactions."""
+    # Read only the indexed generated columns; rows missing any key are skipped in SQL
+    Insp = models.Inspection
+    total_inspections = db.query(Insp).filter(Insp.terminal_id == terminal_id).count()
     inspections = (
-        db.query(models.Inspection)
-        .filter(models.Inspection.terminal_id == terminal_id)
-        .order_by(models.Inspection.id.asc())
+        db.query(Insp.data_lokasi, Insp.data_area, Insp.data_item)
+        .filter(
+            Insp.terminal_id == terminal_id,
+            Insp.data_lokasi.isnot(None),
+            Insp.data_area.isnot(None),
+            Insp.data_item.isnot(None),
+        )
+        .order_by(Insp.id.asc())
         .all()
     )
     created_lokasi = created_area = created_item = created_tx = 0
@@ -507,21 +538,12 @@ def normalize_inspections(
 
     from datetime import datetime, timezone
 
-    for ins in inspections:
-        payload = ins.data or {}
-        row = {}
-        if isinstance(payload, dict):
-            if isinstance(payload.get("row"), dict):
-                row = payload.get("row")
-            elif isinstance(payload.get("fields"), dict):
-                row = payload.get("fields")
-        if not isinstance(row, dict):
-            continue
-
-        lokasi_name = str(row.get("Lokasi") or "").strip()
+    ts = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    checklists: dict[tuple[int, int], list[dict]] = {}  # (id_lokasi, id_area) -> lines
+    for lokasi_raw, area_raw, item_raw in inspections:
+        lokasi_name = str(lokasi_raw or "").strip()
         # Expect human-readable area name from 'Area' and item id from 'Item_Cek_ID'
-        area_name = str(row.get("Area") or "").strip()
-        item_raw = row.get("Item_Cek_ID")
+        area_name = str(area_raw or "").strip()
         item_str = str(item_raw or "").strip()
         if not lokasi_name or not area_name or not item_str:
             continue
@@ -558,20 +580,24 @@ def normalize_inspections(
                 db.add(item); db.commit(); db.refresh(item); created_item += 1
 
         if create_transactions and master_user:
-            ts = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
-            tx = models.InspeksiTx(
-                ts_utc=ts,
-                user_id=master_user.id_user,
-                item_id=item.id_item,
-                status=default_status,
-                catatan='-',
-                latitude=None,
-                longitude=None,
-                shift=default_shift,
-            )
-            db.add(tx); created_tx += 1
+            item_area = area if item.id_area == area.id_area else db.get(models.Area, item.id_area)
+            key = (item_area.id_lokasi, item_area.id_area)
+            checklists.setdefault(key, []).append({"item_id": item.id_item, "status": default_status})
+            created_tx += 1
     db.commit()
 
+    if checklists:
+        # One checklist header per lokasi/area, written through the ingest writer
+        def write(conn):
+            for (lokasi_id, area_id), lines in checklists.items():
+                header = dict(
+                    ts_utc=ts, user_id=master_user.id_user, lokasi_id=lokasi_id, area_id=area_id,
+                    shift=default_shift, latitude=None, longitude=None,
+                )
+                inspeksi_store.write_checklist(conn, header, lines)
+
+        ingest.get_writer().run(write, created_tx + len(checklists))
+
     return {
         "terminal_id": terminal_id,
         "created": {
@@ -580,5 +606,5 @@ def normalize_inspections(
             "item": created_item,
             "transactions": created_tx,
         },
-        "total_inspections_processed": len(inspections),
+        "total_inspections_processed": total_inspections,
     }
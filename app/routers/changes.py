@@ -0,0 +1,50 @@
+import json
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from .. import models, changefeed
+from ..deps import get_db, require_dashboard_access
+
+router = APIRouter()
+
+NDJSON = "application/x-ndjson"
+
+
+@router.get("/inspeksi/changes")
+def list_changes(
+    request: Request,
+    after: int = Query(0, ge=0, description="change_seq terakhir yang sudah diterima"),
+    limit: int = Query(500, ge=1, le=100000),
+    format: str | None = Query(None, pattern="^(json|ndjson)$"),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_dashboard_access),
+):
+    """Inspeksi rows inserted or updated after a cursor, oldest change first.
+
+    JSON responses are capped at 1000 rows. NDJSON (``format=ndjson`` or
+    ``Accept: application/x-ndjson``) streams up to ``limit`` rows, one record
+    per line, followed by a final ``{"next_cursor": ..., "has_more": ...}`` line.
+    """
+    wants_ndjson = format == "ndjson" or (format is None and NDJSON in (request.headers.get("accept") or ""))
+    if not wants_ndjson:
+        page = changefeed.fetch(db, after, min(limit, 1000) + 1)
+        has_more = len(page) > min(limit, 1000)
+        page = page[:min(limit, 1000)]
+        return {
+            "changes": page,
+            "next_cursor": page[-1]["change_seq"] if page else after,
+            "has_more": has_more,
+        }
+
+    def lines():
+        cursor, sent = after, 0
+        for page, cursor in changefeed.iter_pages(SessionLocal, after, limit):
+            sent += len(page)
+            yield "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in page)
+        # A full limit may have stopped exactly at the end; the next call is cheap either way
+        yield json.dumps({"next_cursor": cursor, "has_more": sent >= limit}) + "\n"
+
+    return StreamingResponse(lines(), media_type=NDJSON)
@@ -0,0 +1,31 @@
+from datetime import date, datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from .. import models, coverage
+from ..deps import get_db, require_dashboard_access
+
+router = APIRouter()
+
+
+@router.get("/coverage/shift")
+def shift_coverage(
+    day: date | None = Query(None, description="Tanggal operasional (YYYY-MM-DD); default shift berjalan"),
+    shift: str | None = Query(None, description="Pagi, Siang, atau Malam"),
+    lokasi_id: list[int] | None = Query(None),
+    area_id: int | None = Query(None),
+    missing_limit: int = Query(500, ge=0, le=10000),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_dashboard_access),
+):
+    """Items covered and still missing in one shift, per area."""
+    current = coverage.shift_at(datetime.now(timezone.utc))
+    if day is None and shift is None:
+        target = current
+    else:
+        try:
+            target = coverage.get_shift(day or date.fromisoformat(current.day), shift or current.label)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Shift tidak valid") from None
+    return coverage.report(db, target, lokasi_ids=lokasi_id, area_id=area_id, missing_limit=missing_limit)
@@ -1,14 +1,24 @@
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 import asyncio
 from fastapi import APIRouter, WebSocket, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import func, or_
 
 from ..deps import get_db, require_dashboard_access
-from .. import models
+from .. import models, geo_audit, officer_rollup, series_rollup, trends
+from ..shift_calendar import CALENDAR
 
 router = APIRouter()
 
+GEO_FILTER_DESC = "Filter geofence: inside, outside, no_coords, no_fence, unchecked"
+
+
+def _geo_filter(q, geo: str | None):
+    try:
+        return geo_audit.filter_query(q, geo)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Filter geofence tidak valid") from None
+
 
 @router.websocket("/ws/dashboard")
 async def websocket_dashboard(websocket: WebSocket):
@@ -21,24 +31,29 @@ async def websocket_dashboard(websocket: WebSocket):
 
 @router.get("/dashboard/summary")
 def dashboard_summary(
+    geo: str | None = Query(None, description=GEO_FILTER_DESC),
     db: Session = Depends(get_db),
     _: models.User = Depends(require_dashboard_access),
 ):
-    total = db.query(models.InspeksiTx).count()
-    bagus = db.query(models.InspeksiTx).filter(models.InspeksiTx.status == 'Bagus').count()
-    rusak = db.query(models.InspeksiTx).filter(models.InspeksiTx.status == 'Rusak').count()
+    q_tx = _geo_filter(db.query(models.InspeksiTx), geo)
+    total = q_tx.count()
+    bagus = q_tx.filter(models.InspeksiTx.status == 'Bagus').count()
+    rusak = q_tx.filter(models.InspeksiTx.status == 'Rusak').count()
 
     # Last 24h using lexicographic comparison on ISO string ts_utc
     cutoff = (datetime.now(timezone.utc) - timedelta(hours=24)).strftime('%Y-%m-%dT%H:%M:%SZ')
-    last24 = db.query(models.InspeksiTx).filter(models.InspeksiTx.ts_utc >= cutoff).count()
+    last24 = q_tx.filter(models.InspeksiTx.ts_utc >= cutoff).count()
 
     # Top lokasi by count
-    q_loc = (
+    q_loc = _geo_filter(
         db.query(models.Lokasi.nama_lokasi, func.count(models.InspeksiTx.id_inspeksi))
         .join(models.Area, models.Area.id_lokasi == models.Lokasi.id_lokasi)
         .join(models.Item, models.Item.id_area == models.Area.id_area)
-        .join(models.InspeksiTx, models.InspeksiTx.item_id == models.Item.id_item)
-        .group_by(models.Lokasi.id_lokasi)
+        .join(models.InspeksiTx, models.InspeksiTx.item_id == models.Item.id_item),
+        geo,
+    )
+    q_loc = (
+        q_loc.group_by(models.Lokasi.id_lokasi)
         .order_by(func.count(models.InspeksiTx.id_inspeksi).desc())
         .limit(10)
         .all()
@@ -46,11 +61,14 @@ def dashboard_summary(
     by_lokasi = [{"lokasi": n or "(tanpa nama)", "count": int(c)} for n, c in q_loc]
 
     # Worst items by Rusak
-    q_worst = (
+    q_worst = _geo_filter(
         db.query(models.Item.nama_item, func.count(models.InspeksiTx.id_inspeksi))
         .join(models.InspeksiTx, models.InspeksiTx.item_id == models.Item.id_item)
-        .filter(models.InspeksiTx.status == 'Rusak')
-        .group_by(models.Item.id_item)
+        .filter(models.InspeksiTx.status == 'Rusak'),
+        geo,
+    )
+    q_worst = (
+        q_worst.group_by(models.Item.id_item)
         .order_by(func.count(models.InspeksiTx.id_inspeksi).desc())
         .limit(10)
         .all()
@@ -67,16 +85,40 @@ def dashboard_summary(
 @router.get("/dashboard/series")
 def dashboard_series(
     days: int = Query(30, ge=1, le=365),
+    start: date | None = Query(None, description="Tanggal awal (YYYY-MM-DD); menggantikan days"),
+    end: date | None = Query(None, description="Tanggal akhir (YYYY-MM-DD); default hari ini"),
+    resolution: str | None = Query(None, pattern="^[hdwm]$", description="h, d, w, m; default dipilih dari rentang"),
+    geo: str | None = Query(None, description=GEO_FILTER_DESC),
     db: Session = Depends(get_db),
     _: models.User = Depends(require_dashboard_access),
 ):
-    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%SZ')
-    day_col = func.substr(models.InspeksiTx.ts_utc, 1, 10)
+    """Counts per time bucket; ``day`` is the bucket start.
+
+    Served from the pre-aggregated tiers in ``series_rollup``; the geofence
+    filter is not part of the rollup key, so with ``geo`` the series is
+    counted from raw rows per day.
+    """
+    end = end or CALENDAR.today()
+    start = start or end - timedelta(days=days - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="Rentang tanggal tidak valid")
+    if geo:
+        return _raw_series(db, start, end, geo)
+    res, points = series_rollup.series(db, start, end, resolution)
+    return {
+        "resolution": res,
+        "series": [{"day": p["bucket"], "total": p["total"], "bagus": p["bagus"], "rusak": p["rusak"]} for p in points],
+    }
 
-    day_labeled = day_col.label('day')
+
+def _raw_series(db: Session, start: date, end: date, geo: str):
+    day_labeled = models.InspeksiTx.local_day.label('day')
     rows = (
-        db.query(day_labeled, models.InspeksiTx.status, func.count(models.InspeksiTx.id_inspeksi))
-        .filter(models.InspeksiTx.ts_utc >= cutoff)
+        _geo_filter(
+            db.query(day_labeled, models.InspeksiTx.status, func.count(models.InspeksiTx.id_inspeksi))
+            .filter(models.InspeksiTx.local_day.between(start.isoformat(), end.isoformat())),
+            geo,
+        )
         .group_by(day_labeled, models.InspeksiTx.status)
         .order_by(day_labeled)
         .all()
@@ -95,7 +137,44 @@ def dashboard_series(
         {"day": k, "total": v["total"], "bagus": v["bagus"], "rusak": v["rusak"]}
         for k, v in sorted(data.items())
     ]
-    return {"series": series}
+    return {"resolution": "d", "series": series}
+
+
+OFFICER_MAX_DAYS = 366
+
+
+@router.get("/dashboard/officers")
+def dashboard_officers(
+    start: date | None = Query(None, description="Hari operasional awal (YYYY-MM-DD); default 30 hari terakhir"),
+    end: date | None = Query(None, description="Hari operasional akhir (YYYY-MM-DD); default hari ini"),
+    group_by: list[str] = Query([], description="Rincian tambahan: day, shift, lokasi"),
+    lokasi_id: list[int] | None = Query(None),
+    shift: str | None = Query(None),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_dashboard_access),
+):
+    """Inspections per officer from the incremental shift rollup."""
+    end = end or CALENDAR.today()
+    start = start or end - timedelta(days=29)
+    if start > end or (end - start).days >= OFFICER_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Rentang tanggal tidak valid (maksimal {OFFICER_MAX_DAYS} hari)")
+    unknown = set(group_by) - set(officer_rollup.GROUPS)
+    if unknown:
+        raise HTTPException(status_code=400, detail="group_by tidak valid")
+    rows = officer_rollup.report(db, start, end, tuple(group_by), lokasi_ids=lokasi_id, shift=shift)
+    return {"start": start.isoformat(), "end": end.isoformat(), "officers": rows}
+
+
+@router.get("/dashboard/trends")
+def dashboard_trends(
+    days: int = Query(90, ge=7, le=trends.HISTORY_DAYS, description="Panjang seri tren (hari operasional)"),
+    lokasi_id: list[int] | None = Query(None),
+    limit: int = Query(50, ge=1, le=1000, description="Jumlah item teratas (lonjakan dulu, lalu skor z)"),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_dashboard_access),
+):
+    """Rusak-rate trend, week-over-week change and spike flags per lokasi and item."""
+    return trends.report(db, days=days, lokasi_ids=lokasi_id, limit=limit)
 
 
 @router.get("/dashboard/master-users")
@@ -1,36 +1,39 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
 from fastapi import APIRouter, Request, Depends, HTTPException, status, Query, Path
-from geopy.distance import distance
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from ..deps import get_db, get_current_user
-from .. import models
-from ..schemas import InspectionCreate, InspectionResponse, BulkInspectionCreate
+from .. import models, masterdata, field_values, form_validation, geofence, geo_audit, ingest, inspeksi_store
+from ..schemas import InspectionCreate, InspectionResponse, BulkInspectionCreate, SyncRequest, SyncSubmission
 
 router = APIRouter()
 
 @router.post("/verify-location")
-async def verify_location(request: Request, db: Session = Depends(get_db)):
+async def verify_location(request: Request):
     data = await request.json()
     user_lat = float(data.get('lat'))
     user_lon = float(data.get('lon'))
     lokasi_id = data.get('lokasi_id')
     lokasi_name = data.get('lokasi_name')
 
+    snap = masterdata.get_snapshot()
     lok = None
     if lokasi_id:
-        lok = db.query(models.Lokasi).filter(models.Lokasi.id_lokasi == int(lokasi_id)).first()
+        lok = snap.lokasi.get(int(lokasi_id))
     elif lokasi_name:
-        lok = db.query(models.Lokasi).filter(models.Lokasi.nama_lokasi == str(lokasi_name)).first()
+        lok = snap.lokasi_by_name.get(str(lokasi_name))
 
     if not lok:
         return {"valid": False, "detail": "Lokasi tidak ditemukan"}
-    # Must check against None explicitly; 0.0 is a valid coordinate
-    if not (lok.latitude is not None and lok.longitude is not None and (lok.radius_m or 0) > 0):
+    if not geofence.has_geofence(lok):
         # If no geofence configured, treat as invalid to enforce config
         return {"valid": False, "detail": "Geofence belum dikonfigurasi untuk lokasi ini"}
 
-    dist_m = distance((user_lat, user_lon), (lok.latitude, lok.longitude)).meters
-    valid = dist_m <= (lok.radius_m or 0)
+    # Polygon fences report the distance to their boundary (0 inside)
+    valid, dist_m = geofence.get_index(snap).check(lok.id_lokasi, user_lat, user_lon)
     return {"valid": bool(valid), "distance_m": dist_m, "radius_m": lok.radius_m}
 
 
@@ -40,23 +43,29 @@ def create_inspection(
     db: Session = Depends(get_db),
     user: models.User = Depends(get_current_user),
 ):
-    term = db.query(models.Terminal).filter(models.Terminal.id == payload.terminal_id).first()
-    if not term:
+    validator = form_validation.get_validator(masterdata.get_snapshot(), payload.terminal_id)
+    if validator is None:
         raise HTTPException(status_code=404, detail="Terminal tidak ditemukan")
+    fields, errors = validator(payload.data or {})
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
 
-    record = models.Inspection(
-        terminal_id=payload.terminal_id,
-        inspector_id=user.id,
-        data={
+    row = {
+        "terminal_id": payload.terminal_id,
+        "inspector_id": user.id,
+        "data": {
             "lat": payload.lat,
             "lon": payload.lon,
-            "fields": payload.data or {},
+            "fields": fields,
         },
-    )
-    db.add(record)
-    db.commit()
-    db.refresh(record)
-    return InspectionResponse(id=record.id)
+    }
+
+    def write(conn):
+        (new_id,) = ingest.insert_returning(conn, models.Inspection.__table__, [row])
+        field_values.record(conn, payload.terminal_id, [fields])
+        return new_id
+
+    return InspectionResponse(id=ingest.get_writer().run(write))
 
 
 @router.post("/inspections/submit", response_model=InspectionResponse, status_code=status.HTTP_201_CREATED)
@@ -68,31 +77,25 @@ def create_inspection_alias(
     return create_inspection(payload, db, user)
 
 
-@router.post("/inspections/bulk-normalized")
-def create_bulk_normalized(
-    payload: BulkInspectionCreate,
-    db: Session = Depends(get_db),
-    user: models.User = Depends(get_current_user),
-):
-    # Verify lokasi exists and geofence
-    lok = db.query(models.Lokasi).filter(models.Lokasi.id_lokasi == payload.lokasi_id).first()
+def _check_lokasi(snap: masterdata.Snapshot, payload: BulkInspectionCreate) -> masterdata.LokasiRec:
+    lok = snap.lokasi.get(payload.lokasi_id)
     if not lok:
         raise HTTPException(status_code=404, detail="Lokasi tidak ditemukan")
-    # Must check against None explicitly; 0.0 is a valid coordinate
-    if not (lok.latitude is not None and lok.longitude is not None and (lok.radius_m or 0) > 0):
+    if not geofence.has_geofence(lok):
         raise HTTPException(status_code=400, detail="Geofence lokasi belum dikonfigurasi")
-    try:
-        d = distance((payload.lat, payload.lon), (lok.latitude, lok.longitude)).meters
-    except Exception:
+    if not (-90.0 <= payload.lat <= 90.0 and -180.0 <= payload.lon <= 180.0):
         raise HTTPException(status_code=400, detail="Koordinat tidak valid")
-    if d > (lok.radius_m or 0):
-        raise HTTPException(status_code=403, detail="Di luar jangkauan lokasi (geofence)")
+    return lok
 
-    # Verify area under lokasi
-    area = db.query(models.Area).filter(models.Area.id_area == payload.area_id).first()
+
+def _check_area(snap: masterdata.Snapshot, payload: BulkInspectionCreate, lok: masterdata.LokasiRec) -> masterdata.AreaRec:
+    area = snap.areas.get(payload.area_id)
     if not area or area.id_lokasi != lok.id_lokasi:
         raise HTTPException(status_code=400, detail="Area tidak valid untuk lokasi")
+    return area
+
 
+def _master_for(db: Session, user: models.User) -> models.MasterUser:
     # Resolve master user for current auth user
     master = db.query(models.MasterUser).filter(models.MasterUser.nama_lengkap == user.username).first()
     if not master:
@@ -100,13 +103,21 @@ def create_bulk_normalized(
         if not master:
             master = models.MasterUser(email='admin@local', nama_lengkap='Administrator', departemen='Umum', role='administrator')
             db.add(master); db.commit(); db.refresh(master)
+    return master
 
-    # Insert transactions
-    from datetime import datetime, timezone
-    ts = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
-    created = 0
+
+def _checklist(
+    snap: masterdata.Snapshot,
+    payload: BulkInspectionCreate,
+    area: masterdata.AreaRec,
+    master_id: int,
+    ts: str,
+    dist_m: float,
+) -> tuple[dict, list[dict]]:
+    """(header, lines) for inspeksi_store.write_checklist."""
+    lines = []
     for it in payload.items:
-        item = db.query(models.Item).filter(models.Item.id_item == it.item_id).first()
+        item = snap.items.get(it.item_id)
         if not item:
             continue
         if item.id_area != area.id_area:
@@ -114,19 +125,164 @@ def create_bulk_normalized(
         st = (it.status or '').strip() or 'Bagus'
         if st.lower() == 'rusak' and not (it.catatan and it.catatan.strip()):
             raise HTTPException(status_code=400, detail="Keterangan wajib untuk status Rusak")
-        tx = models.InspeksiTx(
-            ts_utc=ts,
-            user_id=master.id_user,
+        lines.append(dict(
             item_id=item.id_item,
             status=st,
-            catatan=(it.catatan or '-') if st.lower() == 'rusak' else '-',
-            latitude=payload.lat,
-            longitude=payload.lon,
-            shift=payload.shift,
+            catatan=it.catatan if st.lower() == 'rusak' else None,
+        ))
+    header = dict(
+        ts_utc=ts,
+        user_id=master_id,
+        lokasi_id=area.id_lokasi,
+        area_id=area.id_area,
+        shift=payload.shift,
+        latitude=payload.lat,
+        longitude=payload.lon,
+        geo_flag=geo_audit.GEO_INSIDE,
+        geo_distance_m=round(dist_m, 2),
+    )
+    return header, lines
+
+
+@router.post("/inspections/bulk-normalized")
+def create_bulk_normalized(
+    payload: BulkInspectionCreate,
+    db: Session = Depends(get_db),
+    user: models.User = Depends(get_current_user),
+):
+    snap = masterdata.get_snapshot()
+    # Verify lokasi exists and geofence
+    lok = _check_lokasi(snap, payload)
+    inside, dist_m = geofence.get_index(snap).check(lok.id_lokasi, payload.lat, payload.lon)
+    if not inside:
+        raise HTTPException(status_code=403, detail="Di luar jangkauan lokasi (geofence)")
+    # Verify area under lokasi
+    area = _check_area(snap, payload, lok)
+
+    master = _master_for(db, user)
+    ts = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    header, lines = _checklist(snap, payload, area, master.id_user, ts, dist_m)
+    ids = ingest.get_writer().run(
+        lambda conn: inspeksi_store.write_checklist(conn, header, lines), len(lines) + 1
+    )
+    return {"message": "ok", "created": len(ids)}
+
+
+SYNC_MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+
+def _capture_ts(captured_at: str | None, now: datetime) -> str:
+    if not captured_at:
+        return now.strftime('%Y-%m-%dT%H:%M:%SZ')
+    try:
+        raw = captured_at.strip()
+        # Python 3.10's fromisoformat does not take the "Z" that toISOString() emits
+        dt = datetime.fromisoformat(raw[:-1] + "+00:00" if raw.endswith(("Z", "z")) else raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="captured_at tidak valid") from None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    dt = dt.astimezone(timezone.utc)
+    if dt > now + SYNC_MAX_CLOCK_SKEW:
+        raise HTTPException(status_code=400, detail="captured_at berada di masa depan")
+    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _apply_sync(db: Session, user: models.User, subs: list[SyncSubmission]) -> list[dict]:
+    snap = masterdata.get_snapshot()
+    now = datetime.now(timezone.utc)
+    results: list[dict] = [{} for _ in subs]
+
+    # Keys this user already sent in an earlier request (one PK range lookup)
+    keys = {s.client_key for s in subs}
+    done = dict(
+        db.query(models.SyncReceipt.client_key, models.SyncReceipt.created)
+        .filter(models.SyncReceipt.user_id == user.id, models.SyncReceipt.client_key.in_(keys))
+        .all()
+    )
+    first_in_batch: dict[str, int] = {}
+    pending = []  # (index, submission, lokasi, area, ts)
+    for i, sub in enumerate(subs):
+        key = sub.client_key
+        if key in done:
+            results[i] = {"client_key": key, "status": "duplicate", "created": done[key]}
+            continue
+        if key in first_in_batch:
+            results[i] = {"client_key": key, "status": "duplicate", "duplicate_of": first_in_batch[key]}
+            continue
+        first_in_batch[key] = i
+        try:
+            lok = _check_lokasi(snap, sub)
+            area = _check_area(snap, sub, lok)
+            ts = _capture_ts(sub.captured_at, now)
+        except HTTPException as e:
+            results[i] = {"client_key": key, "status": "rejected", "detail": e.detail}
+            continue
+        pending.append((i, sub, lok, area, ts))
+
+    if pending:
+        # Geofence check for the whole batch in one vectorized pass
+        flags, dist = geo_audit.classify(
+            geofence.get_index(snap),
+            np.array([p[2].id_lokasi for p in pending], dtype=np.intp),
+            np.array([p[1].lat for p in pending], dtype=np.float64),
+            np.array([p[1].lon for p in pending], dtype=np.float64),
         )
-        db.add(tx); created += 1
-    db.commit()
-    return {"message": "ok", "created": created}
+        master_id = _master_for(db, user).id_user
+        received_at = now.strftime('%Y-%m-%dT%H:%M:%SZ')
+        checklists, receipts = [], []
+        for (i, sub, lok, area, ts), flag, d in zip(pending, flags, dist):
+            if flag != geo_audit.GEO_INSIDE:
+                results[i] = {"client_key": sub.client_key, "status": "rejected", "detail": "Di luar jangkauan lokasi (geofence)"}
+                continue
+            try:
+                header, lines = _checklist(snap, sub, area, master_id, ts, float(d))
+            except HTTPException as e:
+                results[i] = {"client_key": sub.client_key, "status": "rejected", "detail": e.detail}
+                continue
+            checklists.append((header, lines))
+            receipts.append({"client_key": sub.client_key, "user_id": user.id, "received_at": received_at, "created": len(lines)})
+            results[i] = {"client_key": sub.client_key, "status": "created", "created": len(lines)}
+
+        if receipts:
+            def write(conn):
+                for header, lines in checklists:
+                    inspeksi_store.write_checklist(conn, header, lines)
+                conn.execute(models.SyncReceipt.__table__.insert(), receipts)
+
+            rows = sum(len(lines) + 1 for _, lines in checklists)
+            ingest.get_writer().run(write, rows + len(receipts))
+
+    # In-batch repeats report what their first occurrence did
+    for r in results:
+        j = r.pop("duplicate_of", None)
+        if j is not None:
+            r["created"] = results[j].get("created", 0) if results[j]["status"] == "created" else 0
+    return results
+
+
+@router.post("/inspections/sync")
+def sync_inspections(
+    payload: SyncRequest,
+    db: Session = Depends(get_db),
+    user: models.User = Depends(get_current_user),
+):
+    """Apply a queued batch of offline checklists in one writer job (one transaction).
+
+    Each submission carries a client-generated key; replaying a batch (or
+    part of it) reports the already-stored submissions as duplicates
+    instead of inserting them again.
+    """
+    try:
+        results = _apply_sync(db, user, payload.submissions)
+    except IntegrityError:
+        # A concurrent replay stored some of these keys first; rerun so they
+        # come back as duplicates
+        results = _apply_sync(db, user, payload.submissions)
+    return {
+        "results": results,
+        "created": sum(r.get("created", 0) for r in results if r["status"] == "created"),
+    }
 
 
 @router.get("/inspections")
@@ -136,10 +292,33 @@ def list_inspections(
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
     terminal_id: int | None = Query(None),
+    lokasi: str | None = Query(None, description="Nilai data Lokasi"),
+    area: str | None = Query(None, description="Nilai data Area"),
+    item: str | None = Query(None, description="Nilai data Item_Cek_ID"),
+    lat_min: float | None = Query(None),
+    lat_max: float | None = Query(None),
+    lon_min: float | None = Query(None),
+    lon_max: float | None = Query(None),
 ):
-    q = db.query(models.Inspection)
+    # Predicates on JSON fields hit the indexed generated columns, not Python
+    Insp = models.Inspection
+    q = db.query(Insp)
     if terminal_id:
-        q = q.filter(models.Inspection.terminal_id == terminal_id)
+        q = q.filter(Insp.terminal_id == terminal_id)
+    if lokasi is not None:
+        q = q.filter(Insp.data_lokasi == lokasi)
+    if area is not None:
+        q = q.filter(Insp.data_area == area)
+    if item is not None:
+        q = q.filter(Insp.data_item == item)
+    if lat_min is not None:
+        q = q.filter(Insp.data_lat >= lat_min)
+    if lat_max is not None:
+        q = q.filter(Insp.data_lat <= lat_max)
+    if lon_min is not None:
+        q = q.filter(Insp.data_lon >= lon_min)
+    if lon_max is not None:
+        q = q.filter(Insp.data_lon <= lon_max)
     items = q.offset(offset).limit(limit).all()
 
     # Enrich with related names
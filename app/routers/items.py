@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from .. import models, item_status
+from ..deps import get_db, require_dashboard_access
+
+router = APIRouter()
+
+
+@router.get("/items/status")
+def list_item_status(
+    lokasi_id: int | None = Query(None),
+    area_id: int | None = Query(None),
+    status: str | None = Query(None, description="Bagus, Rusak, atau '-' untuk item yang belum pernah diinspeksi"),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_dashboard_access),
+):
+    """Current condition of every item: last status, time, officer and open-Rusak-since."""
+    rows = item_status.board(db, lokasi_id=lokasi_id, area_id=area_id, status=status)
+    return {"counts": item_status.counts(rows), "items": rows}
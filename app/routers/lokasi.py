@@ -1,25 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.orm import Session
 
 from ..database import SessionLocal
-from .. import models
+from .. import models, masterdata, geofence
 from ..deps import get_db, get_current_user, require_superadmin
+from ..schemas import LokasiPolygon
 
 router = APIRouter()
 
 
 @router.get("/lokasi")
-def list_lokasi(db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
-    rows = db.query(models.Lokasi).order_by(models.Lokasi.nama_lokasi.asc()).all()
+def list_lokasi(_: models.User = Depends(get_current_user)):
+    return [r._asdict() for r in masterdata.get_snapshot().lokasi_sorted]
+
+
+@router.get("/lokasi/nearest")
+def nearest_lokasi(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    limit: int = Query(5, ge=1, le=50),
+    _: models.User = Depends(get_current_user),
+):
+    # Geofences containing the point first, then the closest others
+    matches = geofence.get_index(masterdata.get_snapshot()).nearest(lat, lon, limit)
     return [
         {
-            "id_lokasi": r.id_lokasi,
-            "nama_lokasi": r.nama_lokasi,
-            "latitude": r.latitude,
-            "longitude": r.longitude,
-            "radius_m": r.radius_m,
+            "id_lokasi": m.lokasi.id_lokasi,
+            "nama_lokasi": m.lokasi.nama_lokasi,
+            "distance_m": m.distance_m,
+            "radius_m": m.lokasi.radius_m,
+            "inside": m.inside,
         }
-        for r in rows
+        for m in matches
     ]
 
 
@@ -59,6 +71,23 @@ def update_lokasi(id_lokasi: int, nama_lokasi: str | None = None, latitude: floa
     return {"id_lokasi": row.id_lokasi, "nama_lokasi": row.nama_lokasi, "latitude": row.latitude, "longitude": row.longitude, "radius_m": row.radius_m}
 
 
+@router.put("/lokasi/{id_lokasi}/polygon")
+def set_lokasi_polygon(id_lokasi: int, payload: LokasiPolygon, db: Session = Depends(get_db), _: models.User = Depends(require_superadmin)):
+    row = db.query(models.Lokasi).filter(models.Lokasi.id_lokasi == id_lokasi).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Lokasi tidak ditemukan")
+    pts = payload.polygon
+    if pts is not None:
+        if len(pts) < 3 or any(len(p) != 2 for p in pts):
+            raise HTTPException(status_code=400, detail="Polygon minimal 3 titik [lat, lon]")
+        if any(not (-90 <= p[0] <= 90 and -180 <= p[1] <= 180) for p in pts):
+            raise HTTPException(status_code=400, detail="Koordinat polygon tidak valid")
+        pts = [[float(p[0]), float(p[1])] for p in pts]
+    row.polygon = pts
+    db.commit()
+    return {"id_lokasi": row.id_lokasi, "nama_lokasi": row.nama_lokasi, "polygon": row.polygon}
+
+
 @router.delete("/lokasi/{id_lokasi}")
 def delete_lokasi(id_lokasi: int, db: Session = Depends(get_db), _: models.User = Depends(require_superadmin)):
     row = db.query(models.Lokasi).filter(models.Lokasi.id_lokasi == id_lokasi).first()
@@ -70,25 +99,31 @@ def delete_lokasi(id_lokasi: int, db: Session = Depends(get_db), _: models.User
 
 
 @router.get("/lokasi/{id_lokasi}/areas")
-def list_areas(id_lokasi: int, db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
-    rows = db.query(models.Area).filter(models.Area.id_lokasi == id_lokasi).order_by(models.Area.nama_area.asc()).all()
+def list_areas(id_lokasi: int, _: models.User = Depends(get_current_user)):
+    rows = masterdata.get_snapshot().areas_by_lokasi.get(id_lokasi, ())
     return [{"id_area": r.id_area, "nama_area": r.nama_area} for r in rows]
 
 
 @router.get("/lokasi/{id_lokasi}/items")
-def list_items_by_lokasi(id_lokasi: int, db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
-    # Items under a lokasi via join
-    rows = (
-        db.query(models.Item)
-        .join(models.Area, models.Item.id_area == models.Area.id_area)
-        .filter(models.Area.id_lokasi == id_lokasi)
-        .order_by(models.Item.nama_item.asc())
-        .all()
-    )
+def list_items_by_lokasi(id_lokasi: int, _: models.User = Depends(get_current_user)):
+    rows = masterdata.get_snapshot().items_by_lokasi.get(id_lokasi, ())
     return [{"id_item": r.id_item, "nama_item": r.nama_item} for r in rows]
 
 
 @router.get("/area/{id_area}/items")
-def list_items(id_area: int, db: Session = Depends(get_db), _: models.User = Depends(get_current_user)):
-    rows = db.query(models.Item).filter(models.Item.id_area == id_area).order_by(models.Item.nama_item.asc()).all()
+def list_items(id_area: int, _: models.User = Depends(get_current_user)):
+    rows = masterdata.get_snapshot().items_by_area.get(id_area, ())
     return [{"id_item": r.id_item, "nama_item": r.nama_item} for r in rows]
+
+
+@router.get("/form-bundle")
+def form_bundle(request: Request, _: models.User = Depends(get_current_user)):
+    # Everything the inspection form needs in a single round trip. The ETag is a
+    # hash of the master data, so clients revalidate with If-None-Match and get a
+    # bodyless 304 until an admin changes lokasi/area/item/terminal rows.
+    body, etag = masterdata.get_snapshot().form_bundle()
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    inm = request.headers.get("if-none-match") or ""
+    if etag in [t.strip().removeprefix("W/") for t in inm.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,8 +1,8 @@
 # app/routers/terminals.py
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
-from .. import models
+from typing import List, Optional
+from .. import models, masterdata, field_values
 from ..database import SessionLocal
 from ..deps import get_current_user
 
@@ -18,14 +18,13 @@ def get_db():
 
 # GET /api/terminals → daftar terminal
 @router.get("/terminals")
-def list_terminals(db: Session = Depends(get_db)):
-    terminals = db.query(models.Terminal).all()
-    return [{"id": t.id, "name": t.name} for t in terminals]
+def list_terminals():
+    return [{"id": t.id, "name": t.name} for t in masterdata.get_snapshot().terminals_sorted]
 
 # GET /api/terminals/{id} → detail terminal + schema
 @router.get("/terminals/{terminal_id}")
-def get_terminal(terminal_id: int, db: Session = Depends(get_db)):
-    term = db.query(models.Terminal).filter(models.Terminal.id == terminal_id).first()
+def get_terminal(terminal_id: int):
+    term = masterdata.get_snapshot().terminals.get(terminal_id)
     if not term:
         raise HTTPException(status_code=404, detail="Terminal tidak ditemukan")
     return {
@@ -40,68 +39,46 @@ def get_field_options(
     terminal_id: int,
     field: List[str] = Query(..., description="Nama field, ulangi parameter untuk beberapa field"),
     limit: int = Query(200, ge=1, le=1000),
+    q: Optional[str] = Query(None, description="Awalan nilai untuk pencarian (type-ahead)"),
     db: Session = Depends(get_db),
     _: models.User = Depends(get_current_user),
 ):
-    term = db.query(models.Terminal).filter(models.Terminal.id == terminal_id).first()
-    if not term:
+    snap = masterdata.get_snapshot()
+    if terminal_id not in snap.terminals:
         raise HTTPException(status_code=404, detail="Terminal tidak ditemukan")
 
     wanted = [f for f in field if isinstance(f, str) and f.strip()]
     if not wanted:
         raise HTTPException(status_code=400, detail="Parameter field diperlukan")
+    prefix = q or None
 
     out = {f: [] for f in wanted}
     seen = {f: set() for f in wanted}
 
-    # First, serve known master data if requested
-    if "Lokasi" in wanted or "ID_Lokasi" in wanted:
-        loks = (
-            db.query(models.Lokasi)
-            .order_by(models.Lokasi.nama_lokasi.asc())
-            .limit(limit)
-            .all()
-        )
-        if "Lokasi" in wanted:
-            for row in loks:
-                name = row.nama_lokasi
-                if name not in seen["Lokasi"] and len(out["Lokasi"]) < limit:
-                    seen["Lokasi"].add(name)
-                    out["Lokasi"].append(name)
-        if "ID_Lokasi" in wanted:
-            for row in loks:
-                sid = str(row.id_lokasi)
-                if sid not in seen["ID_Lokasi"] and len(out["ID_Lokasi"]) < limit:
-                    seen["ID_Lokasi"].add(sid)
-                    out["ID_Lokasi"].append(sid)
+    def add(fname: str, sval: str):
+        if prefix and not sval.startswith(prefix):
+            return
+        if sval not in seen[fname] and len(out[fname]) < limit:
+            seen[fname].add(sval)
+            out[fname].append(sval)
 
-    # Pull recent inspections and aggregate unique values from data.row and data.fields (fallback)
+    # First, serve known master data if requested
+    if "Lokasi" in wanted:
+        for row in snap.lokasi_sorted:
+            add("Lokasi", row.nama_lokasi)
+    if "ID_Lokasi" in wanted:
+        for row in snap.lokasi_sorted:
+            add("ID_Lokasi", str(row.id_lokasi))
     if "Item_Cek_ID" in wanted:
-        items = db.query(models.Item).order_by(models.Item.id_item.asc()).limit(limit).all()
-        for it in items:
-            sid = str(it.id_item)
-            if sid not in seen["Item_Cek_ID"] and len(out["Item_Cek_ID"]) < limit:
-                seen["Item_Cek_ID"].add(sid)
-                out["Item_Cek_ID"].append(sid)
-    q = db.query(models.Inspection).filter(models.Inspection.terminal_id == terminal_id)
-    # Iterate a reasonable number to avoid heavy scans
-    for ins in q.order_by(models.Inspection.id.desc()).limit(5000).all():
-        data = ins.data or {}
-        row = data.get("row") if isinstance(data, dict) else None
-        fields_map = data.get("fields") if isinstance(data, dict) else None
-        for fname in wanted:
-            if len(out[fname]) >= limit:
-                continue
-            val = None
-            if isinstance(row, dict) and fname in row:
-                val = row.get(fname)
-            elif isinstance(fields_map, dict) and fname in fields_map:
-                val = fields_map.get(fname)
-            if val is None:
-                continue
-            sval = str(val)
-            if sval not in seen[fname]:
-                seen[fname].add(sval)
-                out[fname].append(sval)
+        for item_id in sorted(snap.items):
+            add("Item_Cek_ID", str(item_id))
+
+    # Then values seen in submitted/imported inspections (indexed range read)
+    for fname in wanted:
+        remaining = limit - len(out[fname])
+        if remaining <= 0:
+            continue
+        for sval in field_values.lookup(db, terminal_id, fname, prefix, remaining + len(seen[fname])):
+            add(fname, sval)
 
     return out
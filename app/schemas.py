@@ -63,6 +63,17 @@ class BulkInspectionCreate(BaseModel):
     items: List[BulkItem]
 
 
+class SyncSubmission(BulkInspectionCreate):
+    # Generated on the device when the checklist is queued; retries reuse it
+    client_key: str = Field(min_length=8, max_length=64)
+    # Original capture time (ISO 8601); server time when omitted
+    captured_at: Optional[str] = None
+
+
+class SyncRequest(BaseModel):
+    submissions: List[SyncSubmission] = Field(max_length=500)
+
+
 class MasterUserBase(BaseModel):
     email: str
     nama_lengkap: str
@@ -79,3 +90,8 @@ class MasterUserUpdate(BaseModel):
     nama_lengkap: Optional[str] = None
     departemen: Optional[str] = None
     role: Optional[str] = None
+
+
+class LokasiPolygon(BaseModel):
+    # [[lat, lon], ...] with at least 3 vertices; null clears the polygon
+    polygon: Optional[List[List[float]]] = None
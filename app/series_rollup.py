@@ -0,0 +1,208 @@
+# app/series_rollup.py
+"""Pre-aggregated inspection counts at hourly, daily, weekly and monthly
+resolution for the dashboard time series.
+
+``series_rollup`` holds total/Bagus/Rusak counts per (resolution, bucket,
+lokasi, shift). A trigger on ``inspeksi_line`` adds every inserted line to
+all four tiers in the insert transaction, so late-arriving submissions land
+in the right buckets without any rebuild. ``series`` picks the coarsest tier
+that still gives a useful number of points for the requested range and
+reads only that tier (plus daily rows for partially covered weeks/months at
+the range edges), so a multi-year chart is a read of a few hundred rows.
+
+Buckets are labelled by the start of the period: ``YYYY-MM-DDTHH`` for
+hours, ``YYYY-MM-DD`` for days, weeks (starting Monday) and months. Days,
+weeks and months are operational days (the header's ``local_day`` stamp, see
+``shift_calendar``); hours are stored as UTC hours and relabelled to local
+time when read, so a timezone change never splits an hour bucket.
+"""
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .shift_calendar import CALENDAR
+
+RESOLUTIONS = ("h", "d", "w", "m")
+MAX_HOURLY_DAYS = 3    # ranges up to this use hourly buckets
+MAX_DAILY_DAYS = 120   # then daily, up to this
+MAX_WEEKLY_DAYS = 1100  # then weekly (~3 years), monthly beyond
+
+
+def bucket_sql(res: str, ts: str) -> str:
+    """SQL for the bucket label of an ISO timestamp or YYYY-MM-DD column."""
+    return {
+        "h": f"substr({ts}, 1, 13)",
+        "d": f"substr({ts}, 1, 10)",
+        "w": f"date({ts}, 'weekday 0', '-6 days')",
+        "m": f"substr({ts}, 1, 7) || '-01'",
+    }[res]
+
+
+def _header_bucket(res: str) -> str:
+    # Hours from the UTC time, everything else from the operational day
+    return bucket_sql(res, "H.ts_utc" if res == "h" else "H.local_day")
+
+
+def _bucket_of(res: str, day: date) -> str:
+    if res == "w":
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if res == "m":
+        return day.replace(day=1).isoformat()
+    return day.isoformat()
+
+
+def _next_bucket(res: str, start: date) -> date:
+    if res == "w":
+        return start + timedelta(days=7)
+    if res == "m":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+_IS = "(SELECT lower(label) FROM status_dict WHERE code = NEW.status_code) = '{label}'"
+
+_TRIGGER = "CREATE TRIGGER trg_series_rollup AFTER INSERT ON inspeksi_line BEGIN\n" + "".join(
+    f"""
+  INSERT INTO series_rollup (res, bucket, lokasi_id, shift, total, bagus, rusak)
+  SELECT '{res}', {_header_bucket(res)}, COALESCE(H.lokasi_id, 0), COALESCE(SH.label, ''), 1,
+         {_IS.format(label="bagus")}, {_IS.format(label="rusak")}
+  FROM inspeksi_header H LEFT JOIN shift_dict SH ON SH.code = H.shift_code
+  WHERE H.id_header = NEW.id_header AND H.local_day IS NOT NULL
+  ON CONFLICT (res, bucket, lokasi_id, shift) DO UPDATE SET
+    total = total + 1, bagus = bagus + excluded.bagus, rusak = rusak + excluded.rusak;"""
+    for res in RESOLUTIONS
+) + "\nEND"
+
+_BACKFILL = """
+INSERT INTO series_rollup (res, bucket, lokasi_id, shift, total, bagus, rusak)
+SELECT '{res}', {bucket} AS b, COALESCE(H.lokasi_id, 0) AS lok, COALESCE(SH.label, '') AS sh, COUNT(*),
+       SUM(lower(S.label) = 'bagus'), SUM(lower(S.label) = 'rusak')
+FROM inspeksi_line L
+JOIN inspeksi_header H ON H.id_header = L.id_header
+JOIN status_dict S ON S.code = L.status_code
+LEFT JOIN shift_dict SH ON SH.code = H.shift_code
+WHERE H.local_day IS NOT NULL
+GROUP BY b, lok, sh
+"""
+
+
+def rebuild(conn: Connection) -> None:
+    conn.execute(text("DELETE FROM series_rollup"))
+    for res in RESOLUTIONS:
+        conn.execute(text(_BACKFILL.format(res=res, bucket=_header_bucket(res))))
+
+
+def install(conn: Connection) -> None:
+    """(Re)create the trigger; fill the table from history if it is empty."""
+    conn.execute(text("DROP TRIGGER IF EXISTS trg_series_rollup"))
+    conn.execute(text(_TRIGGER))
+    if conn.execute(text("SELECT 1 FROM series_rollup LIMIT 1")).first() is None:
+        rebuild(conn)
+
+
+def bucket_labels(res: str, start: date, end: date) -> list[str]:
+    """Every bucket label ``series`` can return for days ``start``..``end``, in order."""
+    if res == "h":
+        t = CALENDAR.day_start_utc(start).replace(minute=0, second=0, microsecond=0)
+        stop = CALENDAR.day_start_utc(end + timedelta(days=1))
+        out = []
+        while t < stop:
+            out.append(CALENDAR.local_hour(t.strftime("%Y-%m-%dT%H")))
+            t += timedelta(hours=1)
+        return out
+    b, out = date.fromisoformat(_bucket_of(res, start)), []
+    while b <= end:
+        out.append(b.isoformat())
+        b = _next_bucket(res, b)
+    return out
+
+
+def bucket_of(res: str, local_day: str, ts_utc: str) -> str:
+    """Label of the bucket a line with this operational day and UTC time falls in."""
+    if res == "h":
+        return CALENDAR.local_hour(ts_utc[:13])
+    return _bucket_of(res, date.fromisoformat(local_day))
+
+
+def pick_resolution(start: date, end: date) -> str:
+    days = (end - start).days + 1
+    if days <= MAX_HOURLY_DAYS:
+        return "h"
+    if days <= MAX_DAILY_DAYS:
+        return "d"
+    if days <= MAX_WEEKLY_DAYS:
+        return "w"
+    return "m"
+
+
+def _read(db: Session, res: str, lo: str, hi: str, lokasi_ids, shift, regroup: Optional[str] = None) -> list:
+    """(bucket, total, bagus, rusak) rows of tier ``res`` with lo <= bucket < hi.
+
+    ``regroup`` relabels the rows into that coarser tier's buckets.
+    """
+    where = ["res = :res", "bucket >= :lo", "bucket < :hi"]
+    params: dict = {"res": res, "lo": lo, "hi": hi}
+    if shift:
+        where.append("shift = :shift")
+        params["shift"] = shift
+    if lokasi_ids:
+        names = [f"lok{i}" for i in range(len(lokasi_ids))]
+        where.append(f"lokasi_id IN ({', '.join(':' + n for n in names)})")
+        params.update(zip(names, lokasi_ids))
+    label = bucket_sql(regroup, "bucket") if regroup else "bucket"
+    return db.execute(text(
+        f"SELECT {label} AS b, SUM(total), SUM(bagus), SUM(rusak) FROM series_rollup "
+        f"WHERE {' AND '.join(where)} GROUP BY b"
+    ), params).all()
+
+
+def series(
+    db: Session,
+    start: date,
+    end: date,
+    res: Optional[str] = None,
+    lokasi_ids: Optional[list[int]] = None,
+    shift: Optional[str] = None,
+) -> tuple[str, list[dict]]:
+    """(resolution, points) for days ``start``..``end`` inclusive.
+
+    Weeks/months cut by the range edges are summed from the daily tier, so
+    every point counts only days inside the range.
+    """
+    res = res or pick_resolution(start, end)
+    stop = end + timedelta(days=1)
+    if res == "h":
+        # UTC hours spanning the operational days, labelled in local time
+        lo, hi = (CALENDAR.day_start_utc(d).strftime("%Y-%m-%dT%H") for d in (start, stop))
+        rows = [(CALENDAR.local_hour(b), *rest) for b, *rest in _read(db, "h", lo, hi, lokasi_ids, shift)]
+    elif res == "d":
+        rows = _read(db, res, start.isoformat(), stop.isoformat(), lokasi_ids, shift)
+    else:
+        # Whole periods inside the range come from the tier itself
+        first_full = date.fromisoformat(_bucket_of(res, start))
+        if first_full < start:
+            first_full = _next_bucket(res, first_full)
+        last_full_end = date.fromisoformat(_bucket_of(res, stop))
+        rows = []
+        if first_full < last_full_end:
+            rows += _read(db, res, first_full.isoformat(), last_full_end.isoformat(), lokasi_ids, shift)
+            partial = [(start, first_full), (last_full_end, stop)]
+        else:
+            # No whole period in range: every day comes from the daily tier
+            partial = [(start, stop)]
+        for lo, hi in partial:
+            if lo < hi:
+                rows += _read(db, "d", lo.isoformat(), hi.isoformat(), lokasi_ids, shift, regroup=res)
+    merged: dict[str, list[int]] = {}
+    for b, total, bagus, rusak in rows:
+        acc = merged.setdefault(b, [0, 0, 0])
+        acc[0] += int(total or 0)
+        acc[1] += int(bagus or 0)
+        acc[2] += int(rusak or 0)
+    return res, [
+        {"bucket": b, "total": t, "bagus": g, "rusak": r}
+        for b, (t, g, r) in sorted(merged.items())
+    ]
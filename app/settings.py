@@ -29,4 +29,21 @@ ALLOWED_HOSTS = _env_list("ALLOWED_HOSTS", default=["*"])  # e.g. "example.com,.
 COOKIE_SECURE = _env_bool("COOKIE_SECURE", False)  # set True behind HTTPS
 ENABLE_HTTPS_REDIRECT = _env_bool("ENABLE_HTTPS_REDIRECT", False)
 
+# Operational calendar: inspections are grouped by the local day and shift they fall in
+OPERATIONAL_TZ = os.getenv("OPERATIONAL_TZ", "Asia/Jakarta")  # WIB
+SHIFT_CALENDAR = os.getenv("SHIFT_CALENDAR", "Pagi=07:00,Siang=15:00,Malam=23:00")  # first shift starts the day
+
+# Dash analytics: "inprocess" serves it from the API process; "worker" relays to
+# separate processes (python -m app.dash_worker, started by run.py)
+DASH_MODE = os.getenv("DASH_MODE", "inprocess").strip().lower()
+DASH_WORKER_URL = os.getenv("DASH_WORKER_URL", "http://127.0.0.1:8051")
+DASH_WORKERS = int(os.getenv("DASH_WORKERS", "2"))
+# Concurrency budgets: dashboard requests in flight vs. API threadpool size
+DASH_MAX_CONCURRENCY = int(os.getenv("DASH_MAX_CONCURRENCY", "4"))
+DASH_QUEUE_TIMEOUT_SEC = float(os.getenv("DASH_QUEUE_TIMEOUT_SEC", "15"))
+API_THREADS = int(os.getenv("API_THREADS", "40"))
+
+# Responses smaller than this go out uncompressed (app/compression.py)
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
 templates = Jinja2Templates(directory=str(BASE_DIR / "app" / "templates"))
@@ -0,0 +1,154 @@
+# app/shift_calendar.py
+"""Operational timezone and shift calendar.
+
+``SHIFT_CALENDAR`` lists shift start times in ``OPERATIONAL_TZ`` local time;
+each shift ends where the next begins and the first shift starts the
+operational day, so with the default calendar the Malam shift (23:00-07:00
+WIB) belongs to the day it started on. Every checklist header is stamped at
+write time with its operational ``local_day`` and calendar ``shift_slot``
+(``stamp``), and both are indexed, so grouping and date filters never
+convert timestamps per row in SQL. ``install`` restamps all headers when
+the calendar configuration changes and clears the tables derived from the
+stamps so they are rebuilt.
+"""
+import hashlib
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import NamedTuple, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from . import settings
+
+RESTAMP_CHUNK = 20000
+# Filled from the stamps; emptied on a calendar change so their installers refill them
+DERIVED_TABLES = ("shift_coverage", "officer_shift_rollup", "series_rollup", "item_day_rollup")
+
+
+class Shift(NamedTuple):
+    key: str          # "YYYY-MM-DD/Label"
+    day: str
+    label: str
+    start_utc: datetime
+    end_utc: datetime
+
+
+def _parse(spec: str) -> tuple[tuple[str, time], ...]:
+    shifts = []
+    for part in spec.split(","):
+        label, _, hhmm = part.partition("=")
+        h, _, m = hhmm.strip().partition(":")
+        shifts.append((label.strip(), time(int(h), int(m or 0))))
+    if not shifts or len({label for label, _ in shifts}) != len(shifts):
+        raise ValueError(f"SHIFT_CALENDAR tidak valid: {spec!r}")
+    return tuple(shifts)
+
+
+class ShiftCalendar:
+    def __init__(self, tz_name: str, spec: str):
+        self.tz = ZoneInfo(tz_name)
+        self.shifts = _parse(spec)
+        self.labels = tuple(label for label, _ in self.shifts)
+        self.fingerprint = hashlib.sha1(f"{tz_name}|{spec}".encode()).hexdigest()[:16]
+
+    def _starts(self, day: date) -> list[tuple[str, datetime]]:
+        # Local start of each shift of operational ``day``; a start earlier
+        # than the previous one is on the next calendar date
+        out, d, prev = [], day, None
+        for label, t in self.shifts:
+            if prev is not None and t <= prev:
+                d += timedelta(days=1)
+            out.append((label, datetime.combine(d, t)))
+            prev = t
+        return out
+
+    def _utc(self, local: datetime) -> datetime:
+        return local.replace(tzinfo=self.tz).astimezone(timezone.utc)
+
+    def locate(self, ts: datetime) -> tuple[date, str]:
+        """(operational day, shift label) of an aware datetime."""
+        local = ts.astimezone(self.tz).replace(tzinfo=None)
+        day = local.date()
+        if local.time() < self.shifts[0][1]:
+            day -= timedelta(days=1)
+        label = self.labels[0]
+        for name, start in self._starts(day):
+            if start <= local:
+                label = name
+        return day, label
+
+    def day_start_utc(self, day: date) -> datetime:
+        return self._utc(datetime.combine(day, self.shifts[0][1]))
+
+    def get_shift(self, day: date, label: str) -> Shift:
+        """Shift ``label`` of operational ``day``; ValueError for an unknown label."""
+        starts = self._starts(day)
+        for i, (name, start) in enumerate(starts):
+            if name.lower() == label.strip().lower():
+                end = starts[i + 1][1] if i + 1 < len(starts) else datetime.combine(
+                    day + timedelta(days=1), self.shifts[0][1])
+                return Shift(f"{day.isoformat()}/{name}", day.isoformat(), name, self._utc(start), self._utc(end))
+        raise ValueError(label)
+
+    def shift_at(self, ts: datetime) -> Shift:
+        day, label = self.locate(ts)
+        return self.get_shift(day, label)
+
+    def today(self) -> date:
+        return self.locate(datetime.now(timezone.utc))[0]
+
+    def local_hour(self, utc_hour: str) -> str:
+        """'YYYY-MM-DDTHH' in UTC -> the same instant as local 'YYYY-MM-DDTHH'."""
+        dt = datetime.fromisoformat(utc_hour + ":00").replace(tzinfo=timezone.utc)
+        return dt.astimezone(self.tz).strftime("%Y-%m-%dT%H")
+
+
+CALENDAR = ShiftCalendar(settings.OPERATIONAL_TZ, settings.SHIFT_CALENDAR)
+
+
+@lru_cache(maxsize=4096)
+def _stamp_minute(minute: str) -> tuple[str, str]:
+    day, label = CALENDAR.locate(datetime.fromisoformat(minute + ":00").replace(tzinfo=timezone.utc))
+    return day.isoformat(), label
+
+
+def stamp(ts_utc: str) -> tuple[Optional[str], Optional[str]]:
+    """(local_day, shift_slot) for an ISO UTC string; (None, None) if unparseable."""
+    try:
+        # Stored stamps end in "Z", which fromisoformat only accepts from 3.11
+        dt = datetime.fromisoformat(ts_utc[:-1] + "+00:00" if ts_utc.endswith("Z") else ts_utc)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        # Shift starts are whole minutes, so the minute decides
+        return _stamp_minute(dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M"))
+    except (TypeError, ValueError):
+        return None, None
+
+
+def install(conn: Connection) -> None:
+    """Stamp unstamped headers; restamp everything if the calendar changed."""
+    stored = conn.execute(text("SELECT value FROM app_meta WHERE name = 'shift_calendar'")).scalar()
+    changed = stored != CALENDAR.fingerprint
+    where = "" if changed else "WHERE local_day IS NULL"
+    after = 0
+    while True:
+        rows = conn.execute(text(
+            f"SELECT id_header, ts_utc FROM inspeksi_header {where} "
+            f"{'AND' if where else 'WHERE'} id_header > :after ORDER BY id_header LIMIT :n"
+        ), {"after": after, "n": RESTAMP_CHUNK}).all()
+        if not rows:
+            break
+        conn.exec_driver_sql(
+            "UPDATE inspeksi_header SET local_day = ?, shift_slot = ? WHERE id_header = ?",
+            [(*stamp(ts), hid) for hid, ts in rows],
+        )
+        after = rows[-1][0]
+    if changed:
+        for table in DERIVED_TABLES:
+            conn.execute(text(f"DELETE FROM {table}"))
+        conn.execute(text(
+            "INSERT INTO app_meta (name, value) VALUES ('shift_calendar', :v) "
+            "ON CONFLICT (name) DO UPDATE SET value = excluded.value"
+        ), {"v": CALENDAR.fingerprint})
@@ -0,0 +1,290 @@
+# app/trends.py
+"""Rusak-rate trends and spike flags for every item and lokasi at once.
+
+``item_day_rollup`` holds checks and Rusak results per (operational day,
+item), kept by a trigger on ``inspeksi_line``. The trailing
+``HISTORY_DAYS`` of it are held as dense items x days NumPy matrices, and
+``analyze`` computes for all rows in a handful of array operations: the Rusak
+rate of the latest ``WINDOW`` days, the week-over-week change, an EWMA of
+the daily rate and a z-score of the latest window against the
+``BASELINE_DAYS`` before it. Lokasi figures are the same computation on the
+item rows summed per lokasi.
+
+The matrices are cached per master-data snapshot and operational day. Each
+rollup cell carries the change counter of its last update, so a refresh
+reads only the cells touched since the previous one.
+"""
+import threading
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from . import masterdata
+from .changefeed import FEED
+from .masterdata import Snapshot
+from .shift_calendar import CALENDAR
+
+HISTORY_DAYS = 365
+WINDOW = 7            # days in the "recent" rate; also the week-over-week step
+BASELINE_DAYS = 28    # days before the recent window that define normal
+EWMA_ALPHA = 0.3
+Z_SPIKE = 3.0
+MIN_SPIKE_RUSAK = 2   # fewer Rusak results than this are never a spike
+
+_SEQ = f"COALESCE((SELECT seq FROM change_counters WHERE name = '{FEED}'), 0)"
+_IS_RUSAK = "(SELECT lower(label) FROM status_dict WHERE code = NEW.status_code) = 'rusak'"
+
+_TRIGGER = f"""
+CREATE TRIGGER trg_item_day_rollup AFTER INSERT ON inspeksi_line BEGIN
+  INSERT INTO item_day_rollup (local_day, item_id, total, rusak, seq)
+  SELECT H.local_day, NEW.item_id, 1, {_IS_RUSAK}, {_SEQ}
+  FROM inspeksi_header H
+  WHERE H.id_header = NEW.id_header AND H.local_day IS NOT NULL AND NEW.item_id IS NOT NULL
+  ON CONFLICT (local_day, item_id) DO UPDATE SET
+    total = total + 1, rusak = rusak + excluded.rusak, seq = excluded.seq;
+END
+"""
+
+_BACKFILL = f"""
+INSERT INTO item_day_rollup (local_day, item_id, total, rusak, seq)
+SELECT H.local_day, L.item_id, COUNT(*), SUM(lower(S.label) = 'rusak'), {_SEQ}
+FROM inspeksi_line L
+JOIN inspeksi_header H ON H.id_header = L.id_header
+JOIN status_dict S ON S.code = L.status_code
+WHERE H.local_day IS NOT NULL AND L.item_id IS NOT NULL
+GROUP BY H.local_day, L.item_id
+"""
+
+
+def install(conn: Connection) -> None:
+    """(Re)create the trigger; fill the table from history if it is empty."""
+    conn.execute(text("DROP TRIGGER IF EXISTS trg_item_day_rollup"))
+    conn.execute(text(_TRIGGER))
+    if conn.execute(text("SELECT 1 FROM item_day_rollup LIMIT 1")).first() is None:
+        conn.execute(text(_BACKFILL))
+
+
+def _rate(rusak, total):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total > 0, rusak / np.maximum(total, 1), np.nan)
+
+
+def rolling_rate(total: np.ndarray, rusak: np.ndarray, window: int = WINDOW) -> np.ndarray:
+    """Rusak rate over the ``window`` days ending at each column (rows x days)."""
+    zero = np.zeros((total.shape[0], 1))
+    ct = np.concatenate([zero, np.cumsum(total, axis=1, dtype=np.float64)], axis=1)
+    cr = np.concatenate([zero, np.cumsum(rusak, axis=1, dtype=np.float64)], axis=1)
+    lo = np.maximum(np.arange(total.shape[1]) + 1 - window, 0)
+    hi = np.arange(1, total.shape[1] + 1)
+    return _rate(cr[:, hi] - cr[:, lo], ct[:, hi] - ct[:, lo])
+
+
+def ewma(total: np.ndarray, rusak: np.ndarray, alpha: float = EWMA_ALPHA) -> np.ndarray:
+    """EWMA of the daily Rusak rate; days without checks carry the last value."""
+    daily = _rate(rusak, total)
+    out = np.empty_like(daily)
+    acc = np.full(daily.shape[0], np.nan)
+    for j in range(daily.shape[1]):
+        d = daily[:, j]
+        acc = np.where(np.isnan(d), acc, np.where(np.isnan(acc), d, alpha * d + (1 - alpha) * acc))
+        out[:, j] = acc
+    return out
+
+
+def ewma_last(total: np.ndarray, rusak: np.ndarray, alpha: float = EWMA_ALPHA) -> np.ndarray:
+    """Latest column of ``ewma`` in closed form, without stepping through the days.
+
+    The k-th of K checked days weighs alpha * (1 - alpha) ** (K - k), except
+    the first, which seeds the average and weighs (1 - alpha) ** (K - 1).
+    """
+    has = total > 0
+    k = np.cumsum(has, axis=1, dtype=np.int16)
+    n_checked = k[:, -1] if k.shape[1] else np.zeros(k.shape[0], dtype=np.int16)
+    decay = ((1 - alpha) ** np.arange(k.shape[1] + 1)).astype(np.float32)
+    daily = rusak.astype(np.float32) / np.maximum(total, 1).astype(np.float32)
+    out = alpha * np.einsum("ij,ij->i", decay[n_checked[:, None] - k], daily, dtype=np.float64)
+    first = daily[np.arange(len(daily)), has.argmax(axis=1)] if k.shape[1] else 0.0
+    out += (1 - alpha) * decay[np.maximum(n_checked - 1, 0)] * first
+    return np.where(n_checked > 0, out, np.nan)
+
+
+def analyze(total: np.ndarray, rusak: np.ndarray) -> dict[str, np.ndarray]:
+    """Per-row trend figures from rows x days count matrices (last column = latest day).
+
+    The z-score compares the Rusak count of the latest ``WINDOW`` days with
+    what the baseline rate predicts for that many checks (binomial, with a
+    +1/+2 prior so a clean baseline still has a finite spread).
+    """
+    n = total.shape[1]
+    recent, prev, base = n - WINDOW, n - 2 * WINDOW, n - WINDOW - BASELINE_DAYS
+
+    def span(m, lo, hi):
+        # Row sums over days lo..hi-1, clipped to the matrix
+        return m[:, max(lo, 0):max(hi, 0)].sum(axis=1, dtype=np.float64)
+
+    recent_t, recent_r = span(total, recent, n), span(rusak, recent, n)
+    prev_t, prev_r = span(total, prev, recent), span(rusak, prev, recent)
+    base_t, base_r = span(total, base, recent), span(rusak, base, recent)
+
+    rate = _rate(recent_r, recent_t)
+    rate_prev = _rate(prev_r, prev_t)
+    p = (base_r + 1) / (base_t + 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.where(recent_t > 0, (recent_r - p * recent_t) / np.sqrt(recent_t * p * (1 - p)), np.nan)
+    return {
+        "checks": recent_t,
+        "rusak": recent_r,
+        "rate": rate,
+        "rate_prev": rate_prev,
+        "wow_delta": rate - rate_prev,
+        "ewma": ewma_last(total, rusak),
+        "z": z,
+        "spike": (z >= Z_SPIKE) & (recent_r >= MIN_SPIKE_RUSAK),
+    }
+
+
+class _Window:
+    """Dense items x days count matrices for the trailing ``HISTORY_DAYS``."""
+
+    def __init__(self, snap: Snapshot, end: date):
+        # Items ordered by lokasi so per-lokasi sums are one reduceat
+        def lokasi_of(it):
+            area = snap.areas.get(it.id_area)
+            return area.id_lokasi if area else 0
+
+        items = sorted(snap.items.values(), key=lambda it: (lokasi_of(it), it.id_item))
+        self.items = items
+        self.ids = np.array([it.id_item for it in items], dtype=np.int64)
+        self.sorter = np.argsort(self.ids)
+        self.item_lokasi = np.array([lokasi_of(it) for it in items], dtype=np.int64)
+        self.lokasi_ids, self.lokasi_starts = np.unique(self.item_lokasi, return_index=True)
+        self.end = end
+        self.start = end - timedelta(days=HISTORY_DAYS - 1)
+        self.day_pos = {(self.start + timedelta(days=i)).isoformat(): i for i in range(HISTORY_DAYS)}
+        self.total = np.zeros((len(items), HISTORY_DAYS), dtype=np.int32)
+        self.rusak = np.zeros((len(items), HISTORY_DAYS), dtype=np.int32)
+        self.seq = -1
+        self.lock = threading.Lock()
+
+    def refresh(self, db: Session) -> None:
+        """Apply the rollup cells changed since the last refresh."""
+        with self.lock:
+            rows = db.execute(text(
+                "SELECT local_day, item_id, total, rusak, seq FROM item_day_rollup "
+                "WHERE seq >= :seq AND local_day BETWEEN :lo AND :hi"
+            ), {"seq": self.seq, "lo": self.start.isoformat(), "hi": self.end.isoformat()}).all()
+            if not rows or not len(self.ids):
+                return
+            day, item, total, rusak, seq = (np.array(c) for c in zip(*rows))
+            pos = self.sorter[np.minimum(np.searchsorted(self.ids, item, sorter=self.sorter), len(self.ids) - 1)]
+            known = self.ids[pos] == item  # cells of deleted items drop out
+            cols = np.array([self.day_pos[d] for d in day], dtype=np.intp)
+            # Cells hold absolute counts, so re-reading one is harmless
+            self.total[pos[known], cols[known]] = total[known]
+            self.rusak[pos[known], cols[known]] = rusak[known]
+            # ">=" re-reads the last seq: a trigger may record the counter before it is bumped
+            self.seq = int(seq.max())
+
+    def by_lokasi(self, m: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(m, self.lokasi_starts, axis=0) if len(m) else m
+
+
+_cached: Optional[tuple[Snapshot, date, _Window]] = None
+
+
+def _window(db: Session) -> _Window:
+    global _cached
+    snap, today = masterdata.get_snapshot(), CALENDAR.today()
+    cached = _cached
+    if cached is not None and cached[0] is snap and cached[1] == today:
+        win = cached[2]
+    else:
+        win = _Window(snap, today)
+        _cached = (snap, today, win)
+    win.refresh(db)
+    return win
+
+
+def _num(v, digits: int = 4):
+    return None if np.isnan(v) else round(float(v), digits)
+
+
+def _stats(a: dict[str, np.ndarray], i: int) -> dict:
+    return {
+        "checks": int(a["checks"][i]),
+        "rusak": int(a["rusak"][i]),
+        "rate": _num(a["rate"][i]),
+        "rate_prev": _num(a["rate_prev"][i]),
+        "wow_delta": _num(a["wow_delta"][i]),
+        "ewma": _num(a["ewma"][i]),
+        "z": _num(a["z"][i], 2),
+        "spike": bool(a["spike"][i]),
+    }
+
+
+def report(db: Session, days: int = 90, lokasi_ids: Optional[list[int]] = None, limit: int = 50) -> dict:
+    """Trend of the overall Rusak rate over the last ``days`` operational
+    days, figures per lokasi, and the ``limit`` items with the most unusual
+    latest week (spikes first, then by z-score)."""
+    win = _window(db)
+    snap = masterdata.get_snapshot()
+    days = max(1, min(days, HISTORY_DAYS))
+
+    lok = analyze(win.by_lokasi(win.total), win.by_lokasi(win.rusak))
+    wanted = np.isin(win.lokasi_ids, lokasi_ids) if lokasi_ids else np.ones(len(win.lokasi_ids), dtype=bool)
+    lokasi = []
+    for i in np.flatnonzero(wanted):
+        rec = snap.lokasi.get(int(win.lokasi_ids[i]))
+        lokasi.append({
+            "lokasi": {"id_lokasi": rec.id_lokasi, "nama_lokasi": rec.nama_lokasi} if rec else None,
+            **_stats(lok, i),
+        })
+    lokasi.sort(key=lambda r: (not r["spike"], -r["z"] if r["z"] is not None else np.inf))
+
+    rows = np.isin(win.item_lokasi, lokasi_ids) if lokasi_ids else slice(None)
+    total, rusak = win.total[rows], win.rusak[rows]
+    items_idx = np.arange(len(win.items))[rows]
+    a = analyze(total, rusak)
+    z = np.where(np.isnan(a["z"]), -np.inf, a["z"])
+    order = np.lexsort((-z, ~a["spike"]))
+    order = order[np.isfinite(z[order])][:limit]
+    items = []
+    for i in order:
+        it = win.items[int(items_idx[i])]
+        area = snap.areas.get(it.id_area)
+        lk = snap.lokasi.get(area.id_lokasi) if area else None
+        items.append({
+            "id_item": it.id_item,
+            "nama_item": it.nama_item,
+            "area": {"id_area": area.id_area, "nama_area": area.nama_area} if area else None,
+            "lokasi": {"id_lokasi": lk.id_lokasi, "nama_lokasi": lk.nama_lokasi} if lk else None,
+            **_stats(a, int(i)),
+        })
+
+    day_t = total.sum(axis=0, keepdims=True)
+    day_r = rusak.sum(axis=0, keepdims=True)
+    roll = rolling_rate(day_t, day_r)[0, -days:]
+    trend = ewma(day_t, day_r)[0, -days:]
+    first = HISTORY_DAYS - days
+    series = [
+        {
+            "day": (win.start + timedelta(days=first + j)).isoformat(),
+            "checks": int(day_t[0, first + j]),
+            "rusak": int(day_r[0, first + j]),
+            "rolling_rate": _num(roll[j]),
+            "ewma": _num(trend[j]),
+        }
+        for j in range(days)
+    ]
+    return {
+        "end": win.end.isoformat(),
+        "window_days": WINDOW,
+        "baseline_days": BASELINE_DAYS,
+        "series": series,
+        "lokasi": lokasi,
+        "items": items,
+    }
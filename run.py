@@ -1,6 +1,9 @@
 import os
+import subprocess
+import sys
 import uvicorn
 from app.main import app
+from app.settings import DASH_MODE
 
 
 def _env_bool(name: str, default: bool = True) -> bool:
@@ -23,9 +26,19 @@ if __name__ == "__main__":
 
     reload = _env_bool("RELOAD", True)
 
-    uvicorn.run(
-        "app.main:app",
-        host=host,
-        port=port,
-        reload=reload,
-    )
+    # DASH_MODE=worker: Dash analytics run in their own processes (app/dash_worker.py)
+    dash_worker = None
+    if DASH_MODE == "worker":
+        dash_worker = subprocess.Popen([sys.executable, "-m", "app.dash_worker"])
+
+    try:
+        uvicorn.run(
+            "app.main:app",
+            host=host,
+            port=port,
+            reload=reload,
+        )
+    finally:
+        if dash_worker is not None:
+            dash_worker.terminate()
+            dash_worker.wait()
@@ -1,9 +1,11 @@
 // static/app.js
 // Frontend helpers for the Inspection Form page
-// - Populates terminal dropdown from /api/terminals
-// - Fetches terminal form_schema and renders dynamic fields
+// - Loads terminals, form schemas and the lokasi -> area -> item tree in one
+//   request from /api/form-bundle (cached in localStorage, revalidated by ETag)
+// - Renders dynamic fields from the selected terminal's form_schema
 // - Captures geolocation and verifies via /api/verify-location
 // - Submits data (best-effort). If server endpoint is missing, shows a friendly message.
+// - Queues area checklists offline and flushes them via /api/inspections/sync
 
 (function () {
   const form = document.getElementById('inspectionForm');
@@ -31,10 +33,10 @@
     const areaEl = formArea.querySelector('#field_Area');
     if (!areaEl || !lid) return;
     try {
-      const areas = await fetchJSON(`/api/lokasi/${encodeURIComponent(lid)}/areas`);
+      const areas = await getAreas(lid);
       const found = areas.find(a => a.nama_area === areaEl.value);
       if (!found) return;
-      const items = await fetchJSON(`/api/area/${encodeURIComponent(found.id_area)}/items`);
+      const items = await getAreaItems(found);
       // Hide single-item dropdown and global status when showing checklist
       const itemWrapExisting = formArea.querySelector('#field_Item_Cek_ID')?.parentElement;
       if (itemWrapExisting) itemWrapExisting.style.display = 'none';
@@ -102,19 +104,96 @@
       rows.push({ item_id: id, status, catatan });
     }
     const shift = document.getElementById('shift_sel')?.value || null;
+    // Queue first, then flush: a dropped connection leaves the checklist in the
+    // queue under the same key, so the later retry cannot create duplicates.
+    const sub = {
+      client_key: newClientKey(), owner_id: OWNER_ID, captured_at: new Date().toISOString(),
+      lokasi_id: lid, area_id: areaId, shift, lat, lon, items: rows,
+    };
+    writeQueue(readQueue().concat([sub]));
     try {
-      const res = await fetch('/api/inspections/bulk-normalized', {
-        method: 'POST', headers:{'Content-Type':'application/json'},
-        body: JSON.stringify({ lokasi_id: lid, area_id: areaId, shift, lat, lon, items: rows })
-      });
-      const data = await res.json().catch(()=>({}));
-      if(!res.ok) throw new Error(data.detail || 'Gagal menyimpan');
-      setStatus(`Tersimpan ${data.created} baris.`, true);
+      const data = await flushQueue();
+      if (data && data.offline) {
+        setStatus(`Tidak ada koneksi. Disimpan di antrean (${data.pending}), akan dikirim otomatis.`, true);
+        form.reset(); clearFormArea();
+        return;
+      }
+      const mine = ((data && data.results) || []).find(r => r.client_key === sub.client_key);
+      if (mine && mine.status === 'rejected') throw new Error(mine.detail || 'Gagal menyimpan');
+      setStatus(`Tersimpan ${mine ? mine.created : 0} baris.`, true);
       form.reset(); clearFormArea();
     } catch (e) {
       setStatus(String(e.message || e), false);
     }
   }
+
+  // Offline queue of checklist submissions (localStorage). Each entry keeps its
+  // client_key and capture time; /api/inspections/sync takes the whole queue in
+  // one request and reports already-stored keys as duplicates. The device may
+  // be shared, so the queue is kept per user and every entry records its owner:
+  // only the signed-in officer's own entries are ever sent.
+  const OWNER_ID = Number(form.dataset.userId);
+  const QUEUE_KEY = 'bib.syncQueue.' + (form.dataset.username || '');
+  const SYNC_BATCH = 500;
+  let flushing = null;
+
+  function readQueue() {
+    try { return JSON.parse(localStorage.getItem(QUEUE_KEY) || '[]'); } catch (_) { return []; }
+  }
+  function writeQueue(queue) {
+    try { localStorage.setItem(QUEUE_KEY, JSON.stringify(queue)); } catch (_) {}
+  }
+  function ownQueue() {
+    return readQueue().filter(s => s.owner_id === OWNER_ID);
+  }
+  function newClientKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2, 12);
+  }
+
+  // Resolves to the sync response, {offline, pending} when the network is
+  // unreachable, or null for an empty queue. Server errors throw and keep the queue.
+  function flushQueue() {
+    if (flushing) return flushing;
+    flushing = (async () => {
+      if (!form.dataset.username || !Number.isFinite(OWNER_ID)) return null;
+      const batch = ownQueue().slice(0, SYNC_BATCH).map(({ owner_id, ...sub }) => sub);
+      if (!batch.length) return null;
+      let res;
+      try {
+        // The session may belong to someone else by now (logout and another
+        // login in a different tab); the server would file the batch under them
+        const me = await fetch('/api/me').then(r => (r.ok ? r.json() : null));
+        if (!me || me.username !== form.dataset.username) return null;
+        res = await fetch('/api/inspections/sync', {
+          method: 'POST', headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ submissions: batch }),
+        });
+      } catch (_) {
+        return { offline: true, pending: ownQueue().length };
+      }
+      const data = await res.json().catch(() => ({}));
+      if (!res.ok) throw new Error(data.detail || `${res.status} ${res.statusText}`);
+      // Re-read so checklists queued while the request was in flight stay queued
+      const settled = new Set((data.results || []).map(r => r.client_key));
+      writeQueue(readQueue().filter(s => s.owner_id !== OWNER_ID || !settled.has(s.client_key)));
+      return data;
+    })().finally(() => { flushing = null; });
+    return flushing;
+  }
+
+  async function flushQueueInBackground() {
+    try {
+      const data = await flushQueue();
+      if (!data || data.offline) return;
+      const rejected = (data.results || []).filter(r => r.status === 'rejected');
+      if (data.created) { try { notify(`Antrean offline terkirim: ${data.created} baris`, 'success'); } catch(_) {} }
+      if (rejected.length) { try { notify(`${rejected.length} checklist antrean ditolak: ${rejected[0].detail}`, 'warn', 8000); } catch(_) {} }
+      if (ownQueue().length) flushQueueInBackground();
+    } catch (e) {
+      console.warn('flushQueue', e);
+    }
+  }
   function setGeoNote(msg, ok = false) {
     if (!geoNote) return;
     geoNote.style.color = ok ? 'lime' : 'yellow';
@@ -131,10 +210,86 @@
     return data;
   }
 
+  // Master data bundle, kept in localStorage. Repeat visits send If-None-Match
+  // and get a bodyless 304 until an admin changes lokasi/area/item/terminals.
+  const BUNDLE_KEY = 'bib.formBundle';
+  let bundle = null;
+
+  async function loadBundle() {
+    let cached = null;
+    try { cached = JSON.parse(localStorage.getItem(BUNDLE_KEY) || 'null'); } catch (_) {}
+    const headers = {};
+    if (cached && cached.etag) headers['If-None-Match'] = cached.etag;
+    try {
+      const res = await fetch('/api/form-bundle', { headers });
+      if (res.status === 304 && cached) {
+        bundle = cached.data;
+        return bundle;
+      }
+      if (!res.ok) throw new Error(`${res.status} ${res.statusText}`);
+      bundle = await res.json();
+      try {
+        localStorage.setItem(BUNDLE_KEY, JSON.stringify({ etag: res.headers.get('ETag'), data: bundle }));
+      } catch (_) {}
+    } catch (e) {
+      // Offline or server error: fall back to the last bundle we saw
+      bundle = cached ? cached.data : null;
+    }
+    return bundle;
+  }
+
+  function bundleLokasi() {
+    return (bundle && Array.isArray(bundle.lokasi)) ? bundle.lokasi : null;
+  }
+
+  function byName(key) {
+    return (a, b) => (a[key] < b[key] ? -1 : a[key] > b[key] ? 1 : 0);
+  }
+
+  async function getLokasiList() {
+    return bundleLokasi() || fetchJSON('/api/lokasi');
+  }
+
+  async function getAreas(lid) {
+    const loks = bundleLokasi();
+    if (!loks) return fetchJSON(`/api/lokasi/${encodeURIComponent(lid)}/areas`);
+    const lok = loks.find((x) => x.id_lokasi === Number(lid));
+    return lok ? lok.areas : [];
+  }
+
+  async function getAreaItems(area) {
+    if (Array.isArray(area.items)) return area.items;
+    return fetchJSON(`/api/area/${encodeURIComponent(area.id_area)}/items`);
+  }
+
+  async function getLokasiItems(lid) {
+    if (!bundleLokasi()) return fetchJSON(`/api/lokasi/${encodeURIComponent(lid)}/items`);
+    const areas = await getAreas(lid);
+    return areas.flatMap((a) => a.items).sort(byName('nama_item'));
+  }
+
+  // Same shape as /api/terminals/{id}/options for the master-data fields
+  function optionsFromBundle(fields) {
+    const loks = bundleLokasi();
+    if (!loks) return null;
+    const out = {};
+    for (const f of fields) {
+      if (f === 'Lokasi') out[f] = loks.map((l) => l.nama_lokasi);
+      else if (f === 'ID_Lokasi') out[f] = loks.map((l) => String(l.id_lokasi));
+      else if (f === 'Area') out[f] = [...new Set(loks.flatMap((l) => l.areas.map((a) => a.nama_area)))];
+      else if (f === 'Item_Cek_ID') {
+        out[f] = loks.flatMap((l) => l.areas.flatMap((a) => a.items.map((it) => it.id_item)))
+          .sort((a, b) => a - b).map(String);
+      } else return null;
+    }
+    return out;
+  }
+
   async function loadTerminals() {
     try {
       selTerminal.innerHTML = '<option value="">Memuat...</option>';
-      const list = await fetchJSON('/api/terminals');
+      await loadBundle();
+      const list = bundle ? bundle.terminals : await fetchJSON('/api/terminals');
       selTerminal.innerHTML = '<option value="">— Pilih Terminal —</option>';
       (list || []).forEach((t) => {
         const opt = document.createElement('option');
@@ -206,6 +361,8 @@
 
   async function loadOptionsFromDB(terminalId, fields) {
     if (!terminalId || !fields.length) return {};
+    const local = optionsFromBundle(fields);
+    if (local) return local;
     const params = new URLSearchParams();
     fields.forEach((f) => params.append('field', f));
     const url = `/api/terminals/${encodeURIComponent(terminalId)}/options?${params.toString()}`;
@@ -271,7 +428,7 @@
     let lokasiList = [];
     async function ensureLokasiList() {
       if (lokasiList.length) return;
-      try { lokasiList = await fetchJSON('/api/lokasi'); } catch (e) { lokasiList = []; }
+      try { lokasiList = await getLokasiList(); } catch (e) { lokasiList = []; }
     }
 
     async function onLokasiChange() {
@@ -296,7 +453,7 @@
       // Load areas for lokasi into Area field if present
       if (areaEl && lid != null) {
         try {
-          const areas = await fetchJSON(`/api/lokasi/${encodeURIComponent(lid)}/areas`);
+          const areas = await getAreas(lid);
           areaEl.innerHTML = '';
           areas.forEach((a) => {
             const o = document.createElement('option');
@@ -313,7 +470,7 @@
       } else if (itemEl && lid != null) {
         // If no Area field, list items by lokasi
         try {
-          const items = await fetchJSON(`/api/lokasi/${encodeURIComponent(lid)}/items`);
+          const items = await getLokasiItems(lid);
           itemEl.innerHTML = '';
           items.forEach((it) => {
             const o = document.createElement('option');
@@ -329,11 +486,11 @@
       if (!itemEl || !areaEl) return;
       try {
         // If we had area ids, we'd use that. Given we used nama_area, fetch all and pick selected.
-        const areas = await fetchJSON(`/api/lokasi/${encodeURIComponent(lid)}/areas`);
+        const areas = await getAreas(lid);
         const selectedName = areaEl.value;
         const am = areas.find((a) => a.nama_area === selectedName);
         if (!am) return;
-        const items = await fetchJSON(`/api/area/${encodeURIComponent(am.id_area)}/items`);
+        const items = await getAreaItems(am);
         itemEl.innerHTML = '';
         items.forEach((it) => {
           const o = document.createElement('option');
@@ -391,7 +548,8 @@
     clearFormArea();
     if (!id) return;
     try {
-      const detail = await fetchJSON(`/api/terminals/${encodeURIComponent(id)}`);
+      const cachedTerm = bundle && bundle.terminals.find((t) => String(t.id) === String(id));
+      const detail = cachedTerm || await fetchJSON(`/api/terminals/${encodeURIComponent(id)}`);
       await renderFormSchema(detail && (detail.form_schema || detail.schema));
       // Ensure status controls appear for single-item mode
       ensureStatusControls();
@@ -404,6 +562,20 @@
     }
   }
 
+  // Preselect the lokasi whose geofence contains the officer, if any
+  async function suggestLokasi(lat, lon) {
+    const sel = document.getElementById('field_Lokasi');
+    if (!sel) return;
+    try {
+      const hits = await fetchJSON(`/api/lokasi/nearest?lat=${lat}&lon=${lon}&limit=1`);
+      const top = hits && hits[0];
+      if (!top || !top.inside || sel.value === top.nama_lokasi) return;
+      if (![...sel.options].some((o) => o.value === top.nama_lokasi)) return;
+      sel.value = top.nama_lokasi;
+      sel.dispatchEvent(new Event('change'));
+    } catch (_) {}
+  }
+
   async function captureGeo() {
     if (!navigator.geolocation) {
       setGeoNote('Geolokasi tidak didukung peramban ini.');
@@ -416,10 +588,11 @@
         latEl.value = String(latitude);
         lonEl.value = String(longitude);
         setGeoNote(`Lokasi: ${latitude.toFixed(6)}, ${longitude.toFixed(6)}`, true);
+        await suggestLokasi(latitude, longitude);
         try {
           const lokasiName = (document.getElementById('field_Lokasi')?.value || '').trim();
           let lokasiList = [];
-          try { lokasiList = await fetchJSON('/api/lokasi'); } catch(e) {}
+          try { lokasiList = await getLokasiList(); } catch(e) {}
           const found = lokasiList.find(x => x.nama_lokasi === lokasiName);
           const body = { lat: latitude, lon: longitude };
           if (found) body.lokasi_id = found.id_lokasi; else if (lokasiName) body.lokasi_name = lokasiName;
@@ -484,7 +657,7 @@
       }
       const lokasiName = (document.getElementById('field_Lokasi')?.value || '').trim();
       let lokasiList = [];
-      try { lokasiList = await fetchJSON('/api/lokasi'); } catch(e) {}
+      try { lokasiList = await getLokasiList(); } catch(e) {}
       const found = lokasiList.find(x => x.nama_lokasi === lokasiName);
       const body = { lat, lon };
       if (found) body.lokasi_id = found.id_lokasi; else if (lokasiName) body.lokasi_name = lokasiName;
@@ -512,6 +685,13 @@
         clearFormArea();
         return;
       }
+      if (res.status === 422) {
+        // Payload rejected by the terminal's form schema
+        const err = await res.json().catch(() => ({}));
+        const detail = Array.isArray(err.detail) ? err.detail.map((d) => d.msg || d).join('; ') : err.detail;
+        setStatus(`Data tidak valid: ${detail || res.statusText}`, false);
+        return;
+      }
       // If not OK, try alternative path
       const alt = await fetch('/api/inspections/submit', {
         method: 'POST',
@@ -538,6 +718,8 @@
   selTerminal.addEventListener('change', onTerminalChange);
   btnGeo.addEventListener('click', captureGeo);
   form.addEventListener('submit', submitInspection);
+  window.addEventListener('online', flushQueueInBackground);
+  flushQueueInBackground();
   // Slight delay to allow fields render then attach status controls
   setTimeout(ensureStatusControls, 300);
 })();
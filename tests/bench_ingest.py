@@ -0,0 +1,129 @@
+"""Concurrent ingest benchmark: group-commit writer vs a commit per request.
+
+    python tests/bench_ingest.py [--threads 32] [--requests 2000] [--items 5]
+
+``--threads`` client threads each write checklists of ``--items`` lines to
+a throwaway copy of inspeksi.db, two ways:
+
+- ``http``: POST one checklist per request to ``/api/inspections/sync``;
+- ``job``: hand the same insert job (``inspeksi_store.write_checklist`` with
+  its triggers) straight to the writer, without the request handling.
+
+Each is measured with the ingest writer, then with ``PerRequestWriter``,
+which runs every job in its own transaction on the calling thread as the
+inserts were written before the writer existed. Not collected by pytest.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+_DB_DIR = Path(tempfile.mkdtemp(prefix="inspeksi-bench-"))
+shutil.copy(ROOT / "inspeksi.db", _DB_DIR / "inspeksi.db")
+os.environ["INSPEKSI_DB_PATH"] = str(_DB_DIR / "inspeksi.db")
+sys.path.insert(0, str(ROOT))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+
+from app import ingest, inspeksi_store  # noqa: E402
+from app.database import engine  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+class PerRequestWriter:
+    """Runs each job in its own transaction on the caller's thread.
+
+    Uses its own engine with a connection per client thread: a request
+    already holds one from the app's pool, and sharing that pool would
+    measure pool waits instead of commits.
+    """
+
+    def __init__(self, threads: int):
+        self._engine = create_engine(engine.url, pool_size=threads,
+                                     connect_args={"check_same_thread": False})
+
+    def run(self, fn, rows=1, timeout=None):
+        with self._engine.begin() as conn:
+            return fn(conn)
+
+
+def _submission(lok, area, items: int) -> dict:
+    return {
+        "client_key": uuid.uuid4().hex,
+        "captured_at": "2024-05-01T08:30:00+07:00",
+        "lokasi_id": lok["id_lokasi"],
+        "area_id": area["id_area"],
+        "shift": "Pagi",
+        "lat": 1.005,
+        "lon": 104.005,
+        "items": [{"item_id": area["items"][k % len(area["items"])]["id_item"], "status": "Bagus"}
+                  for k in range(items)],
+    }
+
+
+def _rate(fn, threads: int, requests: int) -> float:
+    """Calls of ``fn`` per second from ``threads`` threads."""
+    with ThreadPoolExecutor(threads) as ex:
+        list(ex.map(fn, range(threads)))  # warm-up
+        t0 = time.perf_counter()
+        list(ex.map(fn, range(requests)))
+        return requests / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=32)
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--items", type=int, default=5)
+    args = ap.parse_args()
+
+    with TestClient(app) as c:
+        c.post("/login", data={"username": "admin", "password": "Admin123!"}, follow_redirects=False)
+        lok = next(l for l in c.get("/api/form-bundle").json()["lokasi"] if any(a["items"] for a in l["areas"]))
+        area = next(a for a in lok["areas"] if a["items"])
+        square = [[1.0, 104.0], [1.0, 104.01], [1.01, 104.01], [1.01, 104.0]]
+        assert c.put(f"/api/lokasi/{lok['id_lokasi']}/polygon", json={"polygon": square}).status_code == 200
+        sub = _submission(lok, area, args.items)
+        header = {"ts_utc": "2024-05-01T01:30:00Z", "user_id": 1, "lokasi_id": sub["lokasi_id"],
+                  "area_id": sub["area_id"], "shift": "Pagi", "latitude": 1.005, "longitude": 104.005}
+        lines = [{"item_id": it["item_id"], "status": it["status"]} for it in sub["items"]]
+
+        def post(_):
+            r = c.post("/api/inspections/sync", json={"submissions": [_submission(lok, area, args.items)]})
+            assert r.status_code == 200 and r.json()["results"][0]["status"] == "created", r.text
+
+        def job(_):
+            ingest.get_writer().run(lambda conn: inspeksi_store.write_checklist(conn, header, lines),
+                                    len(lines) + 1)
+
+        writer = ingest.get_writer()
+        per_request = PerRequestWriter(args.threads)
+        results = {}
+        for name, fn in (("http", post), ("job", job)):
+            groups, jobs = writer.groups, writer.jobs
+            grouped = _rate(fn, args.threads, args.requests)
+            groups, jobs = writer.groups - groups, writer.jobs - jobs
+            ingest.get_writer = lambda: per_request
+            try:
+                direct = _rate(fn, args.threads, args.requests)
+            finally:
+                ingest.get_writer = lambda: writer
+            results[name] = grouped, direct, jobs, groups
+
+    print(f"{args.threads} thread, {args.requests} request, {args.items} item per checklist")
+    for name, (grouped, direct, jobs, groups) in results.items():
+        print(f"  {name:4} group commit: {grouped:7.0f}/s ({jobs} job dalam {groups} grup)   "
+              f"per request: {direct:7.0f}/s")
+    engine.dispose()
+    shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
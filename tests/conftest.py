@@ -0,0 +1,27 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# The app runs against a throwaway copy of inspeksi.db, so tests that submit
+# inspections never touch the tracked database. Set before app is imported.
+_DB_DIR = Path(tempfile.mkdtemp(prefix="inspeksi-test-"))
+shutil.copy(Path(__file__).resolve().parent.parent / "inspeksi.db", _DB_DIR / "inspeksi.db")
+os.environ["INSPEKSI_DB_PATH"] = str(_DB_DIR / "inspeksi.db")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _app_started():
+    # Run the startup hook once so schema migrations are applied to the test database
+    with TestClient(app):
+        yield
+    from app.database import engine
+
+    engine.dispose()
+    shutil.rmtree(_DB_DIR, ignore_errors=True)
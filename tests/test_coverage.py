@@ -0,0 +1,35 @@
+from datetime import date, datetime, timedelta, timezone
+
+from app import coverage, shift_calendar
+from app.shift_calendar import ShiftCalendar
+
+
+def test_shift_windows_follow_local_time():
+    utc = timezone.utc
+    # 06:59 WIB still belongs to the previous day's Malam shift
+    assert coverage.shift_at(datetime(2024, 5, 1, 23, 59, tzinfo=utc)).key == "2024-05-01/Malam"
+    assert coverage.shift_at(datetime(2024, 5, 2, 0, 0, tzinfo=utc)).key == "2024-05-02/Pagi"
+    assert coverage.shift_at(datetime(2024, 5, 2, 8, 0, tzinfo=utc)).key == "2024-05-02/Siang"
+    assert coverage.shift_at(datetime(2024, 5, 2, 16, 0, tzinfo=utc)).key == "2024-05-02/Malam"
+    s = coverage.get_shift(date(2024, 5, 2), "malam")
+    assert (s.start_utc, s.end_utc) == (datetime(2024, 5, 2, 16, tzinfo=utc), datetime(2024, 5, 3, 0, tzinfo=utc))
+
+
+def test_stamp_matches_calendar():
+    t = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    for _ in range(24 * 4):
+        day, label = shift_calendar.stamp(t.strftime("%Y-%m-%dT%H:%M:%SZ"))
+        assert f"{day}/{label}" == coverage.shift_at(t).key, t
+        t += timedelta(minutes=17)
+    assert shift_calendar.stamp("bukan tanggal") == (None, None)
+
+
+def test_custom_calendar_and_timezone():
+    cal = ShiftCalendar("Asia/Makassar", "A=06:00,B=18:30")
+    utc = timezone.utc
+    # 05:59 WITA (UTC+8) is still the previous day's B shift
+    assert cal.locate(datetime(2024, 5, 1, 21, 59, tzinfo=utc)) == (date(2024, 5, 1), "B")
+    assert cal.locate(datetime(2024, 5, 1, 22, 0, tzinfo=utc)) == (date(2024, 5, 2), "A")
+    b = cal.get_shift(date(2024, 5, 1), "b")
+    assert (b.start_utc, b.end_utc) == (datetime(2024, 5, 1, 10, 30, tzinfo=utc), datetime(2024, 5, 1, 22, tzinfo=utc))
+    assert cal.local_hour("2024-05-01T22") == "2024-05-02T06"
@@ -0,0 +1,69 @@
+import asyncio
+
+import httpx
+
+from app.dash_worker import ConcurrencyLimit, WorkerForward
+
+
+class _Chunks(httpx.AsyncByteStream):
+    def __init__(self, *chunks):
+        self.chunks = chunks
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+async def _call(app, path="/", method="GET", body=b"", sent=None):
+    sent = [] if sent is None else sent
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": b"x=1",
+             "headers": [(b"host", b"api"), (b"cookie", b"a=b")], "client": ("10.0.0.7", 5000), "scheme": "http"}
+    await app(scope, receive, send)
+    return sent[0]["status"], dict(sent[0]["headers"]), b"".join(m.get("body", b"") for m in sent[1:])
+
+
+def test_concurrency_limit_rejects_when_queue_wait_expires():
+    release = asyncio.Event()
+
+    async def slow(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def run():
+        app = ConcurrencyLimit(slow, limit=1, queue_timeout=0.05)
+        first = asyncio.create_task(_call(app))
+        await asyncio.sleep(0)
+        second = await _call(app)
+        release.set()
+        return (await first)[0], second[0]
+
+    assert asyncio.run(run()) == (200, 503)
+
+
+def test_worker_forward_strips_prefix_and_relays():
+    seen = {}
+
+    def handler(request: httpx.Request):
+        seen.update(path=request.url.path, query=request.url.query, body=request.content,
+                    fwd=request.headers.get("x-forwarded-for"), cookie=request.headers.get("cookie"))
+        return httpx.Response(200, stream=_Chunks(b'{"ok"', b': true}'),
+                              headers={"content-type": "application/json", "content-length": "12"})
+
+    forward = WorkerForward("http://worker", strip_prefix="/dashapp")
+    forward._client = httpx.AsyncClient(base_url="http://worker", transport=httpx.MockTransport(handler))
+    sent = []
+    status, headers, body = asyncio.run(_call(forward, "/dashapp/_dash-update-component", "POST", b"{}", sent))
+    assert (status, body) == (200, b'{"ok": true}')
+    assert headers[b"content-length"] == b"12"
+    # Relayed as the worker's chunks, not one buffered body
+    assert [m.get("body") for m in sent[1:]] == [b'{"ok"', b": true}", b""]
+    assert seen == {"path": "/_dash-update-component", "query": b"x=1", "body": b"{}",
+                    "fwd": "10.0.0.7", "cookie": "a=b"}
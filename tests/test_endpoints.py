@@ -1,5 +1,8 @@
+import json
 import random
 import string
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 
 from fastapi.testclient import TestClient
 
@@ -50,3 +53,149 @@ def test_dashboard_requires_auth_redirect():
     # Without cookie, expect redirect to login
     resp = client.get("/dashboard", allow_redirects=False)
     assert resp.status_code == 303
+
+
+def admin_client() -> TestClient:
+    c = TestClient(app)
+    r = c.post("/login", data={"username": "admin", "password": "Admin123!"}, follow_redirects=False)
+    assert r.status_code == 303
+    return c
+
+
+def test_form_bundle_etag_revalidation():
+    c = admin_client()
+    r1 = c.get("/api/form-bundle")
+    assert r1.status_code == 200
+    body = r1.json()
+    assert isinstance(body.get("terminals"), list)
+    assert isinstance(body.get("lokasi"), list)
+    etag = r1.headers.get("etag")
+    assert etag
+    r2 = c.get("/api/form-bundle", headers={"If-None-Match": etag})
+    assert r2.status_code == 304
+    assert r2.content == b""
+
+
+def test_dashboard_index_cached_with_etag():
+    c = admin_client()
+    r1 = c.get("/dashboard/")
+    assert r1.status_code == 200
+    assert '<span class="who">admin (' in r1.text
+    assert r1.text.count('href="/static/app.css?v=') == 1
+    etag = r1.headers.get("etag")
+    assert etag and c.get("/dashboard/").headers.get("etag") == etag
+    r2 = c.get("/dashboard/", headers={"If-None-Match": etag})
+    assert r2.status_code == 304
+    assert r2.content == b""
+
+
+def test_cache_policy_per_route():
+    r1 = client.get("/")
+    assert r1.headers["cache-control"] == "private, no-cache"
+    assert client.get("/", headers={"If-None-Match": r1.headers["etag"]}).status_code == 304
+    css = next(u for u in r1.text.split('"') if u.startswith("/static/app.css?v="))
+    assert client.get(css).headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert client.get("/static/app.css").headers["cache-control"] == "no-cache"
+    assert client.get("/api/terminals").headers["cache-control"] == "no-store"
+
+
+def test_gzip_for_dynamic_and_precompressed_static():
+    headers = {"Accept-Encoding": "gzip"}
+    page = client.get("/", headers=headers)
+    assert page.headers.get("content-encoding") == "gzip" and "<html" in page.text.lower()
+    css = client.get("/static/app.css", headers=headers)
+    assert css.headers.get("content-encoding") == "gzip"
+    assert css.headers["content-type"].startswith("text/css")
+    assert css.content == client.get("/static/app.css", headers={"Accept-Encoding": "identity"}).content
+    assert client.get("/static/logo-hangnadim.webp", headers=headers).headers.get("content-encoding") is None
+
+
+@contextmanager
+def fenced_area(c: TestClient):
+    """(lokasi, area) with items, temporarily fenced by a small square around (1.005, 104.005)."""
+    lok = next(l for l in c.get("/api/form-bundle").json()["lokasi"] if any(a["items"] for a in l["areas"]))
+    area = next(a for a in lok["areas"] if a["items"])
+    original = lok["polygon"]
+    square = [[1.0, 104.0], [1.0, 104.01], [1.01, 104.01], [1.01, 104.0]]
+    assert c.put(f"/api/lokasi/{lok['id_lokasi']}/polygon", json={"polygon": square}).status_code == 200
+    try:
+        yield lok, area
+    finally:
+        c.put(f"/api/lokasi/{lok['id_lokasi']}/polygon", json={"polygon": original})
+
+
+def test_sync_is_idempotent_per_client_key():
+    c = admin_client()
+    with fenced_area(c) as (lok, area):
+        key = random_username("sync-")
+        sub = {
+            "client_key": key,
+            "captured_at": "2024-05-01T08:30:00+07:00",
+            "lokasi_id": lok["id_lokasi"],
+            "area_id": area["id_area"],
+            "shift": "Pagi",
+            "lat": 1.005,
+            "lon": 104.005,
+            "items": [{"item_id": area["items"][0]["id_item"], "status": "Bagus"}],
+        }
+        outside = dict(sub, client_key=key + "-out", lat=1.2)
+        r1 = c.post("/api/inspections/sync", json={"submissions": [sub, outside, sub]})
+        assert r1.status_code == 200
+        statuses = [r["status"] for r in r1.json()["results"]]
+        assert statuses == ["created", "rejected", "duplicate"]
+        assert r1.json()["created"] == 1
+
+        r2 = c.post("/api/inspections/sync", json={"submissions": [sub]})
+        assert r2.json()["results"] == [{"client_key": key, "status": "duplicate", "created": 1}]
+        assert r2.json()["created"] == 0
+
+        # Keys are per user: the same key from another officer is a new submission
+        other = TestClient(app)
+        username = random_username()
+        assert other.post("/api/register", json={"username": username, "password": "StrongPass123!"}).status_code in (200, 201)
+        assert other.post("/login", data={"username": username, "password": "StrongPass123!"},
+                          follow_redirects=False).status_code == 303
+        r3 = other.post("/api/inspections/sync", json={"submissions": [sub]})
+        assert [r["status"] for r in r3.json()["results"]] == ["created"]
+
+
+def test_item_status_keeps_latest_result():
+    c = admin_client()
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    with fenced_area(c) as (lok, area):
+        item_id = area["items"][0]["id_item"]
+        base = {"lokasi_id": lok["id_lokasi"], "area_id": area["id_area"], "shift": "Pagi", "lat": 1.005, "lon": 104.005}
+        ok = dict(base, client_key=random_username("st-"), captured_at=(now - timedelta(minutes=10)).isoformat(),
+                  items=[{"item_id": item_id, "status": "Bagus"}])
+        rusak = dict(base, client_key=random_username("st-"), captured_at=now.isoformat(),
+                     items=[{"item_id": item_id, "status": "Rusak", "catatan": "retak"}])
+        # Older result that reaches the server later must not replace the newer one
+        late = dict(base, client_key=random_username("st-"), captured_at=(now - timedelta(minutes=3)).isoformat(),
+                    items=[{"item_id": item_id, "status": "Bagus"}])
+        assert c.post("/api/inspections/sync", json={"submissions": [ok]}).json()["created"] == 1
+        assert c.post("/api/inspections/sync", json={"submissions": [rusak]}).json()["created"] == 1
+        assert c.post("/api/inspections/sync", json={"submissions": [late]}).json()["created"] == 1
+
+    r = c.get("/api/items/status", params={"area_id": area["id_area"]})
+    assert r.status_code == 200
+    row = next(i for i in r.json()["items"] if i["id_item"] == item_id)
+    stamp = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+    assert row["status"] == "Rusak" and row["last_ts_utc"] == stamp and row["rusak_since"] == stamp
+    rusak_only = c.get("/api/items/status", params={"status": "rusak"}).json()["items"]
+    assert item_id in {i["id_item"] for i in rusak_only}
+
+
+def test_changefeed_cursor_and_ndjson():
+    c = admin_client()
+    first = c.get("/api/inspeksi/changes", params={"limit": 2}).json()
+    seqs = [r["change_seq"] for r in first["changes"]]
+    assert seqs == sorted(seqs) and first["next_cursor"] == (seqs[-1] if seqs else 0)
+    nxt = c.get("/api/inspeksi/changes", params={"after": first["next_cursor"], "limit": 2}).json()
+    assert all(r["change_seq"] > first["next_cursor"] for r in nxt["changes"])
+
+    r = c.get("/api/inspeksi/changes", params={"limit": 3}, headers={"Accept": "application/x-ndjson"})
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(x) for x in r.text.splitlines()]
+    assert [x["change_seq"] for x in lines[:-1]] == [x["change_seq"] for x in
+                                                     c.get("/api/inspeksi/changes", params={"limit": 3}).json()["changes"]]
+    assert "next_cursor" in lines[-1]
@@ -0,0 +1,25 @@
+from app.form_validation import FormValidator
+
+
+SCHEMA = {
+    "fields": [
+        {"name": "Lokasi", "type": "select", "options": ["A"]},
+        {"name": "Kondisi", "type": "select", "options": ["Baik", {"value": "Rusak", "label": "Rusak"}], "required": True},
+        {"name": "Suhu", "type": "number"},
+        {"name": "Bersih", "type": "checkbox"},
+    ]
+}
+
+
+def test_validator_coerces_known_fields_and_keeps_extras():
+    data, errors = FormValidator(SCHEMA)({"Lokasi": "B", "Kondisi": "Rusak", "Suhu": "21,5", "Bersih": "on", "status": "x"})
+    assert errors == []
+    assert data == {"Lokasi": "B", "Kondisi": "Rusak", "Suhu": 21.5, "Bersih": True, "status": "x"}
+
+
+def test_validator_reports_missing_and_invalid_fields():
+    _, errors = FormValidator(SCHEMA)({"Suhu": "abc"})
+    assert any(e.startswith("Kondisi") for e in errors)
+    assert any(e.startswith("Suhu") for e in errors)
+    _, errors = FormValidator(SCHEMA)({"Kondisi": "Hilang"})
+    assert errors == ["Kondisi: pilihan tidak valid"]
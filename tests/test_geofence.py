@@ -0,0 +1,92 @@
+import numpy as np
+
+from app import geo_audit
+from app.geofence import GeofenceIndex
+from app.masterdata import LokasiRec
+
+
+LOKASI = (
+    LokasiRec(1, "Terminal", 1.1210, 104.1180, 300, None),
+    LokasiRec(2, "Parkir", 1.1250, 104.1180, 100, None),
+    LokasiRec(3, "Tanpa geofence", None, None, 200, None),
+)
+
+
+def test_nearest_puts_containing_fence_first():
+    index = GeofenceIndex(LOKASI)
+    hits = index.nearest(1.1212, 104.1181, limit=5)
+    assert [m.lokasi.id_lokasi for m in hits] == [1, 2]
+    assert hits[0].inside and not hits[1].inside
+    assert index.check(3, 1.0, 104.0) is None
+
+
+def test_distance_matches_known_offset():
+    index = GeofenceIndex(LOKASI)
+    # 0.001 deg of latitude is ~111 m
+    inside, dist = index.check(1, 1.1220, 104.1180)
+    assert inside and abs(dist - 111.2) < 0.5
+
+
+def test_polygon_fence_uses_point_in_polygon():
+    # Long thin terminal: 20 m wide, ~550 m long; centre circle would not fit it
+    strip = ((1.1200, 104.1100), (1.1200, 104.1150), (1.1202, 104.1150), (1.1202, 104.1100))
+    index = GeofenceIndex((LokasiRec(9, "Gate", None, None, None, strip),))
+    assert index.check(9, 1.1201, 104.1149) == (True, 0.0)
+    inside, dist = index.check(9, 1.1205, 104.1120)
+    assert not inside and abs(dist - 33.4) < 0.5
+    assert [m.lokasi.id_lokasi for m in index.containing(1.1201, 104.1101)] == [9]
+
+
+def test_batch_audit_matches_single_checks():
+    strip = ((1.1200, 104.1100), (1.1200, 104.1150), (1.1202, 104.1150), (1.1202, 104.1100))
+    index = GeofenceIndex(LOKASI + (LokasiRec(9, "Gate", None, None, None, strip),))
+    lok = np.array([1, 2, 9, 9, 3, 1, 42])
+    lats = np.array([1.1220, 1.1212, 1.1201, 1.1205, 1.1, np.nan, 1.1])
+    lons = np.array([104.1180, 104.1181, 104.1149, 104.1120, 104.1, 104.1, 104.1])
+    flags, dist = geo_audit.classify(index, lok, lats, lons)
+    assert flags.tolist() == ["inside", "outside", "inside", "outside", "no_fence", "no_coords", "no_fence"]
+    for k in range(4):
+        inside, d = index.check(int(lok[k]), lats[k], lons[k])
+        assert abs(dist[k] - d) < 1e-6
+    assert np.isnan(dist[4:]).all()
+
+
+def test_cluster_bins_are_bounded_and_conserve_counts(tmp_path):
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import Session
+
+    from app import geo_cluster, models
+
+    rng = np.random.default_rng(0)
+    lat = 1.12 + rng.normal(0, 0.01, 50000)
+    lon = 104.11 + rng.normal(0, 0.02, 50000)
+    rusak = rng.random(50000) < 0.25
+    engine = create_engine(f"sqlite:///{tmp_path / 'cluster.db'}")
+    Tx = models.InspeksiTx
+    Tx.__table__.create(engine)
+    with Session(engine) as db:
+        rows = [{"ts_utc": "2024-05-01T00:00:00Z", "user_id": 1, "item_id": 1, "latitude": a, "longitude": b,
+                 "status": "Rusak" if r else "Bagus"} for a, b, r in zip(lat.tolist(), lon.tolist(), rusak)]
+        rows.append(dict(rows[0], latitude=None))  # no coordinates: not clustered
+        db.execute(insert(Tx), rows)
+        q = db.query(Tx)
+
+        coarse = geo_cluster.clusters(q, scale=1000)
+        assert sum(c.count for c in coarse.cells) == 50000
+        assert sum(c.rusak for c in coarse.cells) == int(rusak.sum())
+        # Same cells as binning the raw points
+        cell = geo_cluster.cell_size_deg(1000)
+        _, counts = np.unique(np.stack([np.floor((lat + 90) / cell), np.floor((lon + 180) / cell)]),
+                                 axis=1, return_counts=True)
+        assert sorted(c.count for c in coarse.cells) == sorted(counts.tolist())
+        assert coarse.center is not None
+
+        fine = geo_cluster.clusters(q, scale=1e9)
+        assert fine.cell_deg == geo_cluster.MIN_CELL_DEG
+        assert len(fine.cells) == geo_cluster.MAX_CELLS
+        assert fine.cells[0].count >= fine.cells[-1].count
+
+        fitted = geo_cluster.clusters(q)
+        assert fitted.cell_deg == geo_cluster.cell_size_deg(fitted.scale)
+        assert sum(c.count for c in fitted.cells) == 50000
+        assert geo_cluster.clusters(q.filter(Tx.status == "x")).cells == []
@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, func, select
+from sqlalchemy.exc import IntegrityError
+
+from app.ingest import IngestWriter, WriteTimeout, insert_returning
+
+
+def _setup(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ingest.db'}", connect_args={"check_same_thread": False})
+    meta = MetaData()
+    table = Table("t", meta, Column("id", Integer, primary_key=True), Column("name", String, unique=True))
+    meta.create_all(engine)
+    return engine, table
+
+
+def test_concurrent_jobs_are_grouped_and_get_their_ids(tmp_path):
+    engine, table = _setup(tmp_path)
+    writer = IngestWriter(bind=engine, group_wait_ms=20)
+    try:
+        def submit(i):
+            rows = [{"name": f"{i}-{k}"} for k in range(3)]
+            return writer.run(lambda conn: insert_returning(conn, table, rows), len(rows))
+
+        with ThreadPoolExecutor(8) as ex:
+            results = list(ex.map(submit, range(40)))
+    finally:
+        writer.stop()
+    with engine.connect() as conn:
+        names = dict(conn.execute(select(table.c.id, table.c.name)).all())
+    for i, ids in enumerate(results):
+        assert [names[x] for x in ids] == [f"{i}-{k}" for k in range(3)]
+    assert writer.jobs == 40 and writer.groups < 40
+
+
+def test_failing_job_does_not_roll_back_its_group(tmp_path):
+    engine, table = _setup(tmp_path)
+    writer = IngestWriter(bind=engine, group_wait_ms=50)
+    try:
+        ok1 = writer.submit(lambda conn: insert_returning(conn, table, [{"name": "a"}]))
+        bad = writer.submit(lambda conn: insert_returning(conn, table, [{"name": "a"}]))
+        ok2 = writer.submit(lambda conn: insert_returning(conn, table, [{"name": "b"}]))
+        assert len(ok1.result(5)) == 1 and len(ok2.result(5)) == 1
+        with pytest.raises(IntegrityError):
+            bad.result(5)
+    finally:
+        writer.stop()
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(table)).scalar() == 2
+
+
+def test_timeout_cancels_queued_job_and_reports_running_one(tmp_path):
+    engine, table = _setup(tmp_path)
+    writer = IngestWriter(bind=engine, group_wait_ms=0)
+    release = threading.Event()
+
+    def slow(conn):
+        release.wait(5)
+        return insert_returning(conn, table, [{"name": "slow"}])
+
+    try:
+        with pytest.raises(WriteTimeout) as running:
+            writer.run(slow, timeout=0.2)
+        assert running.value.cancelled is False
+        with pytest.raises(WriteTimeout) as queued:
+            writer.run(lambda conn: insert_returning(conn, table, [{"name": "queued"}]), timeout=0.1)
+        assert queued.value.cancelled is True
+        release.set()
+    finally:
+        writer.stop()
+    with engine.connect() as conn:
+        assert conn.execute(select(table.c.name)).scalars().all() == ["slow"]
@@ -0,0 +1,42 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app import masterdata, models  # noqa: F401  (masterdata registers the flush hook)
+
+
+def test_master_write_fails_when_version_bump_fails(tmp_path):
+    # No master_version table: the bump cannot run, so neither may the write
+    engine = create_engine(f"sqlite:///{tmp_path / 'master.db'}")
+    models.Lokasi.__table__.create(engine)
+    with Session(engine) as db:
+        db.add(models.Lokasi(nama_lokasi="Terminal"))
+        with pytest.raises(OperationalError):
+            db.commit()
+        assert "masterdata_changed" not in db.info
+    with Session(engine) as db:
+        assert db.query(models.Lokasi).count() == 0
+
+
+def test_readers_wait_for_a_reload_instead_of_serving_the_old_snapshot(monkeypatch):
+    monkeypatch.setattr(masterdata, "_read_version", lambda db: 1)
+    old = masterdata.get_snapshot()
+    load, seen = masterdata._load, []
+    reader = threading.Thread(target=lambda: seen.append(masterdata.get_snapshot()))
+
+    def slow_load(db, version):
+        # While this thread reloads, another request asks for the snapshot
+        reader.start()
+        reader.join(0.2)
+        seen.append("waiting" if reader.is_alive() else "served")
+        return load(db, version)
+
+    monkeypatch.setattr(masterdata, "_load", slow_load)
+    masterdata.invalidate()  # a lokasi edit committed in this process
+    new = masterdata.get_snapshot()
+    assert new is not old
+    reader.join()
+    assert seen == ["waiting", new]
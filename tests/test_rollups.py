@@ -0,0 +1,102 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app import coverage, inspeksi_store, item_status, officer_rollup, series_rollup, shift_calendar, trends
+from app.models import Base
+
+
+def _engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rollup.db'}")
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn, tables=[t for t in Base.metadata.sorted_tables if not t.info.get("is_view")])
+        inspeksi_store.install(conn)
+        shift_calendar.install(conn)
+        item_status.install(conn)
+        coverage.install(conn)
+        officer_rollup.install(conn)
+        series_rollup.install(conn)
+        trends.install(conn)
+    return engine
+
+
+def _snapshot(conn, table):
+    return sorted(conn.execute(text(f"SELECT * FROM {table}")).all())
+
+
+def test_incremental_tables_match_rebuild_from_history(tmp_path):
+    engine = _engine(tmp_path)
+    checklists = [
+        # (ts_utc, user, lokasi, shift label, [(item, status)]) -- includes a late, older submission
+        ("2024-05-01T01:00:00Z", 1, 1, "Pagi", [(1, "Bagus"), (2, "Rusak")]),
+        ("2024-05-01T03:30:00Z", 1, 1, "Pagi", [(2, "Rusak"), (3, "Bagus")]),
+        ("2024-05-01T17:00:00Z", 2, 2, "Malam", [(4, "Rusak")]),
+        ("2024-05-01T02:00:00Z", 2, 1, "Pagi", [(2, "Bagus")]),
+        ("2024-05-01T23:30:00Z", 2, 2, None, [(4, "Bagus"), (1, "Rusak")]),
+    ]
+    with engine.begin() as conn:
+        for ts, user, lok, shift, lines in checklists:
+            header = dict(ts_utc=ts, user_id=user, lokasi_id=lok, area_id=lok, shift=shift, latitude=None, longitude=None)
+            inspeksi_store.write_checklist(conn, header, [{"item_id": i, "status": s} for i, s in lines])
+
+    tables = ("item_latest_status", "shift_coverage", "officer_shift_rollup", "series_rollup", "item_day_rollup")
+    with engine.begin() as conn:
+        incremental = {t: _snapshot(conn, t) for t in tables}
+        for t in tables:
+            conn.execute(text(f"DELETE FROM {t}"))
+        item_status.install(conn)
+        coverage.install(conn)
+        officer_rollup.install(conn)
+        series_rollup.install(conn)
+        trends.install(conn)
+        rebuilt = {t: _snapshot(conn, t) for t in tables}
+    assert incremental == rebuilt
+
+    with engine.connect() as conn:
+        latest = {r.item_id: r for r in conn.execute(text("SELECT * FROM item_latest_status"))}
+        # Item 2: Rusak at 01:00 and 03:30; the 02:00 Bagus arrived late but breaks the run
+        assert latest[2].rusak_since == "2024-05-01T03:30:00Z"
+        # 23:30 UTC is 06:30 WIB: still the Malam shift of 1 May
+        assert conn.execute(text(
+            "SELECT items FROM officer_shift_rollup WHERE user_id = 2 AND local_day = '2024-05-01' AND shift = 'Malam'"
+        )).scalar() == 3
+
+
+def test_series_tiers_count_only_days_in_range(tmp_path):
+    engine = _engine(tmp_path)
+    t0 = datetime(2023, 12, 20, 5)
+    stamps = [t0 + timedelta(hours=37 * i) for i in range(400)]  # ~20 months
+    with engine.begin() as conn:
+        for i, t in enumerate(stamps):
+            header = dict(ts_utc=t.strftime("%Y-%m-%dT%H:%M:%SZ"), user_id=1, lokasi_id=1 + i % 2, area_id=1,
+                          shift="Pagi", latitude=None, longitude=None)
+            inspeksi_store.write_checklist(conn, header, [{"item_id": 1, "status": "Rusak" if i % 3 else "Bagus"}])
+    start, end = date(2024, 1, 10), date(2025, 3, 17)
+    expected = sum(start <= t.date() <= end for t in stamps)
+    with Session(engine) as db:
+        for res in series_rollup.RESOLUTIONS:
+            got, points = series_rollup.series(db, start, end, res)
+            assert got == res
+            assert sum(p["total"] for p in points) == expected
+            assert sum(p["bagus"] + p["rusak"] for p in points) == expected
+        res, points = series_rollup.series(db, start, end)
+        assert res == "w" and len(points) == 63  # 62 whole weeks plus partial edges
+        _, one = series_rollup.series(db, start, end, "m", lokasi_ids=[2])
+        assert sum(p["total"] for p in one) == sum(start <= t.date() <= end for i, t in enumerate(stamps) if i % 2)
+
+
+def test_week_and_month_tiers_on_a_range_shorter_than_one_period(tmp_path):
+    engine = _engine(tmp_path)
+    with engine.begin() as conn:
+        for day in range(1, 8):
+            header = dict(ts_utc=f"2025-09-0{day}T03:00:00Z", user_id=1, lokasi_id=1, area_id=1,
+                          shift="Pagi", latitude=None, longitude=None)
+            inspeksi_store.write_checklist(conn, header, [{"item_id": 1, "status": "Rusak" if day % 2 else "Bagus"}])
+    start, end = date(2025, 9, 2), date(2025, 9, 5)
+    with Session(engine) as db:
+        for res in ("w", "m"):
+            got, points = series_rollup.series(db, start, end, res)
+            assert got == res
+            assert sum(p["total"] for p in points) == 4
+            assert sum(p["rusak"] for p in points) == 2
@@ -0,0 +1,20 @@
+import numpy as np
+
+from app import trends
+
+
+def test_analyze_flags_spike_and_matches_stepwise_ewma():
+    rng = np.random.default_rng(1)
+    total = rng.poisson(2.0, (50, 60)).astype(np.int32)
+    rusak = rng.binomial(total, 0.05).astype(np.int32)
+    total[3, :] = 0  # never checked
+    rusak[3, :] = 0
+    total[7, -trends.WINDOW:] = 4  # item 7 turns Rusak in the latest week
+    rusak[7, -trends.WINDOW:] = 3
+    rusak[7, :-trends.WINDOW] = 0
+
+    a = trends.analyze(total, rusak)
+    assert a["spike"][7] and a["spike"].sum() <= 2
+    assert a["rate"][7] == 0.75 and a["wow_delta"][7] == 0.75
+    assert np.isnan(a["rate"][3]) and not a["spike"][3] and np.isnan(a["ewma"][3])
+    np.testing.assert_allclose(a["ewma"], trends.ewma(total, rusak)[:, -1], rtol=1e-5)